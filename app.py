@@ -1,7 +1,6 @@
 import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
-from datetime import datetime
 import importlib
 # 🚨 關鍵：把它搬到這裡！緊接在 import 套件的下方！
 st.set_page_config(
@@ -13,7 +12,8 @@ st.set_page_config(
 
 # ✅ 設定完網頁後，才能載入你自己寫的這些模組
 import config
-from data_engine import get_data
+from data_engine import get_data, get_latest, get_history
+from data_engine.timeseries import TimeSeries, RANGE_OPTIONS
 import notes 
 import data_engine.rates as rates_engine
 
@@ -108,7 +108,8 @@ def render_category_list():
     for item in cat["items"]:
         ticker = item["ticker"]
         # 【修改點】加入 item.get("module") 讓系統知道要去哪個資料夾找資料
-        row_data = get_data(cat_id, item.get("module"), ticker)
+        # ⚡ 只讀最新值索引 (data/summary.json)，過期或沒有才即時計算
+        row_data = get_latest(cat_id, item.get("module"), ticker)
         
         # (修改後的樣子)
         if row_data is None:
@@ -141,8 +142,14 @@ def render_detail():
     row_data = get_data(cat_id, item.get("module"), item["ticker"]) if cat_id else None
     
     if row_data:
-        st.caption(f"最新: {row_data['value']:.2f}  |  漲跌幅: {row_data['change_pct']:+.2f}%")
-        df = row_data["history"]
+        if "change_bp" in row_data:
+            # 利差類指標會穿越 0，百分比沒有意義，改顯示基點變動
+            st.caption(f"最新: {row_data['value']:.2f}  |  變動: {row_data['change_bp']:+.0f} bp")
+        else:
+            st.caption(f"最新: {row_data['value']:.2f}  |  漲跌幅: {row_data['change_pct']:+.2f}%")
+        # 延遲載入的歷史 (LazyResult) 只讀畫圖需要的欄位
+        df = get_history(cat_id, item, row_data)
+        if df is None: df = pd.DataFrame()
     else:
         st.caption("無法取得數據")
         df = pd.DataFrame()
@@ -152,26 +159,16 @@ def render_detail():
     # 【超級核心修改】將時間區間選擇器獨立出來，讓所有圖表共用！
     # =========================================================
     if not df.empty and "date" in df.columns:
-        df = df.copy()
-        df["date"] = pd.to_datetime(df["date"])
+        # 排序好的日期陣列 + 原本的資料 (同一份歷史只建一次，切區間是二分搜尋 + 切片，不複製資料)
+        ts = TimeSeries.of(df)
 
         # 區間選擇器 (不再限定只有 rates 才能用)
         col_range, _ = st.columns([3, 1])
         with col_range:
-            range_option = st.radio("期間", ["All", "6m", "YTD", "1Y", "3Y", "5Y", "10Y"], horizontal=True, key=f"range_{item['id']}")
-
-        # 計算過濾區間
-        end = df["date"].max()
-        if range_option == "All": start = df["date"].min()
-        elif range_option == "6m": start = end - pd.DateOffset(months=6)
-        elif range_option == "YTD": start = datetime(end.year, 1, 1)
-        elif range_option == "1Y": start = end - pd.DateOffset(years=1)
-        elif range_option == "3Y": start = end - pd.DateOffset(years=3)
-        elif range_option == "5Y": start = end - pd.DateOffset(years=5)
-        else: start = end - pd.DateOffset(years=10) # 10Y
+            range_option = st.radio("期間", RANGE_OPTIONS, horizontal=True, key=f"range_{item['id']}")
 
         # 準備好切過的資料
-        df_filtered = df[(df["date"] >= start) & (df["date"] <= end)]
+        df_filtered = ts.last(range_option).frame
 
         # 【魔法發生的地方】動態呼叫畫圖引擎
         try:
@@ -0,0 +1,4 @@
+"""
+benchmarks/
+流水線計算核心的基準測試 (python -m benchmarks.run)，基準結果存在 benchmarks/baseline.json
+"""
@@ -0,0 +1,75 @@
+"""
+benchmarks/kernels.py
+被量測的計算核心：每個函式接收一個 panel，做完準備工作後回傳「只包含計算本身」的 callable，計時只算這個 callable
+panel = {"close" / "high" / "low": 日期 × 股票 的 float32 DataFrame, "tickers": 檔數, "years": 年數}
+回傳 (callable, 處理的單位數, 單位名稱)，吞吐量 = 單位數 / 秒
+"""
+import numpy as np
+import pandas as pd
+
+SURVEY_REVISED_WEEKS = 8  # 模擬每週更新：最後幾週重新公布 (其中兩週數值被修正)
+
+
+def _cells(panel):
+    return panel["close"].shape[0] * panel["close"].shape[1]
+
+
+def breadth(panel):
+    """市場寬度：整段 panel 一次算完所有指標 (全量重建的路徑)"""
+    from data_pipeline.market import breadth as module
+    close = panel["close"]
+    return (lambda: module._compute_breadth(close)), _cells(panel), "cells"
+
+
+def strength(panel):
+    """板塊強弱 / 成分股掃描的逐檔指標迴圈 (第一檔當基準)"""
+    from data_engine.market import strength as module
+    close, high, low = panel["close"], panel["high"], panel["low"]
+    benchmark = close.columns[0]
+    return (lambda: module.universal_metrics(close, high, low, benchmark=benchmark)), _cells(panel), "cells"
+
+
+def world_sectors(panel):
+    """世界觀資產：波動率調整強弱分數 + ATR 信號掃描 + 策略分類"""
+    from data_engine.market import world_sectors as module
+    close = panel["close"]
+    structure = {"synthetic": {t: t for t in close.columns}}
+    names = structure["synthetic"]
+    ohlc = pd.concat({"Close": close, "High": panel["high"], "Low": panel["low"]}, axis=1)
+
+    def run():
+        module.vol_adjusted_scores(close, 20, structure)
+        calc_df = module.signal_metrics(ohlc, names)
+        if not calc_df.empty:
+            module.strategy_lists(calc_df)
+    return run, _cells(panel), "cells"
+
+
+def surveys(panel):
+    """NAAIM / AAII 的每週增量合併：upsert + 均線尾段重算 + S&P 500 收盤價對齊"""
+    from data_pipeline.market import surveys as module
+    close = panel["close"]
+    dates = pd.date_range(close.index[0], close.index[-1], freq="W-WED")
+    rng = np.random.default_rng(0)
+    full = pd.DataFrame({"Date": dates, "NAAIM": rng.uniform(0, 100, len(dates)).round(2)})
+    stored = full.iloc[:-SURVEY_REVISED_WEEKS // 2].copy()
+    stored["NAAIM_MA20"] = stored["NAAIM"].rolling(20).mean()
+    stored[module.PRICE_COL] = np.nan
+    fresh = full.tail(SURVEY_REVISED_WEEKS).copy()
+    fresh.iloc[:2, 1] += 1.0
+    sp500 = close.iloc[:, 0].astype("float64")
+    sp500.index.name = "Date"
+
+    def run():
+        merged, since = module.upsert(stored, fresh, ["NAAIM"])
+        merged = module.update_ma_tail(merged, "NAAIM", "NAAIM_MA20", since)
+        module.merge_prices(merged, module.price_mask(merged, since), sp500)
+    return run, len(dates), "rows"
+
+
+KERNELS = {
+    "breadth": breadth,
+    "strength": strength,
+    "world_sectors": world_sectors,
+    "surveys": surveys,
+}
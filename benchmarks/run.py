@@ -0,0 +1,159 @@
+"""
+benchmarks/run.py
+流水線計算核心的基準測試：用 providers.synthetic 產生不同規模的股價 panel，量測每個核心的吞吐量與記憶體高水位
+
+用法 (在 repo 根目錄)：
+    python -m benchmarks.run                  # 完整網格 (100 ~ 5,000 檔 × 1 ~ 30 年)
+    python -m benchmarks.run --quick          # 小網格，改程式時快速看一下
+    python -m benchmarks.run --check          # 和 baseline.json 比較，變慢 / 變胖超過門檻就回傳 1
+    python -m benchmarks.run --save           # 把這次的結果存成新的 baseline (換機器 / 確認過的優化之後)
+    python -m benchmarks.run --kernels breadth strength
+
+- 時間：每個核心跑到最多 REPEAT 次取最短 (不含產生 panel 的時間)
+- 記憶體：另外用 tracemalloc 再跑一次取高水位 (NumPy 的配置也會被追蹤)，不和計時同一次，避免拖慢計時
+- 基準結果跟機器有關：CI / 新機器第一次跑請先 --save
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from data_pipeline.providers.synthetic import SyntheticProvider
+from benchmarks.kernels import KERNELS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+PANEL_END = "2025-12-31"  # 固定最後一天，每次產生的 panel 都一樣
+DOWNLOAD_CHUNK = 250
+REPEAT = 3
+REPEAT_BUDGET = 5.0       # 第一次就超過這麼多秒的核心不再重複
+TOLERANCE = 1.5           # 比 baseline 慢 (或記憶體多) 超過 1.5 倍算退步
+
+# (檔數, 年數)：固定 5 年看檔數的擴展，固定 500 檔看年數的擴展，最後是 5,000 檔 × 30 年的滿載
+FULL_SIZES = [(100, 5), (500, 5), (1000, 5), (5000, 5), (500, 1), (500, 10), (500, 30), (5000, 30)]
+QUICK_SIZES = [(100, 1), (500, 5)]
+
+
+def make_panel(n_tickers, years):
+    provider = SyntheticProvider(n_tickers=n_tickers, years=years, end=PANEL_END)
+    tickers = provider.universe()
+    fields = {"close": [], "high": [], "low": []}
+    for i in range(0, len(tickers), DOWNLOAD_CHUNK):
+        raw = provider.download(tickers[i:i + DOWNLOAD_CHUNK], start=provider.start)
+        for name, field in (("close", "Adj Close"), ("high", "High"), ("low", "Low")):
+            fields[name].append(raw[field].astype("float32"))
+    panel = {name: pd.concat(frames, axis=1) for name, frames in fields.items()}
+    panel.update(tickers=n_tickers, years=years)
+    return panel
+
+
+def measure(fn):
+    """回傳 (最短秒數, 高水位 MB)"""
+    best = None
+    for _ in range(REPEAT):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+        if elapsed > REPEAT_BUDGET:
+            break
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 1024 / 1024
+
+
+def run(sizes, kernels):
+    results = []
+    for n_tickers, years in sizes:
+        t0 = time.perf_counter()
+        panel = make_panel(n_tickers, years)
+        rows = len(panel["close"])
+        print(f"📦 panel {n_tickers} 檔 × {years} 年 ({rows} 天)，產生耗時 {time.perf_counter() - t0:.1f}s")
+        for name in kernels:
+            try:
+                fn, units, unit = KERNELS[name](panel)
+            except ImportError as e:
+                print(f"   ⚠️ {name:<14} 略過 (缺少套件: {e})")
+                continue
+            seconds, peak_mb = measure(fn)
+            result = {"kernel": name, "tickers": n_tickers, "years": years, "rows": rows,
+                      "seconds": round(seconds, 4), "throughput": round(units / seconds, 1) if seconds > 0 else None,
+                      "unit": unit, "peak_mb": round(peak_mb, 1)}
+            results.append(result)
+            print(f"   ⏱️ {name:<14} {seconds:8.3f}s  {result['throughput'] or 0:>14,.0f} {unit}/s  peak {peak_mb:8.1f} MB")
+        del panel
+        gc.collect()
+    return results
+
+
+def _key(r):
+    return (r["kernel"], r["tickers"], r["years"])
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """和 baseline 比較，回傳退步清單 (時間或記憶體超過 tolerance 倍)"""
+    base = {_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"📐 與 baseline ({baseline.get('generated_at', '?')}, {baseline.get('machine', {}).get('platform', '?')}) 比較：")
+    for r in results:
+        b = base.get(_key(r))
+        if b is None:
+            print(f"   ➕ {r['kernel']:<14} {r['tickers']:>5} 檔 × {r['years']:>2} 年：baseline 沒有這一格")
+            continue
+        time_ratio = r["seconds"] / b["seconds"] if b["seconds"] else 1.0
+        mem_ratio = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] else 1.0
+        slow = time_ratio > tolerance or mem_ratio > tolerance
+        mark = "❌" if slow else "✅"
+        print(f"   {mark} {r['kernel']:<14} {r['tickers']:>5} 檔 × {r['years']:>2} 年：時間 ×{time_ratio:.2f}  記憶體 ×{mem_ratio:.2f}")
+        if slow:
+            regressions.append(r)
+    return regressions
+
+
+def machine_info():
+    return {"platform": platform.platform(), "python": platform.python_version(), "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(), "numpy": np.__version__, "pandas": pd.__version__}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BamHI 計算核心基準測試")
+    parser.add_argument("--quick", action="store_true", help="只跑小網格")
+    parser.add_argument("--kernels", nargs="+", choices=sorted(KERNELS), default=list(KERNELS), help="只跑指定的核心")
+    parser.add_argument("--check", action="store_true", help="與 baseline.json 比較，有退步就回傳 1")
+    parser.add_argument("--save", action="store_true", help="把結果存成新的 baseline.json")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="容許的退步倍數")
+    args = parser.parse_args(argv)
+
+    results = run(QUICK_SIZES if args.quick else FULL_SIZES, args.kernels)
+
+    if args.save:
+        report = {"generated_at": time.strftime("%Y-%m-%d %H:%M:%S"), "machine": machine_info(), "results": results}
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"💾 baseline 已存到 {BASELINE_PATH}")
+
+    if args.check:
+        if not os.path.exists(BASELINE_PATH):
+            print("⚠️ 找不到 baseline.json，請先用 --save 建立")
+            return 1
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} 個核心退步超過 {args.tolerance} 倍")
+            return 1
+        print("✅ 沒有退步")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
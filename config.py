@@ -7,6 +7,8 @@ INDICATORS = {
             {"id": "DGS10", "name": "10 Years Yield", "ticker": "DGS10", "module": "treasury"},
             {"id": "DGS2", "name": "2 Years Yield", "ticker": "DGS2", "module": "treasury"},
             {"id": "SPREAD_10_2", "name": "10-2 Spread", "ticker": "SPREAD_10_2", "module": "treasury"},
+            {"id": "SPREAD_10Y_3M", "name": "10Y-3M Spread", "ticker": "10Y-3M", "module": "treasury"},
+            {"id": "FLY_2S10S30S", "name": "2s10s30s Butterfly", "ticker": "2s10s30s", "module": "treasury"},
         ],
     },
     "market": {
@@ -1,28 +1,108 @@
 """
 data_engine 動態路由器 + 通用 CSV 讀取器
+(流水線有寫出同名的 .feather 欄式檔、而且和 CSV 對得上時優先讀它：日期 / 數值已經是原生型別，不用解析文字)
+(讀過的資料集放在 data_engine.cache 的行程共用快取，檔案更新前不會重讀)
 """
 import importlib
+import json
 import pandas as pd
 import os
 import streamlit as st
+from data_pipeline import columnar
+from data_engine.cache import datasets
+from data_pipeline import summary
+from data_pipeline import latest
+from data_pipeline import digest
+from data_engine.lazy import LazyResult
+
+def _read_dataset(path, columns=None):
+    df = columnar.read(path, columns)
+    if df is not None:
+        return df
+
+    try:
+        df = pd.read_csv(path, usecols=None if columns is None else (lambda c: c in columns))
+        # 自動把 date 欄位轉成時間格式，畫圖才不會錯
+        if "date" in df.columns:
+            df["date"] = pd.to_datetime(df["date"])
+        return df
+    except Exception as e:
+        print(f"讀取 CSV 失敗: {e}")
+        return None
 
 # 🔥 [新增功能] 通用讀取器：負責去 data 資料夾拿便當
-def load_csv(filename):
+def load_csv(filename, columns=None):
+    """
+    讀取 data/<filename> (有對得上的 .feather 就讀它)。結果放在行程共用的資料集快取裡，
+    檔案沒更新前所有 session / rerun 都拿同一份：回傳的 DataFrame 不可就地修改
+    columns 只讀需要的欄位 (整份已經在快取裡就直接從它挑，不用再讀檔)
+    """
     path = f"data/{filename}"
     
     # 如果找不到檔案（便當還沒做），就回傳 None
     if not os.path.exists(path):
         return None
-        
+
+    deps = (columnar.binary_path(path),)
+    if columns is not None:
+        columns = tuple(columns)
+        full = datasets.peek(path, deps)
+        if full is not None:
+            loader = lambda: full[[c for c in full.columns if c in columns]]
+        else:
+            loader = lambda: _read_dataset(path, columns)
+        # 挑好的欄位也放進快取：同一個圖每次 rerun 拿到同一個 DataFrame 物件
+        return datasets.get(path, loader, deps=deps, variant=columns)
+    return datasets.get(path, lambda: _read_dataset(path), deps=deps)
+
+def _read_summary(path):
     try:
-        df = pd.read_csv(path)
-        # 自動把 date 欄位轉成時間格式，畫圖才不會錯
-        if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"])
-        return df
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
     except Exception as e:
-        print(f"讀取 CSV 失敗: {e}")
+        print(f"讀取 {path} 失敗: {e}")
         return None
+    return data if data.get("schema") == summary.SCHEMA else None
+
+def indexed_latest(category: str, module_name: str, ticker: str):
+    """最新值索引 (data/summary.json) 裡的 {"value", "change_pct", "as_of", "versions"}；沒有或已過期回傳 None"""
+    index = datasets.get(summary.SUMMARY_FILE, lambda: _read_summary(summary.SUMMARY_FILE)) if os.path.exists(summary.SUMMARY_FILE) else None
+    entry = (index or {}).get("entries", {}).get(summary.entry_key(category, module_name, ticker))
+    if entry is not None and summary.file_versions(entry["versions"], sha256=_cached_sha256) == entry["versions"]:
+        return entry
+    return None
+
+def _cached_sha256(path):
+    # 雜湊也放在共用資料集快取：檔案沒變 (mtime / 大小) 就不重算，變了才重讀一次內容
+    return datasets.get(path, lambda: digest.sha256(path), variant="sha256")
+
+# ⚡ 清單頁用：流水線寫好的最新值索引，不碰任何歷史檔
+def get_latest(category: str, module_name: str, ticker: str):
+    """
+    回傳 {"value", "change_pct", "as_of"}；索引沒有這個指標、或它讀的資料檔在索引之後又變過 (過期)，
+    就用和流水線相同的算法 (data_pipeline.latest) 即時計算，沒有對應算法的才退回 get_data
+    """
+    if not module_name: return None
+    entry = indexed_latest(category, module_name, ticker)
+    if entry is not None:
+        return entry
+    if latest.supports(category, module_name):
+        return latest.compute(category, module_name, ticker, load=load_csv)
+
+    row = get_data(category, module_name, ticker)
+    if row is None: return None
+    return {"value": row["value"], "change_pct": row["change_pct"], "as_of": row.get("as_of") or summary.history_as_of(row.get("history"))}
+
+# 詳細頁用：fetch_data 回傳 LazyResult 時只載入 plot_chart 需要的欄位 (引擎有 chart_columns(item) 的話)
+def get_history(category: str, item: dict, row):
+    if not isinstance(row, LazyResult):
+        return row["history"]
+    try:
+        mod = importlib.import_module(f"data_engine.{category}.{item.get('module')}")
+    except Exception:
+        mod = None
+    chart_columns = getattr(mod, "chart_columns", None)
+    return row.history(chart_columns(item) if chart_columns else None)
 
 # (原本的路由器邏輯，保持不變)
 def get_data(category: str, module_name: str, ticker: str):
@@ -0,0 +1,110 @@
+"""
+data_engine/cache.py
+整個 Streamlit 行程共用的資料集快取 (所有使用者 session、每次 rerun 都共用同一份)
+- 以 (路徑, mtime, 檔案大小) 判斷是否有效：流水線更新檔案後自動失效，每份資料每次更新只解析一次
+- 記憶體預算：環境變數 BAMHI_DATASET_CACHE_MB (預設 256，設 0 關閉快取)，超過就淘汰最久沒用到的 (LRU)
+- 回傳的物件是共用的同一份：呼叫端不可就地修改 (要改請先 .copy())
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+BUDGET_ENV = "BAMHI_DATASET_CACHE_MB"
+DEFAULT_BUDGET_MB = 256
+
+
+def _stamp(paths):
+    """每個檔案的 (mtime, 大小)；不存在的檔案記成 None"""
+    stamp = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class DatasetCache:
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # (path, variant) -> (stamp, value, size)，越後面越近期用過
+        self._lock = threading.Lock()
+
+    def peek(self, path, deps=(), variant=None):
+        """已經在快取裡而且沒過期就回傳，否則回傳 None (不會觸發讀檔)"""
+        stamp = _stamp((path,) + tuple(deps))
+        with self._lock:
+            item = self._items.get((path, variant))
+            if item is None or item[0] != stamp:
+                return None
+            self._items.move_to_end((path, variant))
+            self.hits += 1
+            return item[1]
+
+    def get(self, path, loader, deps=(), variant=None):
+        """
+        回傳 path 的解析結果；檔案 (以及 deps 裡的相關檔案) 沒變就直接用快取，否則呼叫 loader() 重新解析。
+        variant 區分同一個檔案的不同讀法 (例如只讀部分欄位)。loader 回傳 None (檔案不存在 / 解析失敗) 不會被快取
+        """
+        key = (path, variant)
+        stamp = _stamp((path,) + tuple(deps))
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == stamp:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+
+        value = loader()  # 解析在鎖外面做，不同檔案可以同時讀
+        size = _sizeof(value) if value is not None else 0
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.used -= old[2]
+            if value is not None and size <= self.budget:
+                self._items[key] = (stamp, value, size)
+                self.used += size
+                while self.used > self.budget:
+                    _, (_, _, evicted) = self._items.popitem(last=False)
+                    self.used -= evicted
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.used = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "used_mb": round(self.used / 1024 / 1024, 1),
+                    "budget_mb": round(self.budget / 1024 / 1024, 1), "hits": self.hits, "misses": self.misses}
+
+
+def _budget_from_env():
+    try:
+        return int(float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_MB)) * 1024 * 1024)
+    except ValueError:
+        return DEFAULT_BUDGET_MB * 1024 * 1024
+
+
+datasets = DatasetCache(_budget_from_env())
@@ -1,8 +1,8 @@
 """股市數據：指數等"""
 import streamlit as st
-import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
+from data_pipeline import providers
 
 
 @st.cache_data(ttl=3600)
@@ -14,8 +14,7 @@ def fetch_data(ticker: str):
     try:
         end = datetime.now()
         start = end - timedelta(days=365)
-        obj = yf.Ticker(ticker)
-        df = obj.history(start=start, end=end, auto_adjust=True)
+        df = providers.current().history(ticker, start=start, end=end)
         if df is None or df.empty or len(df) < 2:
             return None
         close = df["Close"]
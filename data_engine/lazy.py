@@ -0,0 +1,45 @@
+"""
+data_engine/lazy.py
+fetch_data 的延遲版回傳值：用起來和原本的 {"value", "change_pct", "history"} dict 一樣，
+但 history 第一次被取用時才載入 (清單頁 / 標題列只看 value、change_pct，根本用不到整段歷史)
+- LazyResult(load_history, value=..., change_pct=..., ...)：純量欄位直接給 (通常來自 data/summary.json)
+- load_history(columns) 回傳 DataFrame；columns=None 是全部欄位
+- result.history(["date", "DGS10"]) 只載入畫圖需要的欄位；整份已經載入過就直接從它挑
+"""
+from collections.abc import Mapping
+
+
+class LazyResult(Mapping):
+    def __init__(self, load_history, **fields):
+        self._load_history = load_history
+        self._fields = fields
+        self._history = None
+
+    def history(self, columns=None):
+        if self._history is not None:
+            if columns is None:
+                return self._history
+            return self._history[[c for c in self._history.columns if c in columns]]
+        if columns is not None:
+            return self._load_history(list(columns))
+        self._history = self._load_history(None)
+        return self._history
+
+    @property
+    def loaded(self):
+        return self._history is not None
+
+    def __getitem__(self, key):
+        if key == "history":
+            return self.history()
+        return self._fields[key]
+
+    def __iter__(self):
+        yield from self._fields
+        yield "history"
+
+    def __len__(self):
+        return len(self._fields) + 1
+
+    def __repr__(self):
+        return f"LazyResult({self._fields!r}, history={'loaded' if self.loaded else 'pending'})"
@@ -3,13 +3,30 @@
 data_engine/market/breadth.py
 (極速版) 讀取 data/breadth.csv
 """
+import streamlit as st
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
 from datetime import datetime
-from data_engine import load_csv # 👈 引用工具
+from data_engine import load_csv, indexed_latest # 👈 引用工具
+from data_engine.lazy import LazyResult
+
+# 流水線同一次掃描就算好的額外寬度指標 (欄位不存在就不顯示開關)
+# "overlay" 畫在主圖右軸 (百分比)，"panel" 另開一個子圖
+EXTRA_INDICATORS = {
+    "breadth_20": {"name": "% > 20MA", "kind": "overlay", "color": "#9b59b6"},
+    "ad_line": {"name": "騰落線 (A/D Line)", "kind": "panel", "color": "#3498db"},
+    "nh_nl": {"name": "52 週新高 - 新低", "kind": "panel", "color": "#f1c40f"},
+    "mcclellan": {"name": "McClellan 震盪指標", "kind": "panel", "color": "#e74c3c"},
+}
 
 def fetch_data(ticker: str):
+    # 0. 索引 (data/summary.json) 還新鮮的話，最新值直接用它，breadth.csv 等到要畫圖才讀
+    latest = indexed_latest("market", "breadth", ticker)
+    if latest is not None:
+        return LazyResult(lambda columns: load_csv("breadth.csv", columns=columns),
+                          value=latest["value"], change_pct=latest["change_pct"], as_of=latest["as_of"])
+
     # 1. 秒讀 CSV
     history = load_csv("breadth.csv")
     if history is None: return None
@@ -25,9 +42,22 @@ def fetch_data(ticker: str):
 def plot_chart(df_filtered, item):
     """
     負責繪製市場寬度雙軸圖 (套用深色主題)
+    額外指標 (A/D Line、新高新低、McClellan、% > 20MA) 已經在 CSV 裡，勾選就畫，不需要再讀任何資料
     """
-    # 建立雙 Y 軸
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    available = [c for c in EXTRA_INDICATORS if c in df_filtered.columns]
+    selected = st.multiselect(
+        "➕ 疊加寬度指標", options=available, default=[],
+        format_func=lambda c: EXTRA_INDICATORS[c]["name"], key=f"breadth_extra_{item.get('id')}"
+    ) if available else []
+    panels = [c for c in selected if EXTRA_INDICATORS[c]["kind"] == "panel"]
+
+    # 建立雙 Y 軸 (主圖) + 每個勾選的子圖指標一列
+    n_rows = 1 + len(panels)
+    fig = make_subplots(
+        rows=n_rows, cols=1, shared_xaxes=True, vertical_spacing=0.04,
+        row_heights=[0.6] + [0.4 / len(panels)] * len(panels) if panels else None,
+        specs=[[{"secondary_y": True}]] + [[{}] for _ in panels]
+    )
 
     # --- Layer 1: S&P 500 (左軸，對數座標) ---
     fig.add_trace(
@@ -37,7 +67,7 @@ def plot_chart(df_filtered, item):
             line=dict(color='#ffffff', width=2), # 深色模式改用白色線條
             hovertemplate="Price: %{y:,.0f}<extra></extra>"
         ),
-        secondary_y=False 
+        row=1, col=1, secondary_y=False 
     )
 
     # --- Layer 2: 長期寬度 200MA (右軸) ---
@@ -49,7 +79,7 @@ def plot_chart(df_filtered, item):
             opacity=0.7,
             hovertemplate="200MA: %{y:.1f}%<extra></extra>"
         ),
-        secondary_y=True
+        row=1, col=1, secondary_y=True
     )
 
     # --- Layer 3: 短期寬度 50MA (右軸) ---
@@ -61,9 +91,26 @@ def plot_chart(df_filtered, item):
             opacity=0.6,
             hovertemplate="50MA: %{y:.1f}%<extra></extra>"
         ),
-        secondary_y=True
+        row=1, col=1, secondary_y=True
     )
 
+    # --- 額外指標 ---
+    for col in selected:
+        spec = EXTRA_INDICATORS[col]
+        trace = go.Scatter(
+            x=df_filtered["date"], y=df_filtered[col], name=spec["name"],
+            line=dict(color=spec["color"], width=1.2),
+            hovertemplate=f"{spec['name']}: %{{y:,.1f}}<extra></extra>"
+        )
+        if spec["kind"] == "overlay":
+            fig.add_trace(trace, row=1, col=1, secondary_y=True)
+        else:
+            row = 2 + panels.index(col)
+            fig.add_trace(trace, row=row, col=1)
+            fig.update_yaxes(title_text=spec["name"], showgrid=True, gridcolor='#30363d', row=row, col=1)
+            if col != "ad_line":
+                fig.add_hline(y=0, line=dict(color="gray", width=1, dash="dash"), opacity=0.5, row=row, col=1)
+
     # --- 灰色衰退區間 ---
     recessions = [
         (datetime(2007, 12, 1), datetime(2009, 6, 30)), 
@@ -98,14 +145,14 @@ def plot_chart(df_filtered, item):
         hovermode="x unified",
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
         margin=dict(l=40, r=40, t=40, b=40),
-        height=500
+        height=500 + 180 * len(panels)
     )
 
     # --- 軸設定 ---
     fig.update_yaxes(
         title_text="S&P 500 (Log Scale)", 
         type="log", 
-        secondary_y=False,
+        row=1, col=1, secondary_y=False,
         showgrid=True, gridcolor='#30363d',
         range=[log_min - 0.05, log_max + 0.05] 
     )
@@ -113,7 +160,7 @@ def plot_chart(df_filtered, item):
     fig.update_yaxes(
         title_text="Stocks Above MA (%)", 
         range=[0, 100], 
-        secondary_y=True,
+        row=1, col=1, secondary_y=True,
         showgrid=False
     )
     
@@ -4,16 +4,16 @@ data_engine/market/naaim.py
 (套用終極穩定版 Shapes 寫法畫出灰色衰退帶 + 標普500 對數座標)
 """
 import pandas as pd
-import os
 import streamlit as st
+from data_engine import load_csv
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import yfinance as yf
+from data_pipeline import providers
 
 @st.cache_data(ttl=3600)
 def get_daily_sp500():
     try:
-        sp = yf.download("^GSPC", period="max", progress=False, auto_adjust=False)
+        sp = providers.current().download("^GSPC", period="max", auto_adjust=False)
         if isinstance(sp, pd.DataFrame) and 'Close' in sp.columns:
             sp = sp['Close']
         if isinstance(sp, pd.DataFrame):
@@ -27,11 +27,10 @@ def get_daily_sp500():
         return pd.DataFrame(columns=['date', 'SP500_Daily'])
 
 def fetch_data(ticker: str):
-    naaim_path = "data/naaim.csv"
-    aaii_path = "data/sentiment.csv"
-    
-    df_naaim = pd.read_csv(naaim_path) if os.path.exists(naaim_path) else pd.DataFrame()
-    df_aaii = pd.read_csv(aaii_path) if os.path.exists(aaii_path) else pd.DataFrame()
+    df_naaim = load_csv("naaim.csv")
+    df_aaii = load_csv("sentiment.csv")
+    if df_naaim is None: df_naaim = pd.DataFrame()
+    if df_aaii is None: df_aaii = pd.DataFrame()
     
     if df_naaim.empty and df_aaii.empty:
         return None
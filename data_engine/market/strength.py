@@ -8,10 +8,10 @@ import plotly.colors as pc
 import plotly.express as px
 import pandas as pd
 import numpy as np
-import yfinance as yf
 import json
 import os
 from data_engine import load_csv
+from data_pipeline import providers
 
 BENCHMARK = "VTI"
 
@@ -76,7 +76,6 @@ GROUP_MAPPING = {t: group_name for group_name, tickers in PORTFOLIO_STRUCTURE.it
 def fetch_data(ticker: str):
     df = load_csv("sector_strength.csv")
     if df is None or df.empty: return None
-    if "date" in df.columns: df["date"] = pd.to_datetime(df["date"])
     latest_price = float(df[BENCHMARK].iloc[-1]) if BENCHMARK in df.columns else 0.0
     return {"history": df, "value": latest_price, "change_pct": 0.0}
 
@@ -122,6 +121,10 @@ def get_etf_top_holdings(ticker: str):
 
 @st.cache_data(ttl=3600)
 def compute_universal_metrics(close_df, high_df=None, low_df=None, benchmark="VTI"):
+    return universal_metrics(close_df, high_df, low_df, benchmark)
+
+def universal_metrics(close_df, high_df=None, low_df=None, benchmark="VTI"):
+    """動能 / RS / RSI / ATR 指標與黃金條件 (純計算，不經過 Streamlit 快取，基準測試直接呼叫這個)"""
     if benchmark not in close_df.columns: return pd.DataFrame()
     bench_close = close_df[benchmark].dropna()
     
@@ -344,7 +347,7 @@ def plot_chart(df_history, item_name):
                 st.warning(f"⚠️ {selected_etf} 無法載入成分股，請確認 Pipeline 有成功抓取。")
             else:
                 with st.spinner(f"正在即時計算 {selected_etf} 成分股的動能指標..."):
-                    yf_df = yf.download(holdings + [BENCHMARK], period="1y", auto_adjust=False, progress=False)
+                    yf_df = providers.current().download(holdings + [BENCHMARK], period="1y", auto_adjust=False)
                     if not yf_df.empty and 'Close' in yf_df.columns:
                         close_df = yf_df['Close'] if isinstance(yf_df.columns, pd.MultiIndex) else yf_df
                         high_df = yf_df['High'] if isinstance(yf_df.columns, pd.MultiIndex) else None
@@ -3,11 +3,12 @@ data_engine/market/world_sectors.py
 讀取 world_sectors.csv，計算動能與波動率，並繪製熱力圖與排行榜
 """
 import pandas as pd
-import os
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+from data_pipeline import providers
+from data_engine import load_csv
 
 # 定義龜族世界觀 ETF 清單結構
 PORTFOLIO_STRUCTURE = {
@@ -73,8 +74,7 @@ def fetch_world_data_fallback():
         all_tickers.extend(group.keys())
     all_tickers = list(set(all_tickers))
     try:
-        import yfinance as yf
-        yf_df = yf.download(all_tickers, period="2y", auto_adjust=False, progress=False)['Close']
+        yf_df = providers.current().download(all_tickers, period="2y", auto_adjust=False)['Close']
         df = yf_df.reset_index()
         df = df.rename(columns={'Date': 'date'})
         if 'date' in df.columns:
@@ -85,10 +85,8 @@ def fetch_world_data_fallback():
         return pd.DataFrame()
 
 def fetch_data(ticker: str):
-    file_path = "data/world_sectors.csv"
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path, parse_dates=['date'])
-    else:
+    df = load_csv("world_sectors.csv")
+    if df is None:
         df = fetch_world_data_fallback()
         
     if df is None or df.empty:
@@ -101,49 +99,14 @@ def _color_surfer(val):
     color = '#00eb00' if val > 0 else '#ff2b2b' if val < 0 else 'grey'
     return f'color: {color}; font-weight: bold;'
 
-def plot_chart(df, item):
-    if df.empty:
-        return go.Figure()
-
-    df = df.set_index('date').ffill() # 處理可能的空值
-    
-    # --- 1. 介面控制：週期選擇器 ---
-    st.markdown("### ⚙️ 動能週期設定")
-    period_mapping = {
-        "1天 (1D)": 1, "3天 (3D)": 3, "1週 (5D)": 5, "2週 (10D)": 10,
-        "1個月 (20D)": 20, "2個月 (40D)": 40, "3個月 (60D)": 60, "半年 (120D)": 120
-    }
-    
-    selected_label = st.radio(
-        "觀察週期 (Lookback Period)", 
-        options=list(period_mapping.keys()), 
-        index=4, 
-        horizontal=True
-    )
-    lookback = period_mapping[selected_label]
-    st.caption(f"當前模式：{'🛡️ 波動率調整計分 (總報酬 ÷ 期間標準差)' if lookback >= 5 else '⚡ 純價格漲跌幅'}")
-    
-    # --- 2. 向量化計算所有資產數據 ---
-    all_data = []
-    
-    # 新增：計算進階信號所需指標 (使用 yfinance 抓取 OHLC 計算 ATR)
-    import yfinance as yf
-    
-    flat_tickers = []
-    ticker_to_name = {}
-    for group, dict_ in PORTFOLIO_STRUCTURE.items():
-        for t, name in dict_.items():
-            flat_tickers.append(t)
-            ticker_to_name[t] = name
-            
-    try:
-        yf_df = yf.download(flat_tickers, period="1y", auto_adjust=False, progress=False)
-    except Exception:
-        yf_df = pd.DataFrame()
-        
+def signal_metrics(yf_df, ticker_to_name):
+    """
+    多週期信號的原始指標 (純計算，不碰 Streamlit)：
+    yf_df = download() 的 OHLC (欄位, 代碼) 雙層欄位；回傳每檔一列，含 ma50 / 20D·10D·3D 漲跌 / ATR% / 20D 排名
+    """
     calc_data = []
     if not yf_df.empty and 'Close' in yf_df.columns:
-        for t in flat_tickers:
+        for t in ticker_to_name:
             if isinstance(yf_df.columns, pd.MultiIndex):
                 if t not in yf_df['Close'].columns: continue
                 close_s = yf_df['Close'][t].dropna()
@@ -153,17 +116,17 @@ def plot_chart(df, item):
                 close_s = yf_df['Close'].dropna()
                 high_s = yf_df['High'].dropna()
                 low_s = yf_df['Low'].dropna()
-                
+
             if len(close_s) < 50:
                 continue
-                
+
             close_s = close_s.sort_index()
             high_s = high_s.sort_index()
             low_s = low_s.sort_index()
 
             curr_price = float(close_s.iloc[-1])
             ma50 = float(close_s.rolling(window=50).mean().iloc[-1])
-            
+
             ret_20d = float((curr_price - close_s.iloc[-21]) / close_s.iloc[-21] * 100) if len(close_s) >= 21 else np.nan
             ret_10d = float((curr_price - close_s.iloc[-11]) / close_s.iloc[-11] * 100) if len(close_s) >= 11 else np.nan
             ret_3d = float((curr_price - close_s.iloc[-4]) / close_s.iloc[-4] * 100) if len(close_s) >= 4 else np.nan
@@ -188,46 +151,53 @@ def plot_chart(df, item):
                 "3D點火(%)": ret_3d,
                 "日常波動(ATR%)": atr_pct
             })
-            
+
     # 計算 20D PR 排名
-    if calc_data:
-        calc_df = pd.DataFrame(calc_data)
+    calc_df = pd.DataFrame(calc_data)
+    if not calc_df.empty:
         calc_df['20D排名(PR)'] = calc_df['20D漲跌(%)'].rank(pct=True) * 100
-        
-        strategy_a, strategy_b, strategy_c = [], [], []
-        
-        for _, row in calc_df.iterrows():
-            atr = row['日常波動(ATR%)']
-            cond_a = (row['最新價格'] > row['ma50']) and (row['20D排名(PR)'] >= 70) and (abs(row['10D漲跌(%)']) < 2.0 * atr) and (row['3D點火(%)'] > 1.5 * atr)
-            cond_b = (row['最新價格'] > row['ma50']) and (row['20D排名(PR)'] >= 70) and (row['10D漲跌(%)'] < -3.0 * atr) and (row['3D點火(%)'] > 1.0 * atr)
-            cond_c = (row['最新價格'] < row['ma50']) and (row['20D漲跌(%)'] < 0) and (row['3D點火(%)'] < 0)
-
-            if cond_a: strategy_a.append(row)
-            if cond_b: strategy_b.append(row)
-            if cond_c: strategy_c.append(row)
-                
-        strategy_a_df = pd.DataFrame(strategy_a)
-        strategy_b_df = pd.DataFrame(strategy_b)
-        strategy_c_df = pd.DataFrame(strategy_c)
-        
+    return calc_df
+
+def strategy_lists(calc_df):
+    """依 signal_metrics() 的指標分出策略 A (動態點火) / B (動態錯殺) / C (波段破壞)"""
+    strategy_a, strategy_b, strategy_c = [], [], []
+
+    for _, row in calc_df.iterrows():
+        atr = row['日常波動(ATR%)']
+        cond_a = (row['最新價格'] > row['ma50']) and (row['20D排名(PR)'] >= 70) and (abs(row['10D漲跌(%)']) < 2.0 * atr) and (row['3D點火(%)'] > 1.5 * atr)
+        cond_b = (row['最新價格'] > row['ma50']) and (row['20D排名(PR)'] >= 70) and (row['10D漲跌(%)'] < -3.0 * atr) and (row['3D點火(%)'] > 1.0 * atr)
+        cond_c = (row['最新價格'] < row['ma50']) and (row['20D漲跌(%)'] < 0) and (row['3D點火(%)'] < 0)
+
+        if cond_a: strategy_a.append(row)
+        if cond_b: strategy_b.append(row)
+        if cond_c: strategy_c.append(row)
+
+    return pd.DataFrame(strategy_a), pd.DataFrame(strategy_b), pd.DataFrame(strategy_c)
+
+def vol_adjusted_scores(df, lookback, structure=PORTFOLIO_STRUCTURE):
+    """
+    熱力圖用的強弱分數 (純計算，不碰 Streamlit)：df = 以日期為 index 的收盤價 (每欄一檔)
+    lookback < 5：分數 = 漲跌幅 (%)；否則 = 期間報酬 ÷ 期間日報酬標準差 (波動率調整)
+    """
+    all_data = []
     if len(df) > lookback + 1:
         curr_prices = df.iloc[-1]
         prev_prices = df.iloc[-lookback-1]
         pct_changes = (curr_prices - prev_prices) / prev_prices
-        
+
         # 計算波動率 (只取過去 lookback 天的日報酬率算標準差)
         if lookback >= 5:
             daily_returns = df.pct_change().tail(lookback)
             period_vols = daily_returns.std()
-        
+
         # 組裝數據
-        for group, tickers in PORTFOLIO_STRUCTURE.items():
+        for group, tickers in structure.items():
             for t, name in tickers.items():
                 if t not in df.columns or pd.isna(curr_prices.get(t)):
                     continue
-                    
+
                 pct_chg = pct_changes[t]
-                
+
                 if lookback < 5:
                     score = pct_chg * 100
                     vol_val = 0
@@ -235,7 +205,7 @@ def plot_chart(df, item):
                     vol = period_vols[t]
                     score = (pct_chg / vol) if vol > 0 else 0
                     vol_val = vol * (252**0.5) * 100 # 顯示用年化波動率
-                
+
                 all_data.append({
                     "代號": t,
                     "名稱": name,
@@ -246,7 +216,43 @@ def plot_chart(df, item):
                     "強弱分數": score
                 })
 
-    result_df = pd.DataFrame(all_data)
+    return pd.DataFrame(all_data)
+
+def plot_chart(df, item):
+    if df.empty:
+        return go.Figure()
+
+    df = df.set_index('date').ffill() # 處理可能的空值
+    
+    # --- 1. 介面控制：週期選擇器 ---
+    st.markdown("### ⚙️ 動能週期設定")
+    period_mapping = {
+        "1天 (1D)": 1, "3天 (3D)": 3, "1週 (5D)": 5, "2週 (10D)": 10,
+        "1個月 (20D)": 20, "2個月 (40D)": 40, "3個月 (60D)": 60, "半年 (120D)": 120
+    }
+    
+    selected_label = st.radio(
+        "觀察週期 (Lookback Period)", 
+        options=list(period_mapping.keys()), 
+        index=4, 
+        horizontal=True
+    )
+    lookback = period_mapping[selected_label]
+    st.caption(f"當前模式：{'🛡️ 波動率調整計分 (總報酬 ÷ 期間標準差)' if lookback >= 5 else '⚡ 純價格漲跌幅'}")
+    
+    # --- 2. 向量化計算所有資產數據 ---
+    # 計算進階信號所需指標 (透過 provider 抓取 OHLC 計算 ATR)
+    ticker_to_name = {t: name for dict_ in PORTFOLIO_STRUCTURE.values() for t, name in dict_.items()}
+    try:
+        yf_df = providers.current().download(list(ticker_to_name), period="1y", auto_adjust=False)
+    except Exception:
+        yf_df = pd.DataFrame()
+
+    calc_df = signal_metrics(yf_df, ticker_to_name)
+    if not calc_df.empty:
+        strategy_a_df, strategy_b_df, strategy_c_df = strategy_lists(calc_df)
+
+    result_df = vol_adjusted_scores(df, lookback)
     
     if result_df.empty:
         st.warning("數據量不足以計算，請確認資料是否更新。")
@@ -302,7 +308,7 @@ def plot_chart(df, item):
     st.markdown("---")
     st.subheader("🎯 多週期量化信號掃描")
     
-    if calc_data:
+    if not calc_df.empty:
         display_cols = ['代號', '名稱', '最新價格', '日常波動(ATR%)', '20D排名(PR)', '10D漲跌(%)', '3D點火(%)']
         
         def render_strategy(df_strat):
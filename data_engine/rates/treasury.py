@@ -1,35 +1,109 @@
 """利率數據：10Y、2Y、10-2 Spread（FRED）與專屬繪圖邏輯"""
 """
 data_engine/rates/treasury.py
-(極速版) 讀取 data/rates.csv
+(極速版) 讀取 data/rates.csv 與整條殖利率曲線 data/treasury_curve.npz
+- DGS10 / DGS2 / SPREAD_10_2 照舊讀 rates.csv
+- 其他 ticker 當成曲線表達式，需要時才向量化計算並記住結果 (曲線檔更新就自動失效)：
+  "10Y" 單一天期、"10Y-3M" 利差、"2s10s" (= 10Y-2Y)、"2s10s30s" 蝶式 (= 2×10Y - 2Y - 30Y)
 """
 import plotly.graph_objects as go
 from datetime import datetime
 import pandas as pd
-from data_engine import load_csv  # 👈 引用我們剛寫好的工具
+import numpy as np
+import os
+from data_engine import load_csv, indexed_latest  # 👈 引用我們剛寫好的工具
+from data_engine.cache import datasets
+from data_engine.lazy import LazyResult
+from data_pipeline import latest as latest_values
+from data_pipeline.latest import parse_expression, curve_values, curve_latest
 
-# ❌ 舊的 @st.cache_data 拿掉，讀 CSV 不需要快取
-def fetch_data(ticker: str):
-    # 1. 秒讀 CSV
-    df = load_csv("rates.csv")
+CURVE_FILE = "data/treasury_curve.npz"
+RATES_FILE = "data/rates.csv"
+RATES_COLUMNS = ["date", "DGS10", "DGS2", "Spread"]
+SOURCE_COLUMN = latest_values.RATES_COLUMN  # rates.csv 的 ticker -> 欄位
+
+
+def _read_curve():
+    with np.load(CURVE_FILE) as f:
+        # {"dates", "tenors", "values", "series": {表達式: ndarray}}；檔案更新時整份換掉，其他執行緒手上的舊版本不受影響
+        return {"dates": pd.DatetimeIndex(f["dates"]), "tenors": [str(t) for t in f["tenors"]],
+                "values": f["values"], "series": {}}
+
+
+def load_curve():
+    """讀取曲線矩陣 (放在共用資料集快取，檔案更新才重讀)；沒有檔案回傳 None"""
+    if not os.path.exists(CURVE_FILE): return None
+    return datasets.get(CURVE_FILE, _read_curve)
+
+
+def curve_series(expr):
+    """計算 (並記住) 曲線表達式的時間序列，回傳 (dates, values)；天期不存在回傳 None"""
+    curve = load_curve()
+    combo = parse_expression(expr)
+    if curve is None or combo is None: return None
+    key = tuple(sorted(combo.items()))
+    if key not in curve["series"]:
+        values = curve_values(curve, combo)
+        if values is None: return None
+        curve["series"][key] = values
+    return curve["dates"], curve["series"][key]
+
+def _curve_history(ticker):
+    result = curve_series(ticker)
+    if result is None: return None
+    dates, values = result
+    ok = ~np.isnan(values)
+    if not ok.any(): return None
+    return pd.DataFrame({"date": dates[ok], "value": values[ok].astype(float)})
+
+def _fetch_curve_expression(ticker):
+    if not os.path.exists(CURVE_FILE): return None
+    # 整理好的歷史也放進共用快取 (曲線檔更新就失效)，詳細頁每次 rerun 拿到同一個 DataFrame
+    history = datasets.get(CURVE_FILE, lambda: _curve_history(ticker), variant=("history", ticker))
+    if history is None: return None
+
+    # 利差 / 蝶式會穿越 0，漲跌用基點 (change_bp) 表示
+    return {**curve_latest(history["date"].to_numpy(), history["value"].to_numpy()), "history": history}
+
+def _rates_history(ticker, columns=None):
+    """rates.csv 的歷史 (columns 只讀需要的欄位；"value" 是該 ticker 欄位的複本)，整理好的結果放進共用快取"""
+    variant = ("history", ticker, None if columns is None else tuple(columns))
+    return datasets.get(RATES_FILE, lambda: _build_rates_history(ticker, columns), variant=variant)
+
+def _build_rates_history(ticker, columns):
+    source = SOURCE_COLUMN[ticker]
+    keep = RATES_COLUMNS if columns is None else [c for c in RATES_COLUMNS if c in columns]
+    wants_value = columns is None or "value" in columns
+    df = load_csv("rates.csv", columns=sorted(set(keep) | ({source} if wants_value else set())))
     if df is None: return None
 
-    # 2. 根據 ticker 挑選數據
-    # CSV 裡的欄位是: date, DGS10, DGS2, Spread
-    if ticker == "DGS10": series = df["DGS10"]
-    elif ticker == "DGS2": series = df["DGS2"]
-    elif ticker == "SPREAD_10_2": series = df["Spread"]
-    else: return None
-
-    # 3. 準備回傳格式
-    history = df[["date", "DGS10", "DGS2", "Spread"]].copy()
-    history["value"] = series.values # 為了畫圖統一，複製一份叫 value
-    
-    current_val = float(series.iloc[-1])
-    # 簡單算一下漲跌 (跟第一筆比)
-    change = (current_val - float(series.iloc[0])) / float(series.iloc[0]) * 100.0
-
-    return {"value": current_val, "change_pct": change, "history": history}
+    history = df[[c for c in keep if c in df.columns]].copy()
+    if wants_value:
+        history["value"] = df[source].values # 為了畫圖統一，複製一份叫 value
+    return history
+
+def chart_columns(item):
+    """plot_chart 需要的欄位 (詳細頁只載入這些)"""
+    if item.get("id") == "SPREAD_10_2": return RATES_COLUMNS
+    if item.get("id") in ("DGS10", "DGS2"): return ["date", item["id"]]
+    return ["date", "value"]
+
+# rates.csv 由 load_csv 的共用資料集快取負責，DGS10 / DGS2 / SPREAD_10_2 共用同一份解析結果
+def fetch_data(ticker: str):
+    if ticker not in SOURCE_COLUMN:
+        return _fetch_curve_expression(ticker)
+    if not os.path.exists(RATES_FILE): return None
+
+    # 1. 最新值優先用索引 (data/summary.json)，歷史等真的要畫圖才讀
+    latest = indexed_latest("rates", "treasury", ticker)
+    if latest is None:
+        # 和流水線寫索引用同一套算法 (data_pipeline.latest)，只是走共用資料集快取讀檔
+        latest = latest_values.compute("rates", "treasury", ticker, load=load_csv)
+        if latest is None: return None
+
+    # 2. 準備回傳格式 (用起來和 {"value", "change_pct", "history"} 一樣)
+    fields = {k: latest[k] for k in ("value", "change_pct", "change_bp", "as_of") if k in latest}
+    return LazyResult(lambda columns: _rates_history(ticker, columns), **fields)
 
 def plot_chart(df_filtered, item):
     """
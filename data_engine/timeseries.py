@@ -0,0 +1,122 @@
+"""
+data_engine/timeseries.py
+詳細頁共用的時間序列容器：排序好的 datetime64 日期陣列 + 原本的 DataFrame
+- window(start, end) 用 searchsorted 二分搜尋找上下界，回傳 iloc 連續切片 (view，不複製資料、不建布林遮罩)
+- last("6m" / "YTD" / "1Y" ...) 是 app.py 期間選擇器的換算，plot_chart 照樣收到 ts.frame (DataFrame)
+- TimeSeries.of(df) 依 DataFrame 物件記住排序好的日期陣列 (只記日期與排序位置，不持有 df 本身)：
+  共用快取裡同一份歷史，每次 rerun 不用重新排序 / 轉日期；df 被回收 (例如資料集快取 LRU 淘汰) 記錄就跟著移除
+"""
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+
+RANGE_OPTIONS = ["All", "6m", "YTD", "1Y", "3Y", "5Y", "10Y"]
+_OFFSETS = {"6m": pd.DateOffset(months=6), "1Y": pd.DateOffset(years=1), "3Y": pd.DateOffset(years=3),
+            "5Y": pd.DateOffset(years=5), "10Y": pd.DateOffset(years=10)}
+
+_memo = {}  # id(df) -> (weakref(df), date_col, dates, rows, converted)；不可以放任何會指回 df 的物件
+_memo_lock = threading.Lock()
+
+
+def _forget(key, ref):
+    with _memo_lock:
+        hit = _memo.get(key)
+        if hit is not None and hit[0] is ref:
+            del _memo[key]
+
+
+def _index(frame, date_col):
+    """
+    回傳 (排序好的 datetime64 日期陣列, 要取的列位置 or None, 日期欄是否經過轉換)
+    沒有日期的列畫不出來，去掉；沒排序的才排序 (流水線寫出的檔案本來就是依日期排好的)
+    """
+    dates = frame[date_col]
+    converted = False
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates, converted = pd.to_datetime(dates, errors="coerce"), True
+    if getattr(dates.dt, "tz", None) is not None:
+        dates, converted = dates.dt.tz_localize(None), True
+    values = dates.to_numpy()
+    rows = None
+    valid = ~np.isnat(values)
+    if not valid.all():
+        rows = np.flatnonzero(valid)
+        values = values[rows]
+    if len(values) > 1 and not (values[1:] >= values[:-1]).all():
+        order = np.argsort(values, kind="stable")
+        rows = order if rows is None else rows[order]
+        values = values[order]
+    return values, rows, converted
+
+
+class TimeSeries:
+    def __init__(self, frame, date_col="date", _dates=None):
+        if _dates is None:
+            return self._init_from(frame, date_col, *_index(frame, date_col))
+        self.frame = frame
+        self.date_col = date_col
+        self.dates = _dates
+
+    def _init_from(self, frame, date_col, dates, rows, converted):
+        if rows is not None:
+            frame = frame.iloc[rows]
+        if converted:
+            frame = frame.assign(**{date_col: dates})  # 新的 DataFrame，不動到共用快取
+        self.frame = frame
+        self.date_col = date_col
+        self.dates = dates
+
+    @classmethod
+    def of(cls, data, date_col="date"):
+        """DataFrame -> TimeSeries (同一個 DataFrame 物件的日期只整理一次)；本來就是 TimeSeries 直接回傳"""
+        if isinstance(data, TimeSeries):
+            return data
+        key = id(data)
+        with _memo_lock:
+            hit = _memo.get(key)
+        if hit is None or hit[0]() is not data or hit[1] != date_col:
+            dates, rows, converted = _index(data, date_col)
+            ref = weakref.ref(data, lambda ref, key=key: _forget(key, ref))
+            hit = (ref, date_col, dates, rows, converted)
+            with _memo_lock:
+                _memo[key] = hit
+        ts = cls.__new__(cls)
+        ts._init_from(data, date_col, *hit[2:])
+        return ts
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def empty(self):
+        return len(self.dates) == 0
+
+    @property
+    def start(self):
+        return pd.Timestamp(self.dates[0]) if len(self.dates) else None
+
+    @property
+    def end(self):
+        return pd.Timestamp(self.dates[-1]) if len(self.dates) else None
+
+    def column(self, name):
+        """欄位的 numpy 陣列 (數值欄是 view)"""
+        return self.frame[name].to_numpy()
+
+    def _position(self, when, side):
+        return int(np.searchsorted(self.dates, pd.Timestamp(when).to_datetime64().astype(self.dates.dtype), side=side))
+
+    def window(self, start=None, end=None):
+        """start <= 日期 <= end 的區間 (兩端都含)，回傳共用同一份資料的 TimeSeries"""
+        i = 0 if start is None else self._position(start, "left")
+        j = len(self.dates) if end is None else self._position(end, "right")
+        return TimeSeries(self.frame.iloc[i:j], self.date_col, _dates=self.dates[i:j])
+
+    def last(self, option):
+        """期間選擇器：All / 6m / YTD / 1Y / 3Y / 5Y / 10Y (都以最後一筆日期往回算)"""
+        if self.empty or option == "All":
+            return self
+        end = self.end
+        start = pd.Timestamp(end.year, 1, 1) if option == "YTD" else end - _OFFSETS.get(option, _OFFSETS["10Y"])
+        return self.window(start, end)
@@ -0,0 +1,108 @@
+"""
+data_pipeline/columnar.py
+輸出 CSV 的欄式二進位副本：每份 data/<name>.csv 旁邊多一份 data/<name>.feather (Arrow IPC)
+- 日期欄是原生 datetime64、數值欄是 float32，前端讀取不用再解析文字 / 轉日期
+- 檔案 metadata 記錄寫入當下 CSV 的內容雜湊 (sha256)：CSV 之後又被改過 (就算大小一樣) 就視為過期，讀取端退回 CSV
+  (不看 mtime：git checkout 後兩個檔案的 mtime 先後順序不固定)
+- pyarrow 是選用套件：沒裝的話 write() / append() 什麼都不做，read() 回傳 None，一切照舊走 CSV
+"""
+import os
+import pandas as pd
+from data_pipeline import metrics
+from data_pipeline import digest
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # 沒裝 pyarrow 就只寫 CSV
+    pa = None
+    feather = None
+
+DATE_COLUMNS = ("date", "Date")
+DIGEST_KEY = b"bamhi.csv_sha256"
+
+
+def binary_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".feather"
+
+
+def to_columnar(df):
+    """日期欄轉 datetime64、float64 轉 float32，index 重設成 0..n-1 (Feather 的要求)"""
+    df = df.reset_index(drop=True)
+    out = {}
+    for c in df.columns:
+        col = df[c]
+        if c in DATE_COLUMNS:
+            col = pd.to_datetime(col, errors="coerce")
+            if getattr(col.dt, "tz", None) is not None:
+                col = col.dt.tz_localize(None)
+        elif pd.api.types.is_float_dtype(col):
+            col = col.astype("float32")
+        elif col.dtype == object:
+            # 合併過程中變成 object 的數值欄 (全部都能轉成數字才轉，文字欄保持原樣)
+            numeric = pd.to_numeric(col, errors="coerce")
+            if numeric.notna().sum() == col.notna().sum():
+                col = numeric.astype("float32")
+        out[str(c)] = col
+    return pd.DataFrame(out)
+
+
+def write(df, csv_path):
+    """CSV 寫完之後呼叫：把同一份資料寫成 .feather (沒裝 pyarrow 就略過)"""
+    if pa is None or not os.path.exists(csv_path):
+        return None
+    path = binary_path(csv_path)
+    table = pa.Table.from_pandas(to_columnar(df), preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), DIGEST_KEY: digest.sha256(csv_path).encode()})
+    tmp_path = path + ".tmp"
+    feather.write_feather(table, tmp_path)
+    os.replace(tmp_path, path)
+    metrics.wrote(path)
+    return path
+
+
+def append(csv_path, new_rows, digest_before):
+    """
+    CSV 是用追加的方式更新時呼叫 (digest_before = 追加前 CSV 的 digest.sha256)：
+    舊的 .feather 還對得上追加前的 CSV 就直接接上新列，否則整份 CSV 重讀一次
+    """
+    if pa is None:
+        return None
+    old = _read_table(csv_path, expected_digest=digest_before)
+    if old is not None:
+        df = pd.concat([old.to_pandas(), to_columnar(new_rows)], ignore_index=True)
+    else:
+        df = pd.read_csv(csv_path)
+    return write(df, csv_path)
+
+
+def _read_table(csv_path, expected_digest=None):
+    path = binary_path(csv_path)
+    if feather is None or not os.path.exists(path):
+        return None
+    table = feather.read_table(path, memory_map=True)
+    recorded = (table.schema.metadata or {}).get(DIGEST_KEY)
+    if recorded is None:
+        return None  # 舊版只記大小的副本一律當過期
+    if expected_digest is None:
+        expected_digest = digest.sha256(csv_path) if os.path.exists(csv_path) else None
+    if expected_digest is None or recorded.decode() != expected_digest:
+        return None
+    return table
+
+
+def read(csv_path, columns=None):
+    """
+    讀 .feather (和 CSV 對得上才讀)，沒有 / 過期 / 沒裝 pyarrow 回傳 None。
+    columns 只轉換指定的欄位 (檔案是 memory map，沒選到的欄位完全不會被讀進來；不存在的欄位略過)
+    """
+    try:
+        table = _read_table(csv_path)
+    except Exception as e:
+        print(f"⚠️ 讀取 {binary_path(csv_path)} 失敗，改讀 CSV: {e}")
+        return None
+    if table is None:
+        return None
+    if columns is not None:
+        table = table.select([c for c in table.column_names if c in columns])
+    return table.to_pandas()
@@ -0,0 +1,15 @@
+"""
+data_pipeline/digest.py
+檔案內容雜湊：data/summary.json 的資料版本與 .feather 副本的有效性都以 CSV 內容為準
+(大小相同但內容不同的改寫也認得出來；不看 mtime：git checkout 後 mtime 不可靠)
+歷史 Excel 的解析快照 (surveys.load_history) 也用它命名
+"""
+import hashlib
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
@@ -0,0 +1,163 @@
+"""
+data_pipeline/latest.py
+每個指標「最新值」的算法 (只用 pandas / numpy，不依賴 streamlit / plotly)
+- 流水線用它寫 data/summary.json，前端引擎即時計算時也呼叫同一套，兩邊的數字一定一致
+- FILES[(分類, 模組)]：這個指標讀的資料檔 (data/ 底下)，summary.json 用它們的內容雜湊判斷過期
+- compute(分類, 模組, ticker, load=read_csv)：回傳 {"value", "change_pct", "as_of"}，沒有資料回傳 None
+  利差 / 曲線表達式會穿越 0，百分比漲跌沒有意義：change_pct 固定 0.0，另外給 change_bp (跟第一筆比的基點變動)
+  load(filename, columns) 讀 data/<filename> 的指定欄位；前端傳入 load_csv (走共用資料集快取)
+"""
+import os
+import re
+import numpy as np
+import pandas as pd
+from data_pipeline import columnar
+
+DATA_DIR = "data"
+CURVE_FILE = os.path.join(DATA_DIR, "treasury_curve.npz")
+RATES_COLUMN = {"DGS10": "DGS10", "DGS2": "DGS2", "SPREAD_10_2": "Spread"}  # rates.csv 的 ticker -> 欄位
+STRENGTH_BENCHMARK = "VTI"
+
+FILES = {
+    ("rates", "treasury"): ("rates.csv", "treasury_curve.npz"),
+    ("market", "breadth"): ("breadth.csv",),
+    ("market", "strength"): ("sector_strength.csv",),
+    ("market", "naaim"): ("naaim.csv",),  # 最新值只看 NAAIM，不用 sentiment.csv / ^GSPC
+    ("market", "world_sectors"): ("world_sectors.csv",),
+}
+
+_TOKEN = re.compile(r"(\d+)([MY]?)(S?)")
+
+
+def read_csv(filename, columns=None):
+    """流水線用的讀取器：有對得上的 .feather 就讀它，否則讀 CSV (日期欄轉成時間格式)"""
+    path = os.path.join(DATA_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    df = columnar.read(path, columns)
+    if df is None:
+        df = pd.read_csv(path, usecols=None if columns is None else (lambda c: c in columns))
+        for col in ("date", "Date"):
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def read_curve():
+    """{"dates", "tenors", "values"}；沒有曲線檔回傳 None"""
+    if not os.path.exists(CURVE_FILE):
+        return None
+    with np.load(CURVE_FILE) as f:
+        return {"dates": pd.DatetimeIndex(f["dates"]), "tenors": [str(t) for t in f["tenors"]], "values": f["values"]}
+
+
+def parse_expression(expr):
+    """曲線表達式 -> {天期: 權重}；看不懂就回傳 None"""
+    expr = expr.strip().upper().replace(" ", "")
+    if "-" in expr:
+        legs = expr.split("-")
+        if len(legs) != 2: return None
+        tokens, weights = legs, [1.0, -1.0]
+    else:
+        tokens = [m.group(0) for m in _TOKEN.finditer(expr) if m.group(0)]
+        if "".join(tokens) != expr: return None
+        # 1 個：單一天期；2 個：長 - 短；3 個：蝶式 2×中 - 短 - 長
+        weights = {1: [1.0], 2: [-1.0, 1.0], 3: [-1.0, 2.0, -1.0]}.get(len(tokens))
+        if weights is None: return None
+
+    combo = {}
+    for token, w in zip(tokens, weights):
+        m = _TOKEN.fullmatch(token)
+        if not m: return None
+        tenor = f"{int(m.group(1))}{m.group(2) or 'Y'}"
+        combo[tenor] = combo.get(tenor, 0.0) + w
+    return combo
+
+
+def curve_values(curve, combo):
+    """曲線矩陣 × 權重 -> 每天的值 (只拿用得到的天期相乘，任一腳是 NaN 結果就是 NaN)；天期不存在回傳 None"""
+    if any(t not in curve["tenors"] for t in combo): return None
+    weights = np.zeros(len(curve["tenors"]), dtype="float32")
+    for tenor, w in combo.items():
+        weights[curve["tenors"].index(tenor)] = w
+    cols = np.flatnonzero(weights)
+    return curve["values"][:, cols] @ weights[cols]
+
+
+def curve_latest(dates, values):
+    """曲線表達式序列的最新值與變動 (跟第一個有值的日子比，單位 bp)"""
+    ok = ~np.isnan(values)
+    if not ok.any(): return None
+    valid = values[ok].astype(float)
+    current_val, first_val = float(valid[-1]), float(valid[0])
+    return {"value": current_val, "change_pct": 0.0, "change_bp": (current_val - first_val) * 100.0,
+            "as_of": _as_of(dates[ok][-1])}
+
+
+def _as_of(when):
+    return pd.Timestamp(when).strftime("%Y-%m-%d")
+
+
+def _treasury(ticker, load):
+    if ticker not in RATES_COLUMN:
+        curve = read_curve()
+        combo = parse_expression(ticker)
+        if curve is None or combo is None: return None
+        values = curve_values(curve, combo)
+        return None if values is None else curve_latest(curve["dates"], values)
+    col = RATES_COLUMN[ticker]
+    df = load("rates.csv", ["date", col])
+    if df is None or df.empty or col not in df.columns: return None
+    if col == "Spread":
+        return curve_latest(df["date"].to_numpy(), df[col].to_numpy(dtype=float))
+    current_val, first_val = float(df[col].iloc[-1]), float(df[col].iloc[0])
+    # 簡單算一下漲跌 (跟第一筆比)
+    return {"value": current_val, "change_pct": (current_val - first_val) / first_val * 100.0, "as_of": _as_of(df["date"].iloc[-1])}
+
+
+def _breadth(ticker, load):
+    df = load("breadth.csv", ["date", "value"])
+    if df is None or df.empty: return None
+    current_val, first_val = float(df["value"].iloc[-1]), float(df["value"].iloc[0])
+    return {"value": current_val, "change_pct": (current_val - first_val) / first_val * 100.0, "as_of": _as_of(df["date"].iloc[-1])}
+
+
+def _strength(ticker, load):
+    df = load("sector_strength.csv", ["date", STRENGTH_BENCHMARK])
+    if df is None or df.empty: return None
+    value = float(df[STRENGTH_BENCHMARK].iloc[-1]) if STRENGTH_BENCHMARK in df.columns else 0.0
+    return {"value": value, "change_pct": 0.0, "as_of": _as_of(df["date"].iloc[-1])}
+
+
+def _naaim(ticker, load):
+    df = load("naaim.csv", ["date", "Date", "NAAIM"])
+    if df is None or df.empty or "NAAIM" not in df.columns: return None
+    date_col = "date" if "date" in df.columns else "Date"
+    valid = df[[date_col, "NAAIM"]].dropna()
+    if valid.empty: return None
+    return {"value": float(valid["NAAIM"].iloc[-1]), "change_pct": 0.0, "as_of": _as_of(valid[date_col].iloc[-1])}
+
+
+def _world_sectors(ticker, load):
+    df = load("world_sectors.csv", ["date"])
+    if df is None or df.empty: return None
+    # 儀表板沒有單一數值，清單頁顯示 0 (和 fetch_data 相同)
+    return {"value": 0.0, "change_pct": 0.0, "as_of": _as_of(df["date"].max())}
+
+
+_COMPUTE = {
+    ("rates", "treasury"): _treasury,
+    ("market", "breadth"): _breadth,
+    ("market", "strength"): _strength,
+    ("market", "naaim"): _naaim,
+    ("market", "world_sectors"): _world_sectors,
+}
+
+
+def supports(category, module_name):
+    return (category, module_name) in _COMPUTE
+
+
+def compute(category, module_name, ticker, load=read_csv):
+    fn = _COMPUTE.get((category, module_name))
+    return fn(ticker, load) if fn else None
@@ -6,11 +6,29 @@ from . import strength # 👈 新增這行
 from . import naaim
 from . import sentiment
 from . import world_sectors
+from data_pipeline import prices
+from data_pipeline import scheduler
+from data_pipeline import runtime
+
+MODULES = (breadth, strength, naaim, sentiment, world_sectors)
+
+def _prefetch():
+    # 先把各模組重疊的股價一次補齊 (^GSPC、VTI、XLK... 每天只下載一次)
+    # 只跑部分模組時 (update_data.py market.naaim)，只補被選到的模組需要的股價
+    prices.prefetch([m.price_universe() for m in MODULES if runtime.selected("market." + m.__name__.rsplit(".", 1)[-1])])
+
+def tasks():
+    """市場部門的 DAG 節點：股價倉庫先補齊，各模組再同時跑 (^GSPC 同時餵給 naaim / sentiment / breadth)"""
+    return [
+        scheduler.Task("market.prices", _prefetch, timeout=1800),
+        scheduler.Task("market.breadth", breadth.update, deps=["market.prices"], timeout=1800),  # 成分股首次下載較久
+        scheduler.Task("market.strength", strength.update, deps=["market.prices"]),
+        scheduler.Task("market.holdings", strength.update_holdings, timeout=900),  # 成分股爬蟲不用等股價
+        scheduler.Task("market.naaim", naaim.update, deps=["market.prices"]),
+        scheduler.Task("market.sentiment", sentiment.update, deps=["market.prices"]),
+        scheduler.Task("market.world_sectors", world_sectors.update, deps=["market.prices"]),
+    ]
 
 def update():
     print("🔹 [Market Dept] 開始更新...")
-    breadth.update()
-    strength.update()   # 👈 新增這行
-    naaim.update()
-    sentiment.update()
-    world_sectors.update()
\ No newline at end of file
+    scheduler.print_summary(scheduler.run(tasks()))
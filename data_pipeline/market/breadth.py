@@ -1,108 +1,476 @@
 """
 data_pipeline/market/breadth.py
 負責抓取 S&P 500 市場寬度 -> 存成 data/breadth.csv
-(採用 Batch 分批運算，防止記憶體爆炸)
+(同一次掃描 panel 產出：% > 20/50/200MA、騰落線 A/D Line、52 週新高減新低、McClellan 震盪指標)
+(採用 NumPy 前綴和 + 沿股票軸分塊運算，防止記憶體爆炸)
+(增量模式：只下載最後一天之後的股價 + 200MA 暖機區間，只追加新的列)
+(狀態檔模式：data/.cache/breadth_state.npz 保存每檔股票的均線環狀緩衝區，每日只做 O(股票數) 的狀態轉移)
 """
-import yfinance as yf
 import pandas as pd
-import requests
+import numpy as np
 from io import StringIO
 import os
-import gc  # 垃圾回收機制，用來清記憶體
+from data_pipeline import prices
+from data_pipeline import net
+from data_pipeline import metrics
+from data_pipeline import runtime
+from data_pipeline import columnar
 
-def update():
+DATA_DIR = "data"
+FILE_PATH = os.path.join(DATA_DIR, "breadth.csv")
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+STATE_PATH = os.path.join(CACHE_DIR, "breadth_state.npz")
+
+START_DATE = "2007-01-01"
+CHUNK_SIZE = 128    # 每次只處理 128 檔股票 (控制峰值記憶體)
+MA_WINDOWS = (20, 50, 200)
+HL_WINDOW = 252     # 52 週新高 / 新低
+MCCLELLAN_FAST, MCCLELLAN_SLOW = 19, 39
+SMOOTH_WINDOW = 3   # breadth_50 的平滑天數
+RING_SIZE = max(max(MA_WINDOWS), HL_WINDOW)
+WARMUP_BARS = RING_SIZE  # 最長的視窗 (52 週新高低) 需要的暖機 K 棒數
+WARMUP_PAD = 15     # 額外緩衝 (假日 + 3 日平滑)，確保暖機區間一定夠長
+STATE_VERSION = 2
+
+OUTPUT_COLUMNS = ["date", "value", "breadth_200", "breadth_50", "breadth_20", "ad_line", "nh_nl", "mcclellan"]
+
+
+def _get_sp500_tickers():
+    """從 Wikipedia 抓 S&P 500 成分股清單"""
+    url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+    r = net.get(url, cache=True)
+    tickers = pd.read_html(StringIO(r.text))[0]['Symbol'].tolist()
+    return [t.replace('.', '-') for t in tickers]
+
+
+def _download_closes(tickers, start):
+    """
+    從共用股價倉庫取成分股收盤價 (dates × tickers, float32，還原權值)。
+    倉庫負責分片下載、退避重試與「只補缺口」，這裡只管整理格式。
+    """
+    with metrics.stage("fetch", rows_in=len(tickers)) as s:
+        data = prices.get(tickers, start, field="Adj Close")
+        # 簡單清理
+        data = data.dropna(axis=1, how='all').ffill().astype('float32')
+        s.rows_out = len(data)
+    return data
+
+
+def _rolling_extreme(x, w, ufunc):
+    """
+    沿時間軸的滾動最大/最小值 (van Herk / Gil-Werman：區塊前綴 + 區塊後綴)，O(dates) 與視窗長度無關。
+    ufunc 用 np.fmax / np.fmin (忽略 NaN)。回傳長度 dates - w + 1，第 i 列對應視窗 [i, i + w - 1]。
+    """
+    n_dates, n_cols = x.shape
+    pad = (-n_dates) % w
+    if pad:
+        x = np.concatenate([x, np.full((pad, n_cols), np.nan, dtype=x.dtype)])
+    blocks = x.reshape(-1, w, n_cols)
+    prefix = ufunc.accumulate(blocks, axis=1).reshape(-1, n_cols)
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_cols)
+    return ufunc(suffix[:n_dates - w + 1], prefix[w - 1:n_dates])
+
+
+def breadth_kernel(values, windows=MA_WINDOWS, hl_window=HL_WINDOW, chunk_size=CHUNK_SIZE):
+    """
+    市場寬度 NumPy 核心：一次掃過 panel 就產出所有寬度指標的原始計數。
+    values: (dates × tickers) 收盤價矩陣，NaN 代表當天沒有資料。
+    均線用前綴和 (20/50/100/200 都可以)，並沿股票軸分塊，峰值記憶體只跟 chunk_size 有關。
+    回傳 dict：
+        pct        {window: 站上均線百分比}
+        advances / declines     當日上漲 / 下跌家數
+        new_highs / new_lows    收在 hl_window 日新高 / 新低的家數
+    """
+    values = np.ascontiguousarray(values, dtype=np.float32)
+    n_dates, n_tickers = values.shape
+    above = {w: np.zeros(n_dates, dtype=np.int64) for w in windows}
+    valid_total = np.zeros(n_dates, dtype=np.int64)
+    advances = np.zeros(n_dates, dtype=np.int64)
+    declines = np.zeros(n_dates, dtype=np.int64)
+    new_highs = np.zeros(n_dates, dtype=np.int64)
+    new_lows = np.zeros(n_dates, dtype=np.int64)
+
+    for c0 in range(0, n_tickers, chunk_size):
+        x = values[:, c0:c0 + chunk_size]
+        valid = np.isfinite(x)
+        valid_total += valid.sum(axis=1)
+
+        # 前綴和 (prefix sum)：任一視窗總和 = csum[t+1] - csum[t+1-w]
+        # 用 float64 累加，幾十年的價格加總才不會吃掉小數位
+        csum = np.zeros((n_dates + 1, x.shape[1]), dtype=np.float64)
+        np.cumsum(np.where(valid, x, 0), axis=0, out=csum[1:])
+        ccnt = np.zeros((n_dates + 1, x.shape[1]), dtype=np.int32)
+        np.cumsum(valid, axis=0, out=ccnt[1:])
+
+        for w in windows:
+            if w > n_dates:
+                continue
+            ma = (csum[w:] - csum[:-w]) / w
+            ma_ready = (ccnt[w:] - ccnt[:-w]) == w  # 視窗內 w 筆都有效，均線才成形 (同 pandas rolling)
+            above[w][w - 1:] += ((x[w - 1:] > ma) & ma_ready).sum(axis=1)
+
+        # 漲跌家數 (NaN 的比較結果都是 False，不會被算進去)
+        diff = x[1:] - x[:-1]
+        advances[1:] += (diff > 0).sum(axis=1)
+        declines[1:] += (diff < 0).sum(axis=1)
+
+        # 52 週新高 / 新低
+        if hl_window <= n_dates:
+            hl_ready = (ccnt[hl_window:] - ccnt[:-hl_window]) == hl_window
+            today = x[hl_window - 1:]
+            new_highs[hl_window - 1:] += ((today >= _rolling_extreme(x, hl_window, np.fmax)) & hl_ready).sum(axis=1)
+            new_lows[hl_window - 1:] += ((today <= _rolling_extreme(x, hl_window, np.fmin)) & hl_ready).sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = {w: np.nan_to_num(above[w] / valid_total) * 100 for w in windows}
+    return {"pct": pct, "advances": advances, "declines": declines, "new_highs": new_highs, "new_lows": new_lows}
+
+
+def _rana(advances, declines):
+    """McClellan 用的比率調整淨上漲家數 (Ratio-Adjusted Net Advances)"""
+    total = advances + declines
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, (advances - declines) / total * 1000, 0.0)
+
+
+def _compute_breadth(data):
+    """
+    計算所有寬度指標，回傳以日期為 index 的 DataFrame：
+    輸出欄位 breadth_200 / breadth_50 (平滑) / breadth_20 / ad_line / nh_nl / mcclellan，
+    以及狀態檔要用的內部欄位 breadth_50_raw / net_adv / ema_fast / ema_slow。
+    (ad_line 從 panel 第一天由 0 起算，增量模式會再接到舊的 ad_line 後面)
+    """
+    k = breadth_kernel(data.to_numpy(dtype='float32'))
+    index = data.index
+    breadth_50 = pd.Series(k["pct"][50], index=index)
+
+    # 平滑處理 (避免鋸齒狀太醜)
+    breadth_50_smooth = breadth_50.rolling(window=SMOOTH_WINDOW).mean()
+
+    net_adv = pd.Series(k["advances"] - k["declines"], index=index, dtype='float64')
+    rana = pd.Series(_rana(k["advances"], k["declines"]), index=index)
+    ema_fast = rana.ewm(span=MCCLELLAN_FAST, adjust=False).mean()
+    ema_slow = rana.ewm(span=MCCLELLAN_SLOW, adjust=False).mean()
+
+    return pd.DataFrame({
+        "breadth_200": k["pct"][200],
+        "breadth_50": breadth_50_smooth,
+        "breadth_20": k["pct"][20],
+        "ad_line": net_adv.cumsum(),
+        "nh_nl": (k["new_highs"] - k["new_lows"]).astype('float64'),
+        "mcclellan": ema_fast - ema_slow,
+        "breadth_50_raw": breadth_50,
+        "net_adv": net_adv,
+        "ema_fast": ema_fast,
+        "ema_slow": ema_slow,
+    }, index=index)
+
+
+def _merge_sp500(sp500, breadth):
+    """把 S&P 500 指數與寬度指標合併成輸出格式"""
+    df = breadth.reindex(columns=OUTPUT_COLUMNS[2:])
+    df.insert(0, "value", sp500)
+    df = df.dropna().reset_index()
+    # 統一欄位名稱
+    return df.rename(columns={df.columns[0]: "date"})
+
+
+def _download_sp500(start):
+    return prices.get(["^GSPC"], start, field="Adj Close")["^GSPC"].dropna()
+
+
+def price_universe():
+    """共用股價倉庫預先補齊用的需求 (成分股清單要連網才知道，由 update() 自己補)"""
+    return {"^GSPC": runtime.start_date(START_DATE)}
+
+
+def _load_existing():
+    """讀取現有的 breadth.csv，沒有或壞掉就回傳 None"""
+    if not os.path.exists(FILE_PATH):
+        return None
+    try:
+        df = pd.read_csv(FILE_PATH, parse_dates=['date'])
+    except Exception as e:
+        print(f"      ⚠️ 無法讀取舊的 {FILE_PATH}，改為全量重建: {e}")
+        return None
+    if df.empty:
+        return None
+    missing = [c for c in OUTPUT_COLUMNS if c not in df.columns]
+    if missing:
+        print(f"      ℹ️ 舊的 breadth.csv 缺少欄位 {missing}，改為全量重建")
+        return None
+    return df
+
+
+# ==========================================
+# 滾動視窗狀態檔 (Ring Buffer)
+# ==========================================
+# ring:   (252, 股票數) float32，最近 252 個收盤價，pos 指向「下一個要寫入的位置」(= 最舊的一筆)
+# sums:   (均線數, 股票數) float32，每條均線視窗內的收盤價總和
+# count:  每檔股票累積的有效收盤價筆數 (上限 252)，決定均線 / 新高低是否已經成形
+# b50_tail: 最近 2 天未平滑的 breadth_50，用來接續 3 日平滑
+# ad_line / ema_fast / ema_slow: 騰落線與 McClellan 兩條 EMA 的最後一個值
+
+def _build_state(data, breadth):
+    """由一段 (dates × tickers) 收盤價 panel 建立狀態 (panel 至少要涵蓋暖機區間)"""
+    values = data.to_numpy(dtype='float32')
+    tail = values[-RING_SIZE:]
+    ring = np.full((RING_SIZE, values.shape[1]), np.nan, dtype='float32')
+    ring[RING_SIZE - len(tail):] = tail
+
+    count = np.minimum(np.isfinite(values).sum(axis=0), RING_SIZE).astype('int32')
+    sums = np.stack([np.nansum(ring[-w:].astype('float64'), axis=0) for w in MA_WINDOWS]).astype('float32')
+    last = breadth.iloc[-1]
+
+    return {
+        "version": np.int64(STATE_VERSION),
+        "tickers": np.asarray(data.columns, dtype=str),
+        "last_date": np.datetime64(pd.Timestamp(data.index[-1]).normalize(), 'D'),
+        "ring": ring, "pos": np.int64(0), "count": count, "sums": sums,
+        "b50_tail": breadth["breadth_50_raw"].to_numpy(dtype='float32')[-(SMOOTH_WINDOW - 1):],
+        "ad_line": np.float64(last["ad_line"]),
+        "ema_fast": np.float64(last["ema_fast"]),
+        "ema_slow": np.float64(last["ema_slow"]),
+    }
+
+
+def _load_state(tickers, last_date):
+    """讀取狀態檔；版本、成分股或最後日期對不上就視為無效 (回傳 None，改走暖機路徑重建)"""
+    if not os.path.exists(STATE_PATH):
+        return None
+    try:
+        with np.load(STATE_PATH) as f:
+            state = {k: f[k] for k in f.files}
+    except Exception as e:
+        print(f"      ⚠️ 狀態檔損毀，改走暖機路徑: {e}")
+        return None
+
+    if int(state.get("version", 0)) != STATE_VERSION:
+        return None
+    if state["last_date"] != np.datetime64(pd.Timestamp(last_date).normalize(), 'D'):
+        return None
+    if set(state["tickers"].tolist()) != set(tickers):
+        print("      ℹ️ 成分股有異動，狀態檔需要重建")
+        return None
+
+    state["sums"] = state["sums"].astype('float64')  # 運算時用 float64 累加，存檔時再壓回 float32
+    return state
+
+
+def _save_state(state):
+    """存回狀態檔前，用 ring 重新精算一次 sums，避免 float32 累加誤差日積月累"""
+    ordered = np.roll(state["ring"], -int(state["pos"]), axis=0)  # 轉回時間順序 (舊 -> 新)
+    state = dict(state, ring=ordered, pos=np.int64(0))
+    state["sums"] = np.stack([np.nansum(ordered[RING_SIZE - w:].astype('float64'), axis=0) for w in MA_WINDOWS]).astype('float32')
+
+    if not os.path.exists(CACHE_DIR): os.makedirs(CACHE_DIR)
+    tmp_path = STATE_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **state)
+    os.replace(tmp_path, STATE_PATH)
+
+
+def _step_state(state, px):
+    """
+    推進一天：px 是當天 (股票數,) 的收盤價。
+    只動到 ring 的一列與每檔股票的幾個純量 -> 每天的成本只跟股票數有關，跟歷史長度無關
+    回傳當天所有寬度指標 (dict)
+    """
+    ring, pos, count, sums = state["ring"], int(state["pos"]), state["count"], state["sums"]
+    prev = ring[(pos - 1) % RING_SIZE]
+
+    # 跟全量版一樣 ffill：當天沒報價就沿用上一筆
+    px = np.where(np.isnan(px), prev, px).astype('float32')
+    valid = ~np.isnan(px)
+    incoming = np.nan_to_num(px).astype('float64')
+    new_count = np.minimum(count + valid, RING_SIZE)
+
+    pct = {}
+    denominator = valid.sum()
+    for k, w in enumerate(MA_WINDOWS):
+        leaving = np.nan_to_num(ring[(pos - w) % RING_SIZE]).astype('float64')
+        sums[k] += incoming - leaving
+        above = (new_count >= w) & (px > sums[k] / w)
+        pct[w] = float(above.sum()) / denominator * 100 if denominator else 0.0
+
+    ring[pos] = px
+    state["count"] = new_count.astype('int32')
+
+    # 52 週新高 / 新低：今天 + 前 251 天
+    window_rows = ring[(pos - np.arange(HL_WINDOW)) % RING_SIZE]
+    hl_ready = new_count >= HL_WINDOW
+    with np.errstate(invalid='ignore'):
+        new_highs = int((hl_ready & (px >= np.fmax.reduce(window_rows, axis=0))).sum())
+        new_lows = int((hl_ready & (px <= np.fmin.reduce(window_rows, axis=0))).sum())
+    state["pos"] = np.int64((pos + 1) % RING_SIZE)
+
+    # 騰落線 + McClellan
+    advances = int((px > prev).sum())
+    declines = int((px < prev).sum())
+    rana = float(_rana(np.array(advances), np.array(declines)))
+    state["ad_line"] = np.float64(state["ad_line"] + advances - declines)
+    state["ema_fast"] = np.float64(state["ema_fast"] + 2 / (MCCLELLAN_FAST + 1) * (rana - state["ema_fast"]))
+    state["ema_slow"] = np.float64(state["ema_slow"] + 2 / (MCCLELLAN_SLOW + 1) * (rana - state["ema_slow"]))
+
+    smooth_input = np.append(state["b50_tail"], np.float32(pct[50]))
+    b50_smooth = float(smooth_input.mean()) if len(smooth_input) >= SMOOTH_WINDOW else np.nan
+    state["b50_tail"] = smooth_input[-(SMOOTH_WINDOW - 1):].astype('float32')
+
+    return {
+        "breadth_200": pct[200], "breadth_50": b50_smooth, "breadth_20": pct[20],
+        "ad_line": float(state["ad_line"]), "nh_nl": float(new_highs - new_lows),
+        "mcclellan": float(state["ema_fast"] - state["ema_slow"]),
+    }
+
+
+def _rebase_state(state, px_recent):
+    """
+    倉庫遇到除權息 / 分割會把整段還原價乘上一個比值，狀態檔裡的 ring 與 sums 也要跟著乘，
+    否則均線會停在舊的基準。px_recent 是倉庫現在給的 last_date (含) 之前最近幾天的收盤價 (日期 × 股票)，
+    和 ring 最後幾列逐日比對；判斷規則和倉庫相同 (prices.agreed_ratio：最後一天不算、其餘幾天比值要一致)
+    """
+    k = min(len(px_recent), RING_SIZE)
+    if k == 0:
+        return
+    rows = [(int(state["pos"]) - k + i) % RING_SIZE for i in range(k)]
+    ratio = prices.agreed_ratio(state["ring"][rows], px_recent[-k:])
+    changed = ratio != 1
+    if not changed.any():
+        return
+    print(f"      🔧 {int(changed.sum())} 檔股票有除權息 / 分割，重新縮放狀態檔")
+    state["ring"][:, changed] *= ratio[changed].astype('float32')
+    state["sums"][:, changed] *= ratio[changed]
+
+
+def _update_from_state(state, tickers, last_date):
+    """狀態檔路徑：只下載 last_date 之後的收盤價，逐日推進狀態。回傳新的列 (可能為空)"""
+    start = (pd.Timestamp(last_date) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+    print(f"      ⚡ 狀態檔模式：只下載 {start} 之後的收盤價")
+
+    # 先用指數確認有沒有新交易日，沒有就不必下載 500 檔成分股
+    sp500 = _download_sp500(start)
+    if sp500.empty or not (sp500.index > last_date).any():
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+
+    # 從 last_date 往回幾天開始讀：那幾列用來比對還原基準 (除權息 / 分割後倉庫會整段重新縮放)
+    overlap_start = pd.Timestamp(last_date) - pd.Timedelta(days=prices.RECONCILE_OVERLAP_DAYS)
+    data = _download_closes(tickers, f"{overlap_start:%Y-%m-%d}")
+    data = data.reindex(columns=state["tickers"].tolist())
+    recent = data[data.index <= last_date]
+    if last_date in recent.index:
+        _rebase_state(state, recent.to_numpy(dtype='float32'))
+    data = data[data.index > last_date]
+    if data.empty:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+
+    with metrics.stage("compute", rows_in=len(data)) as s:
+        rows = [_step_state(state, px) for px in data.to_numpy(dtype='float32')]
+        breadth = pd.DataFrame(rows, index=data.index)
+        s.rows_out = len(breadth)
+
+    df_new = _merge_sp500(sp500, breadth)
+
+    state["last_date"] = np.datetime64(pd.Timestamp(data.index[-1]).normalize(), 'D')
+    _save_state(state)
+    return df_new[df_new["date"] > last_date]
+
+
+def update(full=False):
+    """
+    full=False (預設)：增量模式。
+        - 狀態檔有效 -> 只下載新日期，逐日推進狀態
+        - 狀態檔缺失 -> 下載最後一天之後 + 252 日暖機區間，算完順便重建狀態檔
+    full=True：從 START_DATE 全量重建 (並重建狀態檔)。
+    """
     print("   ↳ 📊 [Breadth] 正在分析 S&P 500 市場寬度 (防爆模式啟動)...")
-    
-    START_DATE = "2007-01-01"
-    BATCH_SIZE = 50  # 每次只處理 50 檔股票
+
+    existing = None if full else _load_existing()
+    if existing is not None:
+        last_date = existing['date'].max()
 
     # 1. 抓成分股清單
-    url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        r = requests.get(url, headers=headers)
-        tickers = pd.read_html(StringIO(r.text))[0]['Symbol'].tolist()
-        tickers = [t.replace('.', '-') for t in tickers]
+        tickers = _get_sp500_tickers()
     except Exception as e:
         print(f"   ❌ [Breadth] 無法抓取成分股: {e}")
+        raise
+
+    # 2. 狀態檔捷徑：不需要回頭讀任何歷史股價
+    state = _load_state(tickers, last_date) if existing is not None else None
+    if state is not None:
+        try:
+            new_rows = _update_from_state(state, tickers, last_date)
+        except Exception as e:
+            print(f"   ❌ [Breadth] 下載失敗: {e}")
+            raise
+        _append_and_save(existing, new_rows)
         return
 
-    # 2. 下載資料 (這步最久，請耐心等候)
+    if existing is not None:
+        # 往回多抓 252 根 K 棒當暖機，讓第一個新日期的 200MA / 52 週新高低也是完整的
+        start = (last_date - pd.tseries.offsets.BDay(WARMUP_BARS + WARMUP_PAD)).strftime("%Y-%m-%d")
+        print(f"      ⏩ 增量模式：最後日期 {last_date:%Y-%m-%d}，從 {start} 開始下載 (含暖機區間)")
+    else:
+        start = runtime.start_date(START_DATE)
+
+    # 3. 下載資料 (全量模式這步最久，請耐心等候)
     print("      📥 下載 500 檔股價數據中...")
     try:
-        data = yf.download(tickers, start=START_DATE, auto_adjust=True, threads=True, progress=False)['Close']
-        # 簡單清理
-        data = data.dropna(axis=1, how='all').ffill().astype('float32')
+        data = _download_closes(tickers, start)
     except Exception as e:
         print(f"   ❌ [Breadth] 下載失敗: {e}")
-        return
+        raise
 
-    # 3. 分批計算寬度 (你的防爆邏輯)
-    print("      🧮 開始分批運算 (Batch Processing)...")
-    
-    numerator_50 = pd.Series(0, index=data.index, dtype='float32')
-    numerator_200 = pd.Series(0, index=data.index, dtype='float32')
-    denominator = pd.Series(0, index=data.index, dtype='float32')
-
-    all_cols = data.columns
-    total_stocks = len(all_cols)
-
-    # 開始分批切肉
-    for i in range(0, total_stocks, BATCH_SIZE):
-        batch_cols = all_cols[i : i + BATCH_SIZE]
-        batch_data = data[batch_cols]
-        
-        # 計算 MA
-        ma50_batch = batch_data.rolling(window=50).mean()
-        ma200_batch = batch_data.rolling(window=200).mean()
-        
-        # 判斷是否站上均線
-        above_50_batch = (batch_data > ma50_batch).astype('float32')
-        above_200_batch = (batch_data > ma200_batch).astype('float32')
-        valid_batch = batch_data.notna().astype('float32')
-        
-        # 累加結果
-        numerator_50 = numerator_50.add(above_50_batch.sum(axis=1).fillna(0), fill_value=0)
-        numerator_200 = numerator_200.add(above_200_batch.sum(axis=1).fillna(0), fill_value=0)
-        denominator = denominator.add(valid_batch.sum(axis=1).fillna(0), fill_value=0)
-        
-        # 🧹 清理記憶體 (關鍵！)
-        del batch_data, ma50_batch, ma200_batch, above_50_batch, above_200_batch, valid_batch
-        gc.collect()
-
-    # 計算最終百分比
-    breadth_50 = (numerator_50 / denominator).fillna(0) * 100
-    breadth_200 = (numerator_200 / denominator).fillna(0) * 100
-    
-    # 平滑處理 (避免鋸齒狀太醜)
-    breadth_50_smooth = breadth_50.rolling(window=3).mean()
+    # 4. 計算寬度 (一次掃描產出所有指標)
+    print("      🧮 開始向量化運算 (NumPy kernel)...")
+    with metrics.stage("compute", rows_in=len(data)) as s:
+        breadth = _compute_breadth(data)
+        s.rows_out = len(breadth)
+    if existing is not None:
+        # 騰落線要接在舊資料的最後一個值後面 (McClellan 的 EMA 經過 252 天暖機已收斂)
+        is_new = breadth.index > last_date
+        breadth.loc[is_new, "ad_line"] = float(existing["ad_line"].iloc[-1]) + breadth.loc[is_new, "net_adv"].cumsum()
+    _save_state(_build_state(data, breadth))
 
     # 清除原始大數據，釋放記憶體
-    del data, numerator_50, numerator_200, denominator
-    gc.collect()
+    del data
 
-    # 4. 下載大盤指數 (當作基準)
+    # 5. 下載大盤指數 (當作基準)
     print("      📥 下載 S&P 500 指數...")
-    sp500_df = yf.download("^GSPC", start=START_DATE, auto_adjust=True, progress=False)
-    sp500 = sp500_df['Close'].squeeze() if 'Close' in sp500_df.columns else sp500_df.squeeze()
+    sp500 = _download_sp500(start)
 
-    # 5. 合併並存檔
-    df_result = pd.DataFrame({
-        "value": sp500,
-        "breadth_200": breadth_200,
-        "breadth_50": breadth_50_smooth
-    }).dropna().reset_index()
+    # 6. 合併
+    df_result = _merge_sp500(sp500, breadth)
+
+    if existing is not None:
+        # 只保留真正的新日期 (暖機區間的列只是用來算均線)
+        _append_and_save(existing, df_result[df_result["date"] > last_date])
+    else:
+        _append_and_save(None, df_result)
+
+
+def _append_and_save(existing, new_rows):
+    if existing is not None:
+        if new_rows.empty:
+            print("   ✅ [Breadth] 已是最新，沒有新資料需要追加")
+            return
+        df_result = pd.concat([existing, new_rows], ignore_index=True)
+        print(f"      ➕ 追加 {len(new_rows)} 筆新資料")
+    else:
+        df_result = new_rows
 
-    # 統一欄位名稱
-    if "Date" in df_result.columns:
-        df_result.rename(columns={"Date": "date"}, inplace=True)
-    
     # 存檔
-    if not os.path.exists("data"): os.makedirs("data")
-    file_path = "data/breadth.csv"
-    df_result.to_csv(file_path, index=False)
-    
-    print(f"   ✅ [Breadth] 成功更新並存檔: {file_path}")
+    if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
+    with metrics.stage("write") as s:
+        # 先寫暫存檔再換名：節點逾時被放棄、行程中途結束也不會留下寫一半的 CSV
+        tmp_path = FILE_PATH + ".tmp"
+        df_result.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, FILE_PATH)
+        s.rows_out = len(df_result)
+        s.wrote(FILE_PATH)
+        columnar.write(df_result, FILE_PATH)
+
+    print(f"   ✅ [Breadth] 成功更新並存檔: {FILE_PATH}")
 
 if __name__ == "__main__":
-    update()
\ No newline at end of file
+    update()
@@ -3,125 +3,119 @@ data_pipeline/market/naaim.py
 負責抓取 NAAIM 機構經理人持倉指數，並與 S&P 500 對照
 """
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
-import yfinance as yf
 import os
+from data_pipeline import net
+from data_pipeline import metrics
+from data_pipeline import runtime
+from . import surveys
+from io import BytesIO
+from urllib.parse import urljoin
 
 DATA_DIR = "data"
 NAAIM_FILE = os.path.join(DATA_DIR, "naaim.csv")
 HISTORY_FILE = os.path.join(DATA_DIR, "NAAIM_History.xlsx")
+SP500_START = "2006-01-01"  # NAAIM 歷史從 2006 年開始
+COLUMNS = ['Date', 'NAAIM', 'NAAIM_MA20', 'SP500_Price']
+
+def price_universe():
+    """共用股價倉庫預先補齊用的需求"""
+    return {"^GSPC": runtime.start_date(SP500_START)}
 
 def get_naaim_latest():
     """從 NAAIM 官網爬取最新的 Excel 檔案連結並下載"""
     url = "https://naaim.org/programs/naaim-exposure-index/"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "Sec-Fetch-Dest": "document",
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-Site": "none",
-        "Sec-Fetch-User": "?1",
-        "Cache-Control": "max-age=0",
-    }
     try:
-        r = requests.get(url, headers=headers)
+        r = net.get(url, headers=net.BROWSER_HEADERS, cache=True)
         # 如果還是被擋，強制拋出錯誤讓我們知道
         r.raise_for_status() 
         
         soup = BeautifulSoup(r.text, 'html.parser')
         
         # 尋找網頁中的 excel 連結
+        xls_link = None
         for a in soup.find_all('a', href=True):
             href = a['href'].lower()
             if ('.xls' in href or '.xlsx' in href) and 'naaim' in href:
-                xls_link = a['href']
+                xls_link = urljoin(url, a['href'])
                 break
                 
-        if xls_link:
-            df = pd.read_excel(xls_link)
-            return df
+        if not xls_link:
+            raise ValueError("官網找不到 Excel 連結 (網頁改版？)")
+        xls = net.get(xls_link, headers=net.BROWSER_HEADERS, cache=True)
+        xls.raise_for_status()
+        df = pd.read_excel(BytesIO(xls.content))
+        return df
     except Exception as e:
         print(f"      [Error] NAAIM 爬蟲失敗: {e}")
-    return pd.DataFrame()
+        raise
+
+def _normalize(df):
+    """智慧解析欄位：NAAIM 官網 / 歷史 Excel 的表頭不固定，統一成 Date / NAAIM"""
+    date_col = next((c for c in df.columns if 'date' in str(c).lower()), df.columns[0])
+    naaim_col = next((c for c in df.columns if 'naaim' in str(c).lower() or 'exposure' in str(c).lower()), df.columns[1])
+    df = df.rename(columns={date_col: 'Date', naaim_col: 'NAAIM'})
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df['NAAIM'] = pd.to_numeric(df['NAAIM'], errors='coerce')
+    return df.dropna(subset=['Date', 'NAAIM'])[['Date', 'NAAIM']]
+
+def _parse_history(path):
+    base_df = pd.read_excel(path, engine='openpyxl')
+    # 👇 加上防呆：如果讀出來的 Excel 是全空的，直接給空表
+    if base_df.empty:
+        return pd.DataFrame(columns=['Date', 'NAAIM'])
+    return _normalize(base_df)
+
+def _read_history():
+    """第一次建檔：讀取 NAAIM_History.xlsx (解析結果有快照，Excel 沒變就不再跑 openpyxl)"""
+    if not os.path.exists(HISTORY_FILE):
+        return pd.DataFrame(columns=['Date', 'NAAIM'])
+    try:
+        return surveys.load_history(HISTORY_FILE, _parse_history)
+    except Exception as e:
+        print(f"      [Error] 讀取 Excel 失敗: {e}")
+        return pd.DataFrame(columns=['Date', 'NAAIM'])
 
 def update():
     print("   ↳ 👔 [NAAIM Exposure] 正在更新機構經理人情緒指標...")
     
-    # 1. 讀取基礎數據
-    if os.path.exists(NAAIM_FILE):
-        base_df = pd.read_csv(NAAIM_FILE, parse_dates=['Date'])
-    elif os.path.exists(HISTORY_FILE):
-        try:
-            base_df = pd.read_excel(HISTORY_FILE, engine='openpyxl')
-            
-            # 👇 2. 加上防呆：如果讀出來的 Excel 是全空的，直接給空表
-            if base_df.empty:
-                base_df = pd.DataFrame(columns=['Date', 'NAAIM'])
-            else:
-                # 智慧解析欄位
-                date_col = next((c for c in base_df.columns if 'date' in str(c).lower()), base_df.columns[0])
-                naaim_col = next((c for c in base_df.columns if 'naaim' in str(c).lower() or 'exposure' in str(c).lower()), base_df.columns[1])
-                
-                base_df = base_df.rename(columns={date_col: 'Date', naaim_col: 'NAAIM'})
-                base_df['Date'] = pd.to_datetime(base_df['Date'], errors='coerce')
-                base_df['NAAIM'] = pd.to_numeric(base_df['NAAIM'], errors='coerce')
-                base_df = base_df.dropna(subset=['Date', 'NAAIM'])[['Date', 'NAAIM']]
-                
-        except Exception as e:
-            print(f"      [Error] 讀取 Excel 失敗: {e}")
-            base_df = pd.DataFrame(columns=['Date', 'NAAIM'])
-    # 2. 抓取最新數據並合併
-    new_df = get_naaim_latest()
+    # 1. 讀取基礎數據 (已存的 CSV；沒有的話從歷史 Excel 建檔)
+    full_df, since = surveys.load_stored(NAAIM_FILE, COLUMNS, 'NAAIM_MA20')
+    fresh = []
+    if full_df is None:
+        full_df = surveys.clean(pd.DataFrame(columns=COLUMNS), COLUMNS)
+        fresh.append(_read_history())
+
+    # 2. 抓取最新數據，只併入新的 (或被修正的) 週資料
+    with metrics.stage("fetch") as st:
+        new_df = get_naaim_latest()
+        st.rows_out = len(new_df)
     if not new_df.empty:
         try:
-            date_col = next((c for c in new_df.columns if 'date' in str(c).lower()), new_df.columns[0])
-            naaim_col = next((c for c in new_df.columns if 'naaim' in str(c).lower() or 'exposure' in str(c).lower()), new_df.columns[1])
-            new_df = new_df.rename(columns={date_col: 'Date', naaim_col: 'NAAIM'})
-            new_df['Date'] = pd.to_datetime(new_df['Date'], errors='coerce')
-            new_df['NAAIM'] = pd.to_numeric(new_df['NAAIM'], errors='coerce')
-            new_df = new_df.dropna(subset=['Date', 'NAAIM'])[['Date', 'NAAIM']]
-            
-            full_df = pd.concat([base_df, new_df]).drop_duplicates(subset=['Date'], keep='last').sort_values('Date')
-        except:
-            full_df = base_df
-    else:
-        full_df = base_df
+            fresh.append(_normalize(new_df))
+        except Exception as e:
+            print(f"      [Error] NAAIM 最新數據解析失敗: {e}")
+            raise
+    fresh = [f for f in fresh if not f.empty]
+    if fresh:
+        full_df, first_changed = surveys.upsert(full_df, surveys.clean(pd.concat(fresh), ['Date', 'NAAIM']), ['NAAIM'])
+        if first_changed is not None and (since is None or first_changed < since):
+            since = first_changed
 
     if full_df.empty:
         return
+    if since is None:
+        print(f"   ✅ [NAAIM Exposure] 已是最新，最新日期: {full_df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
+        return
 
-    # 3. 計算 MA20
-    full_df['NAAIM_MA20'] = full_df['NAAIM'].rolling(window=20).mean()
+    # 3. MA20 只重算變動日之後的尾段
+    with metrics.stage("compute", rows_in=len(full_df)) as st:
+        full_df = surveys.update_ma_tail(full_df, 'NAAIM', 'NAAIM_MA20', since)
 
-    # 4. 補上 S&P 500 收盤價
-# 4. 補上 S&P 500 收盤價
-    start_date = full_df['Date'].min()
-    try:
-        sp500 = yf.download("^GSPC", start=start_date, progress=False, auto_adjust=False)['Close']
-        if not sp500.empty:
-            if isinstance(sp500, pd.DataFrame):
-                sp500 = sp500.iloc[:, 0]
-            sp500 = sp500.reset_index()
-            sp500.columns = ['Date', 'SP500_Price']
-            
-            # 🔥 修正 2：合併前先刪除舊有的 SP500_Price
-            if 'SP500_Price' in full_df.columns:
-                full_df = full_df.drop(columns=['SP500_Price'])
-                
-            full_df = pd.merge_asof(full_df.sort_values('Date'), 
-                                    sp500.sort_values('Date'), 
-                                    on='Date', 
-                                    direction='backward')
-    except Exception as e:
-        print(f"      [Error] S&P 500 下載失敗: {e}")
+        # 4. 只替變動的日期補上 S&P 500 收盤價
+        full_df = surveys.attach_sp500(full_df, since, runtime.start_date(SP500_START))
+        st.rows_out = len(full_df)
 
     # 5. 存檔
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    full_df.to_csv(NAAIM_FILE, index=False)
-    print(f"   ✅ [NAAIM Exposure] 儲存成功，最新日期: {full_df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
\ No newline at end of file
+    surveys.save(full_df, NAAIM_FILE)
+    print(f"   ✅ [NAAIM Exposure] 儲存成功 (自 {since:%Y-%m-%d} 起更新)，最新日期: {full_df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
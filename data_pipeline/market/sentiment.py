@@ -3,34 +3,30 @@ data_pipeline/market/sentiment.py
 負責抓取 AAII 散戶情緒與 S&P 500 對照數據 (包含超強 Excel 智慧解析)
 """
 import pandas as pd
-import requests
-import yfinance as yf
 import os
+from data_pipeline import net
+from data_pipeline import metrics
+from data_pipeline import runtime
+from . import surveys
 import io
 # 設定資料路徑
 DATA_DIR = "data"
 SENTIMENT_FILE = os.path.join(DATA_DIR, "sentiment.csv")
 HISTORY_FILE = os.path.join(DATA_DIR, "AAII_History.xlsx") 
+SP500_START = "2000-01-01"  # sentiment.csv 從 2000 年開始
+VALUE_COLUMNS = ['Date', 'Bullish', 'Neutral', 'Bearish', 'Spread']
+COLUMNS = VALUE_COLUMNS + ['Spread_MA20', 'SP500_Price']
+
+def price_universe():
+    """共用股價倉庫預先補齊用的需求"""
+    return {"^GSPC": runtime.start_date(SP500_START)}
 
 def get_aaii_latest():
     """從 AAII 官網抓取最新一週數據"""
     url = "https://www.aaii.com/sentimentsurvey/sent_results"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-        "Sec-Fetch-Dest": "document",
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-Site": "none",
-        "Sec-Fetch-User": "?1",
-        "Cache-Control": "max-age=0",
-    }
     
     try:
-        r = requests.get(url, headers=headers)
+        r = net.get(url, headers=net.BROWSER_HEADERS, cache=True)
         # 解決 html5lib 的黃色警告
         import io
         tables = pd.read_html(io.StringIO(r.text), flavor='html5lib')
@@ -42,7 +38,7 @@ def get_aaii_latest():
         df = df.dropna(subset=['Date'])
         
         for col in ['Bullish', 'Neutral', 'Bearish']:
-            if df[col].dtype == object:
+            if not pd.api.types.is_numeric_dtype(df[col]):
                 df[col] = df[col].astype(str).str.replace('%', '').astype(float)
         
         df['Spread'] = df['Bullish'] - df['Bearish']
@@ -50,88 +46,84 @@ def get_aaii_latest():
         
     except Exception as e:
         print(f"      [Error] AAII 爬蟲失敗: {e}")
-        return pd.DataFrame()
+        raise
 
-def update():
-    """主更新函數：整合歷史檔 + 網路爬蟲 + S&P 500"""
-    print("   ↳ 🐂🐻 [AAII Sentiment] 正在更新散戶情緒指標...")
+def _parse_history(path):
+    """💡 智慧解析，容忍各種 Excel 格式"""
+    # 讀取你的 Excel 檔
+    base_df = pd.read_excel(path, engine='openpyxl')
     
-    if os.path.exists(SENTIMENT_FILE):
-        base_df = pd.read_csv(SENTIMENT_FILE, parse_dates=['Date'])
-    elif os.path.exists(HISTORY_FILE):
-        # 💡 [智慧解析] 容忍各種 Excel 格式
-        try:
-            # 讀取你的 Excel 檔
-            base_df = pd.read_excel(HISTORY_FILE, engine='openpyxl')
-            
-            # 處理 Date 欄位名稱 (如果官方表頭叫 Reported Date，自動改名)
-            if 'Reported Date' in base_df.columns:
-                base_df = base_df.rename(columns={'Reported Date': 'Date'})
-                
-            base_df['Date'] = pd.to_datetime(base_df['Date'], errors='coerce')
-            base_df = base_df.dropna(subset=['Date']) # 刪除沒有日期的無效行
-            
-            # 🔥 核心魔法：自動把 0.75 這種小數轉換成 75.0
-            for col in ['Bullish', 'Neutral', 'Bearish']:
-                if col in base_df.columns:
-                    # 強制轉為數字，忽略無法轉換的文字
-                    base_df[col] = pd.to_numeric(base_df[col], errors='coerce')
-                    # 如果這欄的最大值小於或等於 1.5，代表它是百分比小數 (例如 0.75)
-                    if base_df[col].max() <= 1.5:
-                        base_df[col] = base_df[col] * 100
-                        
-            if 'Spread' not in base_df.columns and 'Bullish' in base_df.columns:
-                base_df['Spread'] = base_df['Bullish'] - base_df['Bearish']
+    # 處理 Date 欄位名稱 (如果官方表頭叫 Reported Date，自動改名)
+    if 'Reported Date' in base_df.columns:
+        base_df = base_df.rename(columns={'Reported Date': 'Date'})
+        
+    base_df['Date'] = pd.to_datetime(base_df['Date'], errors='coerce')
+    base_df = base_df.dropna(subset=['Date']) # 刪除沒有日期的無效行
+    
+    # 🔥 核心魔法：自動把 0.75 這種小數轉換成 75.0
+    for col in ['Bullish', 'Neutral', 'Bearish']:
+        if col in base_df.columns:
+            # 強制轉為數字，忽略無法轉換的文字
+            base_df[col] = pd.to_numeric(base_df[col], errors='coerce')
+            # 如果這欄的最大值小於或等於 1.5，代表它是百分比小數 (例如 0.75)
+            if base_df[col].max() <= 1.5:
+                base_df[col] = base_df[col] * 100
                 
-            # 只取我們要的欄位
-            base_df = base_df[['Date', 'Bullish', 'Neutral', 'Bearish', 'Spread']]
-            
-        except Exception as e:
-            print(f"      [Error] 讀取 Excel 失敗: {e}")
-            base_df = pd.DataFrame(columns=['Date', 'Bullish', 'Neutral', 'Bearish', 'Spread'])
-    else:
+    if 'Spread' not in base_df.columns and 'Bullish' in base_df.columns:
+        base_df['Spread'] = base_df['Bullish'] - base_df['Bearish']
+        
+    # 只取我們要的欄位
+    return base_df[VALUE_COLUMNS]
+
+def _read_history():
+    """第一次建檔：讀取 AAII_History.xlsx (解析結果有快照，Excel 沒變就不再跑 openpyxl)"""
+    if not os.path.exists(HISTORY_FILE):
         print("      ⚠️ 警告：找不到 sentiment.csv 或 AAII_History.xlsx，將初始化空表")
-        base_df = pd.DataFrame(columns=['Date', 'Bullish', 'Neutral', 'Bearish', 'Spread'])
+        return pd.DataFrame(columns=VALUE_COLUMNS)
+    try:
+        return surveys.load_history(HISTORY_FILE, _parse_history)
+    except Exception as e:
+        print(f"      [Error] 讀取 Excel 失敗: {e}")
+        return pd.DataFrame(columns=VALUE_COLUMNS)
 
-    # 2. 抓取最新數據並合併
-    new_df = get_aaii_latest()
+def update():
+    """主更新函數：整合歷史檔 + 網路爬蟲 + S&P 500 (只處理新的週資料)"""
+    print("   ↳ 🐂🐻 [AAII Sentiment] 正在更新散戶情緒指標...")
+    
+    # 1. 讀取基礎數據 (已存的 CSV；沒有的話從歷史 Excel 建檔)
+    full_df, since = surveys.load_stored(SENTIMENT_FILE, COLUMNS, 'Spread_MA20')
+    fresh = []
+    if full_df is None:
+        full_df = surveys.clean(pd.DataFrame(columns=COLUMNS), COLUMNS)
+        fresh.append(_read_history())
+
+    # 2. 抓取最新數據，只併入新的 (或被修正的) 週資料
+    with metrics.stage("fetch") as st:
+        new_df = get_aaii_latest()
+        st.rows_out = len(new_df)
     if not new_df.empty:
-        cols = ['Date', 'Bullish', 'Neutral', 'Bearish', 'Spread']
-        base_df = base_df[cols] if not base_df.empty else base_df
-        new_df = new_df[cols]
-        full_df = pd.concat([base_df, new_df]).drop_duplicates(subset=['Date'], keep='last').sort_values('Date')
-    else:
-        full_df = base_df
+        fresh.append(new_df[VALUE_COLUMNS])
+    fresh = [f for f in fresh if not f.empty]
+    if fresh:
+        value_cols = VALUE_COLUMNS[1:]
+        full_df, first_changed = surveys.upsert(full_df, surveys.clean(pd.concat(fresh), VALUE_COLUMNS), value_cols)
+        if first_changed is not None and (since is None or first_changed < since):
+            since = first_changed
 
     if full_df.empty:
         return
+    if since is None:
+        print(f"   ✅ [AAII Sentiment] 已是最新，最新日期: {full_df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
+        return
 
-    # 3. 重算 20 週均線
-    full_df['Spread_MA20'] = full_df['Spread'].rolling(window=20).mean()
+    # 3. 20 週均線只重算變動日之後的尾段
+    with metrics.stage("compute", rows_in=len(full_df)) as st:
+        full_df = surveys.update_ma_tail(full_df, 'Spread', 'Spread_MA20', since)
+
+        # 4. 只替變動的日期補上 S&P 500 收盤價
+        full_df = surveys.attach_sp500(full_df, since, runtime.start_date(SP500_START))
+        st.rows_out = len(full_df)
 
-    # 4. 補上 S&P 500 收盤價
-# 4. 補上 S&P 500 收盤價
-    start_date = full_df['Date'].min()
-    try:
-        sp500 = yf.download("^GSPC", start=start_date, progress=False, auto_adjust=False)['Close']
-        if not sp500.empty:
-            if isinstance(sp500, pd.DataFrame):
-                sp500 = sp500.iloc[:, 0]
-            sp500 = sp500.reset_index()
-            sp500.columns = ['Date', 'SP500_Price']
-            
-            # 🔥 修正 2：合併前先刪除舊有的 SP500_Price，避免欄位名稱衝突 (_x, _y)
-            if 'SP500_Price' in full_df.columns:
-                full_df = full_df.drop(columns=['SP500_Price'])
-                
-            full_df = pd.merge_asof(full_df.sort_values('Date'), 
-                                    sp500.sort_values('Date'), 
-                                    on='Date', 
-                                    direction='backward')
-    except Exception as e:
-        print(f"      [Error] S&P 500 下載失敗: {e}")
     # 5. 存檔
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    full_df.to_csv(SENTIMENT_FILE, index=False)
-    print(f"   ✅ [AAII Sentiment] 儲存成功，最新日期: {full_df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
\ No newline at end of file
+    surveys.save(full_df, SENTIMENT_FILE)
+    print(f"   ✅ [AAII Sentiment] 儲存成功 (自 {since:%Y-%m-%d} 起更新)，最新日期: {full_df['Date'].iloc[-1].strftime('%Y-%m-%d')}")
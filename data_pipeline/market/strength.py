@@ -1,14 +1,27 @@
 """
 data_pipeline/market/strength.py
 負責抓取美股各大板塊的股價，並使用「三引擎」無死角獲取 ETF 最新成分股
+- 成分股一年只變幾次：etf_holdings_meta.json 記錄每檔 ETF 的抓取日，超過 HOLDINGS_TTL_DAYS 才重抓
+- 重抓失敗保留舊的成分股；設 BAMHI_FORCE_HOLDINGS=1 (或 update_holdings(force=True)) 全部強制重抓
 """
-import yfinance as yf
 import pandas as pd
 import os
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
+from data_pipeline import prices
+from data_pipeline import net
+from data_pipeline import metrics
+from data_pipeline import runtime
+from data_pipeline import columnar
+from data_pipeline import providers
 
 BENCHMARK = "VTI"
+START_DATE = "2006-01-01"
+FFILL_LIMIT = 5  # 向前補值最多幾個交易日
+
+HOLDINGS_PATH = "data/etf_holdings.json"          # {ticker: [成分股]}，前端直接讀這份
+HOLDINGS_META_PATH = "data/etf_holdings_meta.json" # {ticker: {"fetched_at": "YYYY-MM-DD", "source": ...}}
+HOLDINGS_TTL_DAYS = 30
 
 PORTFOLIO_STRUCTURE = {
     "通訊服務 (Communication)": {
@@ -65,105 +78,216 @@ PORTFOLIO_STRUCTURE = {
     }
 }
 
-def get_etf_holdings_triple_engine(ticker):
-    """三引擎獲取成分股，保證絕對抓得到"""
-    
-    # 【引擎 1】Yfinance 原生方法 (需要最新版 yfinance)
-    try:
-        h = yf.Ticker(ticker).funds_data.top_holdings
-        if h is not None and not h.empty:
-            syms = [str(s).replace(".", "-") for s in h.index if str(s).upper() not in ["CASH", "USD", "OTHER", "PROSPECTUS"]]
-            if syms: return syms[:15], "YFinance API"
-    except:
-        pass
-
-    # 【引擎 2】urllib 底層繞過 StockAnalysis 的 Cloudflare 防火牆
-    try:
-        import urllib.request
-        from bs4 import BeautifulSoup
-        url = f"https://stockanalysis.com/etf/{ticker.lower()}/holdings/"
-        req = urllib.request.Request(
-            url, 
-            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36'}
-        )
-        html = urllib.request.urlopen(req, timeout=5).read().decode('utf-8')
-        soup = BeautifulSoup(html, "html.parser")
-        table = soup.find("table", id="main-table")
-        if table:
-            syms = []
-            for row in table.find("tbody").find_all("tr"):
-                cols = row.find_all("td")
-                if len(cols) >= 2:
-                    sym = cols[1].text.strip()
-                    if sym and sym.upper() not in ["CASH", "USD", "-", "OTHER"]:
-                        syms.append(sym.replace(".", "-"))
-            if syms: return syms[:15], "StockAnalysis"
-    except:
-        pass
-
-    # 【引擎 3】Yahoo 隱藏 JSON API
+EXCLUDED_SYMBOLS = ["CASH", "USD", "OTHER", "PROSPECTUS", "-"]
+HOLDINGS_WORKERS = 8  # 同時掃描的 ETF 數 (實際速率由 net 的每主機令牌桶控制)
+
+
+def _clean(symbols):
+    return [str(s).strip().replace(".", "-") for s in symbols if str(s).strip() and str(s).strip().upper() not in EXCLUDED_SYMBOLS]
+
+
+def _looks_blocked(e):
+    """yfinance 被限流時丟的錯誤 (YFRateLimitError / Too Many Requests)"""
+    return "RateLimit" in type(e).__name__ or "Too Many Requests" in str(e)
+
+
+def _engine_yfinance(ticker):
+    """【引擎 1】Yfinance 原生方法 (需要最新版 yfinance)"""
+    provider = providers.current()
+    if provider.remote:
+        net.limiter("query2.finance.yahoo.com").acquire()
+    metrics.count_request("yfinance")
     try:
-        import requests
-        url = f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{ticker}?modules=topHoldings"
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/122.0.0.0 Safari/537.36"}
-        res = requests.get(url, headers=headers, timeout=5)
-        if res.status_code == 200:
-            data = res.json()
-            result = data.get("quoteSummary", {}).get("result", [])
-            if result and result[0].get("topHoldings"):
-                h = result[0]["topHoldings"].get("holdings", [])
-                valid = [item["symbol"].replace(".", "-") for item in h if item.get("symbol") and item.get("symbol").upper() not in ["CASH", "USD", "OTHER", "PROSPECTUS"]]
-                if valid: return valid[:15], "Yahoo JSON"
-    except:
-        pass
-    
+        h = provider.top_holdings(ticker)
+    except Exception as e:
+        if _looks_blocked(e): raise net.Blocked(str(e))
+        return []
+    if h is None or h.empty:
+        return []
+    return _clean(h.index)
+
+
+def _engine_stockanalysis(ticker):
+    """【引擎 2】StockAnalysis 網頁表格 (帶瀏覽器 User-Agent 繞過 Cloudflare 防火牆)"""
+    from bs4 import BeautifulSoup
+    res = net.get(f"https://stockanalysis.com/etf/{ticker.lower()}/holdings/", timeout=5, retries=0)
+    if res.status_code != 200:
+        return []
+    table = BeautifulSoup(res.text, "html.parser").find("table", id="main-table")
+    if not table:
+        return []
+    syms = []
+    for row in table.find("tbody").find_all("tr"):
+        cols = row.find_all("td")
+        if len(cols) >= 2:
+            syms.append(cols[1].text)
+    return _clean(syms)
+
+
+def _engine_yahoo_json(ticker):
+    """【引擎 3】Yahoo 隱藏 JSON API"""
+    res = net.get(f"https://query2.finance.yahoo.com/v10/finance/quoteSummary/{ticker}?modules=topHoldings", timeout=5, retries=0)
+    if res.status_code != 200:
+        return []
+    result = res.json().get("quoteSummary", {}).get("result", [])
+    if not result or not result[0].get("topHoldings"):
+        return []
+    return _clean(item["symbol"] for item in result[0]["topHoldings"].get("holdings", []) if item.get("symbol"))
+
+
+ENGINES = [("YFinance API", _engine_yfinance), ("StockAnalysis", _engine_stockanalysis), ("Yahoo JSON", _engine_yahoo_json)]
+
+
+def get_etf_holdings_triple_engine(ticker):
+    """三引擎獲取成分股：依序嘗試，被擋的來源由斷路器暫停，不再浪費請求"""
+    for source, engine in ENGINES:
+        breaker = net.breaker(source)
+        if not breaker.allow():
+            continue
+        try:
+            syms = engine(ticker)
+        except net.Blocked:
+            breaker.failure()
+            continue
+        except Exception:
+            continue  # 解析失敗不算被擋
+        breaker.success()
+        if syms: return syms[:15], source
+
     return [], "All Failed"
 
-def update():
-    print("   ↳ 💪 [Sector Strength] 正在下載板塊強弱度歷史股價...")
+
+def scan_holdings(tickers, workers=HOLDINGS_WORKERS):
+    """多執行緒掃描成分股，回傳 {ticker: (top_15, source)} (順序同 tickers)"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # metrics.submit 帶上目前的 scan 階段，worker 裡的請求才會算進 market.holdings
+        futures = [metrics.submit(executor, get_etf_holdings_triple_engine, t) for t in tickers]
+        return {t: f.result() for t, f in zip(tickers, futures)}
+
+def _all_tickers():
     all_tickers = [BENCHMARK]
     for group in PORTFOLIO_STRUCTURE.values():
         all_tickers.extend(group.keys())
-    all_tickers = list(set(all_tickers))
+    return sorted(set(all_tickers))
+
+def price_universe():
+    """共用股價倉庫預先補齊用的需求"""
+    return {t: runtime.start_date(START_DATE) for t in _all_tickers()}
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"      ⚠️ [Sector Strength] {path} 讀取失敗，視為空的: {e}")
+        return {}
+
+
+def _save_json(path, obj, indent):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+def _stale_tickers(tickers, holdings, meta, force=False):
+    """沒有成分股、沒有抓取紀錄、或抓取日超過 TTL 的 ETF"""
+    if force:
+        return list(tickers)
+    cutoff = f"{pd.Timestamp.today() - pd.Timedelta(days=HOLDINGS_TTL_DAYS):%Y-%m-%d}"
+    return [t for t in tickers if not holdings.get(t) or meta.get(t, {}).get("fetched_at", "") < cutoff]
+
+
+def update():
+    print("   ↳ 💪 [Sector Strength] 正在下載板塊強弱度歷史股價...")
+    all_tickers = _all_tickers()
     
     try:
-        yf_data = yf.download(all_tickers, start="2006-01-01", progress=False, auto_adjust=True, threads=True)
-        data = yf_data['Close'] if 'Close' in yf_data.columns else yf_data
-        data = data.ffill().dropna(how='all')
+        with metrics.stage("fetch") as s:
+            data = prices.get(all_tickers, runtime.start_date(START_DATE), field="Adj Close")
+            s.rows_out = len(data)
+        empty = [t for t in data.columns if data[t].isna().all()]
+        if empty:
+            print(f"      ⚠️ 沒有資料，不寫入: {empty}")
+            data = data.drop(columns=empty)
+        if data.columns.empty:
+            # 倉庫是空的 (快取被清掉 / 離線 / 被 Yahoo 擋)：不拿空檔蓋掉上一次的結果
+            raise RuntimeError("倉庫裡沒有任何 ETF 的報價，保留舊的 sector_strength.csv")
+        stale = [t for t in prices.problem_tickers(list(data.columns)) if t not in empty]
+        if stale:
+            print(f"      ⚠️ 最後一根 K 棒落後，只補 {FFILL_LIMIT} 天: {stale} (詳見 {prices.COVERAGE_PATH})")
+        # 只補零星缺值 (個別 ETF 停牌 / 晚報價)，不把抓不到的股票一路延伸成假的平盤
+        data = data.ffill(limit=FFILL_LIMIT).dropna(how='all')
         
         df_result = data.reset_index()
         if "Date" in df_result.columns: df_result.rename(columns={"Date": "date"}, inplace=True)
         if not os.path.exists("data"): os.makedirs("data")
         
-        df_result.to_csv("data/sector_strength.csv", index=False)
+        with metrics.stage("write") as s:
+            df_result.to_csv("data/sector_strength.csv.tmp", index=False)
+            os.replace("data/sector_strength.csv.tmp", "data/sector_strength.csv")
+            s.rows_out = len(df_result)
+            s.wrote("data/sector_strength.csv")
+            columnar.write(df_result, "data/sector_strength.csv")
         print("   ✅ [Sector Strength] 歷史股價儲存成功")
     except Exception as e:
         print(f"   ❌ [Sector Strength] 股價下載失敗: {e}")
+        raise
 
-    # ==========================================
-    # 執行成分股掃描
-    # ==========================================
-    print("   ↳ 🔍 [Sector Strength] 三引擎啟動：正在掃描最新成分股...")
-    etf_holdings = {}
-    
-    for group in PORTFOLIO_STRUCTURE.values():
-        for ticker in group.keys():
-            top_15, source = get_etf_holdings_triple_engine(ticker)
-            
-            if top_15:
-                etf_holdings[ticker] = top_15
-                print(f"      - {ticker}: 成功 ({len(top_15)}檔) [via {source}]")
-            else:
-                print(f"      - {ticker}: ❌ 抓取失敗 (三種引擎皆被擋)")
-                
-            time.sleep(0.5) # 保護 IP，暫停 0.5 秒
-            
-    if etf_holdings:
-        with open("data/etf_holdings.json", "w", encoding="utf-8") as f:
-            json.dump(etf_holdings, f, ensure_ascii=False, indent=4)
-        print(f"   ✅ [Sector Strength] 成功儲存 {len(etf_holdings)} 檔 ETF 的成分股清單")
-    else:
+
+def update_holdings(force=None):
+    """
+    成分股掃描 (排程器裡是獨立節點，不卡在股價的關鍵路徑上)：
+    只重抓過期的 ETF，抓失敗的保留舊資料 (抓取日不更新，下次再試)
+    """
+    if runtime.OFFLINE:
+        print("   📴 [Sector Strength] 離線模式：沿用現有成分股，略過掃描")
+        return
+    if force is None:
+        force = os.environ.get("BAMHI_FORCE_HOLDINGS") == "1"
+    tickers = [t for group in PORTFOLIO_STRUCTURE.values() for t in group.keys()]
+    holdings = _load_json(HOLDINGS_PATH)
+    meta = _load_json(HOLDINGS_META_PATH)
+
+    stale = _stale_tickers(tickers, holdings, meta, force)
+    if not stale:
+        print(f"   ✅ [Sector Strength] {len(tickers)} 檔 ETF 成分股都在 {HOLDINGS_TTL_DAYS} 天內抓過，略過掃描")
+        return
+
+    print(f"   ↳ 🔍 [Sector Strength] 三引擎啟動：{len(stale)}/{len(tickers)} 檔成分股過期，重新掃描...")
+    today = f"{pd.Timestamp.today():%Y-%m-%d}"
+    refreshed = 0
+    with metrics.stage("scan", rows_in=len(stale)) as s:
+        scanned = scan_holdings(stale)
+        s.rows_out = sum(1 for top_15, _ in scanned.values() if top_15)
+    for ticker, (top_15, source) in scanned.items():
+        if top_15:
+            holdings[ticker] = top_15
+            meta[ticker] = {"fetched_at": today, "source": source}
+            refreshed += 1
+            print(f"      - {ticker}: 成功 ({len(top_15)}檔) [via {source}]")
+        elif holdings.get(ticker):
+            print(f"      - {ticker}: ⚠️ 抓取失敗，沿用舊成分股 (抓取日 {meta.get(ticker, {}).get('fetched_at', '未知')})")
+        else:
+            print(f"      - {ticker}: ❌ 抓取失敗 (三種引擎皆被擋)")
+
+    # 只留下目前還在追蹤的 ETF
+    holdings = {t: holdings[t] for t in tickers if holdings.get(t)}
+    meta = {t: meta[t] for t in holdings if t in meta}
+    if not holdings:
         print("   ⚠️ [Sector Strength] 嚴重錯誤：三引擎皆未能抓取資料。")
+        raise RuntimeError("三種引擎都抓不到任何 ETF 成分股")
+    if not os.path.exists("data"): os.makedirs("data")
+    with metrics.stage("write") as s:
+        _save_json(HOLDINGS_PATH, holdings, indent=4)
+        _save_json(HOLDINGS_META_PATH, meta, indent=1)
+        s.rows_out = len(holdings)
+        s.wrote(HOLDINGS_PATH)
+        s.wrote(HOLDINGS_META_PATH)
+    print(f"   ✅ [Sector Strength] 更新 {refreshed} 檔，共儲存 {len(holdings)} 檔 ETF 的成分股清單")
 
 if __name__ == "__main__":
-    update()
\ No newline at end of file
+    update()
+    update_holdings()
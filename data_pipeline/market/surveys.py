@@ -0,0 +1,153 @@
+"""
+data_pipeline/market/surveys.py
+NAAIM / AAII 這類「每週一筆」情緒調查的共用增量合併工具
+- load_stored()：讀現有 CSV，清掉舊版合併留下的 SP500_Price_x / _y 欄位與重複日期
+- upsert()：只併入新的 (或被修正的) 調查列，回傳第一個變動的日期
+- update_ma_tail()：均線只從第一個變動日往後重算 (往前借 window-1 筆舊資料)
+- attach_sp500()：只替變動的日期 (與最後一筆) 從股價倉庫補 S&P 500 收盤價
+- load_history()：歷史 Excel 只用 openpyxl 解析一次，之後讀 data/.cache 裡以 workbook 雜湊命名的 pickle 快照
+"""
+import pandas as pd
+import numpy as np
+import os
+import glob
+from data_pipeline import prices
+from data_pipeline import metrics
+from data_pipeline import columnar
+from data_pipeline import digest
+
+PRICE_COL = "SP500_Price"
+PRICE_LOOKBACK_DAYS = 10  # 調查日碰到假日時 merge_asof 往回找收盤價的緩衝
+SNAPSHOT_DIR = os.path.join("data", ".cache", "snapshots")
+
+
+def clean(df, columns):
+    """日期正規化、去重 (同一天保留最後一筆)、只留指定欄位"""
+    if PRICE_COL in columns and PRICE_COL not in df.columns:
+        # 舊版 merge 留下的 _x / _y (_y 是後併進來的新值)，每列取最後一個有值的
+        legacy = sorted(c for c in df.columns if c.startswith(PRICE_COL + "_"))
+        if legacy:
+            df[PRICE_COL] = df[legacy].ffill(axis=1).iloc[:, -1]
+    for c in columns:
+        if c not in df.columns:
+            df[c] = np.nan
+    df = df[columns].copy()
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.tz_localize(None).dt.normalize()
+    df = df.dropna(subset=["Date"])
+    return df.drop_duplicates(subset=["Date"], keep="last").sort_values("Date").reset_index(drop=True)
+
+
+def load_stored(path, columns, ma_col):
+    """
+    讀現有 CSV，回傳 (清理後的 DataFrame, 需要重算的起始日期)。
+    檔案不存在回傳 (None, None)；有重複日期 / 缺均線欄位時，起始日期 = 最早一筆 (整段重算一次)
+    """
+    if not os.path.exists(path):
+        return None, None
+    try:
+        raw = pd.read_csv(path)
+    except Exception as e:
+        print(f"      ⚠️ 無法讀取 {path}，改為重建: {e}")
+        return None, None
+    if raw.empty:
+        return None, None
+    df = clean(raw, columns)
+    dirty = len(df) != len(raw) or ma_col not in raw.columns or any(c.startswith(PRICE_COL + "_") for c in raw.columns)
+    if dirty:
+        print(f"      🧹 {os.path.basename(path)} 清掉 {len(raw) - len(df)} 筆重複日期 / 舊版欄位，整段重算一次")
+    return df, (df["Date"].iloc[0] if dirty and not df.empty else None)
+
+
+def upsert(stored, fresh, value_cols):
+    """把 fresh 併進 stored (同日期以 fresh 為準)，回傳 (合併結果, 第一個新增 / 數值有變動的日期 或 None)"""
+    if fresh is None or fresh.empty:
+        return stored, None
+    fresh = fresh.drop_duplicates(subset=["Date"], keep="last").set_index("Date")[value_cols]
+    old = stored.set_index("Date")[value_cols]
+
+    common = fresh.index.intersection(old.index)
+    same = np.isclose(fresh.loc[common].to_numpy(dtype=float), old.loc[common].to_numpy(dtype=float), equal_nan=True).all(axis=1)
+    changed = fresh.index.difference(old.index).union(common[~same])
+    if changed.empty:
+        return stored, None
+
+    rows = fresh.loc[changed].reset_index()
+    merged = pd.concat([stored[~stored["Date"].isin(changed)], rows], ignore_index=True)
+    merged = merged.sort_values("Date").reset_index(drop=True)
+    return merged, changed.min()
+
+
+def update_ma_tail(df, value_col, ma_col, since, window=20):
+    """只重算 since 之後的均線；往前借 window-1 筆舊值，結果與整段 rolling 相同"""
+    pos = int(df["Date"].searchsorted(since))
+    lo = max(pos - (window - 1), 0)
+    ma = df[value_col].iloc[lo:].astype(float).rolling(window=window).mean()
+    df.loc[df.index[pos:], ma_col] = ma.iloc[pos - lo:].to_numpy()
+    return df
+
+
+def price_mask(df, since):
+    """需要補收盤價的列：since 之後、收盤價還是空的、以及最後一筆 (可能當時還沒收盤)"""
+    mask = (df["Date"] >= since) | df[PRICE_COL].isna()
+    mask.iloc[-1] = True
+    return mask
+
+
+def merge_prices(df, mask, sp500):
+    """把 sp500 (以日期為 index 的收盤價) 用 merge_asof 往回對齊，填進 mask 的列"""
+    sp500 = sp500.reset_index()
+    sp500.columns = ["Date", PRICE_COL]
+    sp500["Date"] = sp500["Date"].astype("datetime64[ns]")
+    left = df.loc[mask, ["Date"]].astype("datetime64[ns]")
+    matched = pd.merge_asof(left, sp500, on="Date", direction="backward")
+    df.loc[mask, PRICE_COL] = matched[PRICE_COL].to_numpy()
+    return df
+
+
+def attach_sp500(df, since, earliest):
+    """替 since 之後的列 (以及收盤價還是空的列) 補 S&P 500 收盤價，其餘沿用已存的值；earliest = 倉庫裡 ^GSPC 的起點"""
+    mask = price_mask(df, since)
+    start = max(df.loc[mask, "Date"].min() - pd.Timedelta(days=PRICE_LOOKBACK_DAYS), pd.Timestamp(earliest))
+    try:
+        sp500 = prices.get(["^GSPC"], f"{start:%Y-%m-%d}", field="Close")["^GSPC"].dropna()
+    except Exception as e:
+        print(f"      [Error] S&P 500 讀取失敗: {e}")
+        return df
+    if sp500.empty:
+        return df
+    return merge_prices(df, mask, sp500)
+
+
+def save(df, path):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with metrics.stage("write") as s:
+        tmp_path = path + ".tmp"
+        df.to_csv(tmp_path, index=False, date_format="%Y-%m-%d")
+        os.replace(tmp_path, path)
+        s.rows_out = len(df)
+        s.wrote(path)
+        columnar.write(df, path)
+
+
+def load_history(xlsx_path, parse):
+    """
+    讀取歷史 Excel 的正規化結果：parse(xlsx_path) 只在 workbook 內容變了 (雜湊不同) 時才跑，
+    結果存成 data/.cache/snapshots/<檔名>-<雜湊>.pkl，之後直接讀快照
+    """
+    name = os.path.splitext(os.path.basename(xlsx_path))[0]
+    snapshot = os.path.join(SNAPSHOT_DIR, f"{name}-{digest.sha256(xlsx_path)[:16]}.pkl")
+    if os.path.exists(snapshot):
+        try:
+            return pd.read_pickle(snapshot)
+        except Exception as e:
+            print(f"      ⚠️ 快照 {snapshot} 損毀，重新解析 Excel: {e}")
+
+    print(f"      📖 解析 {os.path.basename(xlsx_path)} (openpyxl，只在檔案變動時執行一次)")
+    df = parse(xlsx_path)
+    if not os.path.exists(SNAPSHOT_DIR): os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for old in glob.glob(os.path.join(SNAPSHOT_DIR, f"{glob.escape(name)}-*.pkl")):
+        os.remove(old)
+    df.to_pickle(snapshot + ".tmp")
+    os.replace(snapshot + ".tmp", snapshot)
+    return df
@@ -2,9 +2,12 @@
 data_pipeline/market/world_sectors.py
 負責抓取龜族世界觀 (全球板塊與資產) 的日線收盤價
 """
-import yfinance as yf
 import pandas as pd
 import os
+from data_pipeline import prices
+from data_pipeline import metrics
+from data_pipeline import runtime
+from data_pipeline import columnar
 
 DATA_DIR = "data"
 FILE_PATH = os.path.join(DATA_DIR, "world_sectors.csv")
@@ -65,17 +68,41 @@ PORTFOLIO_STRUCTURE = {
     }
 }
 
+def _tickers():
+    tickers = []
+    for group in PORTFOLIO_STRUCTURE.values():
+        tickers.extend(group.keys())
+    return sorted(set(tickers))
+
+def _start_date():
+    # 抓取過去 1 年的資料，確保有足夠的日數可以計算 120D 波動率
+    return runtime.start_date(pd.Timestamp.today() - pd.DateOffset(years=1))
+
+def price_universe():
+    """共用股價倉庫預先補齊用的需求"""
+    return {t: _start_date() for t in _tickers()}
+
 def update():
     print("   ↳ 🐢 [World Sectors] 正在更新龜族世界觀資產報價...")
     
-    TICKERS = []
-    for group in PORTFOLIO_STRUCTURE.values():
-        TICKERS.extend(group.keys())
-    TICKERS = list(set(TICKERS))
+    TICKERS = _tickers()
     
     try:
-        # 抓取過去 1 年的資料，確保有足夠的日數可以計算 120D 波動率
-        df = yf.download(TICKERS, period="1y", progress=False, auto_adjust=False)['Close']
+        with metrics.stage("fetch", rows_in=len(TICKERS)) as s:
+            df = prices.get(TICKERS, _start_date(), field="Close")
+            s.rows_out = len(df)
+        
+        # 倉庫裡完全沒有資料的 (例如 ARS) 不寫空欄位，資料落後的列出來
+        empty = [t for t in df.columns if df[t].isna().all()]
+        if empty:
+            print(f"      ⚠️ 沒有資料，不寫入: {empty}")
+            df = df.drop(columns=empty)
+        if df.columns.empty:
+            # 倉庫是空的 (快取被清掉 / 離線 / 被 Yahoo 擋)：不拿空檔蓋掉上一次的結果
+            raise RuntimeError("倉庫裡沒有任何資產的報價，保留舊的 world_sectors.csv")
+        stale = [t for t in prices.problem_tickers(list(df.columns)) if t not in empty]
+        if stale:
+            print(f"      ⚠️ 最後一根 K 棒落後其他資產: {stale} (詳見 {prices.COVERAGE_PATH})")
         
         # 整理格式
         df = df.reset_index()
@@ -86,8 +113,15 @@ def update():
         if not os.path.exists(DATA_DIR):
             os.makedirs(DATA_DIR)
             
-        df.to_csv(FILE_PATH, index=False)
+        with metrics.stage("write") as s:
+            tmp_path = FILE_PATH + ".tmp"
+            df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, FILE_PATH)
+            s.rows_out = len(df)
+            s.wrote(FILE_PATH)
+            columnar.write(df, FILE_PATH)
         print(f"   ✅ [World Sectors] 儲存成功，共 {len(df.columns)-1} 檔資產。")
         
     except Exception as e:
         print(f"      [Error] World Sectors 下載失敗: {e}")
+        raise
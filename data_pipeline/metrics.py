@@ -0,0 +1,196 @@
+"""
+data_pipeline/metrics.py
+流水線量測：每個階段 (抓取 / 計算 / 寫檔) 記錄牆鐘時間、CPU 時間、記憶體高水位、進出筆數、寫出位元組與對外請求次數
+- with metrics.stage("market.breadth/fetch") as s: ... s.rows_out = len(df)
+  階段可以巢狀，名稱會接在外層後面；階段堆疊放在 contextvars 裡，排程器同時跑的節點不會互相干擾，
+  節點內自己開的執行緒池用 metrics.submit(executor, fn, ...) 送工作，請求才會算進目前的階段
+- 同一個節點裡重複的階段名稱，匯出 Prometheus 時會合併成一筆 (時間 / 筆數 / 位元組 / 請求數相加)
+- process_peak_rss_mb 是整個行程到該階段結束為止的記憶體高水位 (ru_maxrss)，不是該階段自己用掉的量
+- CPU 時間用 time.thread_time()，只算該執行緒 (yfinance 內部開的下載執行緒不含在內)
+- count_request("yahoo")：對外請求計數，同時記在目前的階段與整次執行
+- write_reports()：data/reports/run_report.json (本次)、pipeline.prom (Prometheus 文字格式)，
+  以及逐次追加的 data/.cache/run_history.jsonl (跟著流水線狀態快取保存，不進 git)
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+try:
+    import resource  # Windows 沒有，記憶體高水位就不記錄
+except ImportError:
+    resource = None
+
+REPORT_DIR = os.path.join("data", "reports")
+RUN_REPORT_PATH = os.path.join(REPORT_DIR, "run_report.json")
+RUN_HISTORY_PATH = os.path.join("data", ".cache", "run_history.jsonl")
+PROM_PATH = os.path.join(REPORT_DIR, "pipeline.prom")
+
+_lock = threading.Lock()
+_stack_var = contextvars.ContextVar("bamhi_stage_stack", default=())  # 目前 context 的階段堆疊 (tuple，外層在前)
+_stages = []     # 已結束的階段 (依結束順序)
+_requests = {}   # 整次執行的對外請求 {目標: 次數}
+_started = time.time()
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # Linux 的 ru_maxrss 單位是 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes_written = 0
+        self.requests = {}
+        self.status = "ok"
+
+    def wrote(self, path):
+        """記錄寫出的檔案大小"""
+        if os.path.exists(path):
+            with _lock:
+                self.bytes_written += os.path.getsize(path)
+
+
+def _stack():
+    return _stack_var.get()
+
+
+def submit(executor, fn, *args, **kwargs):
+    """把工作送進執行緒池，並帶上目前的階段 (worker 裡的對外請求才會算進這個階段)"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def current():
+    """目前最內層的階段 (沒有就回傳 None)"""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    stack = _stack()
+    full_name = f"{stack[-1].name}/{name}" if stack else name
+    s = Stage(full_name, rows_in)
+    token = _stack_var.set(stack + (s,))
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield s
+    except BaseException:
+        s.status = "error"
+        raise
+    finally:
+        _stack_var.reset(token)
+        with _lock:
+            record = {
+                "stage": s.name, "status": s.status,
+                "wall_s": round(time.perf_counter() - wall, 3), "cpu_s": round(time.thread_time() - cpu, 3),
+                "process_peak_rss_mb": _peak_rss_mb(), "rows_in": s.rows_in, "rows_out": s.rows_out,
+                "bytes_written": s.bytes_written, "requests": dict(s.requests),
+            }
+            # 寫出的位元組也算進外層階段 (請求數在 count_request 時已經逐層記過)
+            if stack:
+                stack[-1].bytes_written += s.bytes_written
+            _stages.append(record)
+
+
+def wrote(path):
+    """記錄目前階段寫出的檔案 (不在任何階段裡就忽略)"""
+    s = current()
+    if s is not None:
+        s.wrote(path)
+
+
+def count_request(target, n=1):
+    with _lock:
+        _requests[target] = _requests.get(target, 0) + n
+        for s in _stack():
+            s.requests[target] = s.requests.get(target, 0) + n
+
+
+def snapshot():
+    with _lock:
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)),
+            "wall_s": round(time.time() - _started, 3),
+            "peak_rss_mb": _peak_rss_mb(),
+            "requests": dict(_requests),
+            "stages": list(_stages),
+        }
+
+
+def _prom_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _merge_stages(stages):
+    """同名的階段合併成一筆 (Prometheus 同一組 label 只能有一個樣本)，保留第一次出現的順序"""
+    merged = {}
+    for s in stages:
+        m = merged.get(s["stage"])
+        if m is None:
+            merged[s["stage"]] = {**s, "requests": dict(s["requests"])}
+            continue
+        for key in ("wall_s", "cpu_s", "rows_in", "rows_out", "bytes_written"):
+            if s[key] is not None:
+                m[key] = round((m[key] or 0) + s[key], 3)
+        for t, n in s["requests"].items():
+            m["requests"][t] = m["requests"].get(t, 0) + n
+        if s["status"] != "ok":
+            m["status"] = s["status"]
+    return list(merged.values())
+
+
+def _prometheus(report):
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ",".join(f'{k}="{_prom_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    stages = _merge_stages(report["stages"])
+    metric("bamhi_run_timestamp_seconds", "Pipeline run start time", [({}, int(_started))])
+    metric("bamhi_run_wall_seconds", "Pipeline run wall time", [({}, report["wall_s"])])
+    metric("bamhi_run_peak_rss_megabytes", "Peak resident memory of the run", [({}, report["peak_rss_mb"])])
+    metric("bamhi_run_requests", "Outbound requests in the run", [({"target": t}, n) for t, n in sorted(report["requests"].items())])
+    metric("bamhi_stage_wall_seconds", "Wall time per stage", [({"stage": s["stage"]}, s["wall_s"]) for s in stages])
+    metric("bamhi_stage_cpu_seconds", "Thread CPU time per stage", [({"stage": s["stage"]}, s["cpu_s"]) for s in stages])
+    metric("bamhi_stage_rows_in", "Rows read per stage", [({"stage": s["stage"]}, s["rows_in"]) for s in stages])
+    metric("bamhi_stage_rows_out", "Rows produced per stage", [({"stage": s["stage"]}, s["rows_out"]) for s in stages])
+    metric("bamhi_stage_bytes_written", "Bytes written per stage", [({"stage": s["stage"]}, s["bytes_written"]) for s in stages])
+    metric("bamhi_stage_requests", "Outbound requests per stage",
+           [({"stage": s["stage"], "target": t}, n) for s in stages for t, n in sorted(s["requests"].items())])
+    metric("bamhi_stage_ok", "1 if the stage finished without raising", [({"stage": s["stage"]}, int(s["status"] == "ok")) for s in stages])
+    if "tasks" in report:
+        metric("bamhi_task_ok", "1 if the scheduler node succeeded",
+               [({"task": name, "status": r["status"]}, int(r["status"] == "ok")) for name, r in report["tasks"].items()])
+    return "\n".join(lines) + "\n"
+
+
+def write_reports(tasks=None):
+    """寫出本次執行的報告；tasks = 排程器回傳的節點結果"""
+    report = snapshot()
+    if tasks is not None:
+        report["tasks"] = tasks
+    for d in (REPORT_DIR, os.path.dirname(RUN_HISTORY_PATH)):
+        if not os.path.exists(d): os.makedirs(d, exist_ok=True)
+    with open(RUN_REPORT_PATH + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(RUN_REPORT_PATH + ".tmp", RUN_REPORT_PATH)
+    with open(RUN_HISTORY_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False) + "\n")
+    with open(PROM_PATH + ".tmp", "w", encoding="utf-8") as f:
+        f.write(_prometheus(report))
+    os.replace(PROM_PATH + ".tmp", PROM_PATH)
+    return report
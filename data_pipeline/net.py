@@ -0,0 +1,284 @@
+"""
+data_pipeline/net.py
+共用 HTTP 客戶端：流水線所有爬蟲都走 get()
+- session()：整個行程共用一個 requests.Session (keep-alive 連線池)，同一個主機不用每次重新握手
+- limiter(host)：每個來源主機一個令牌桶 (token bucket)，多執行緒一起打也不會超過設定的速率
+- 每個主機另有同時連線數上限 (HOST_CONCURRENCY)
+- 暫時性錯誤 (逾時 / 429 / 5xx) 有限次重試，退避時間加上隨機抖動，避免大家同時重試
+- breaker(source)：每個來源一個斷路器，連續被擋 (429 / 403 / 逾時) 就暫停使用該來源，不再硬打
+- cache=True 時回應存進 data/.cache/http (以 URL 為 key)：同一天重跑直接用快取，
+  隔天帶 ETag / Last-Modified 條件請求，伺服器回 304 就沿用舊內容
+- 模擬資料來源 (providers，remote=False)：請求直接交給 provider，不經過限速 / 快取
+- 離線模式 (runtime.OFFLINE)：不連網，有快取就重播 (不管是哪天抓的)，沒有就丟 Blocked
+"""
+import threading
+import time
+import random
+import os
+import json
+import hashlib
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from data_pipeline import metrics
+from data_pipeline import runtime
+from data_pipeline import providers
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+POOL_SIZE = 16
+TIMEOUT = 10
+
+# 模擬瀏覽器的標頭 (NAAIM / AAII 不帶這些會被擋)
+BROWSER_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-User": "?1",
+    "Cache-Control": "max-age=0",
+}
+
+# 每個主機的速率上限：(每秒幾個請求, 最多可以連續爆發幾個)
+HOST_LIMITS = {
+    "query1.finance.yahoo.com": (3, 3),
+    "query2.finance.yahoo.com": (3, 3),
+    "stockanalysis.com": (2, 2),
+}
+DEFAULT_LIMIT = (2, 2)
+HOST_CONCURRENCY = {}   # 每個主機同時連線數上限，沒列的用 DEFAULT_CONCURRENCY
+DEFAULT_CONCURRENCY = 4
+
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 1     # 第 n 次重試等 BACKOFF_SECONDS × 2^n × (0.5~1.5 的隨機抖動)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+CACHE_DIR = os.path.join("data", ".cache", "http")
+
+BREAKER_THRESHOLD = 3   # 連續被擋幾次就跳脫
+BREAKER_COOLDOWN = 300  # 跳脫後暫停幾秒 (之後放一個請求試探)
+BLOCKED_STATUS = (403, 429, 503)
+
+_lock = threading.Lock()
+_session = None
+_limiters = {}
+_semaphores = {}
+_breakers = {}
+
+
+class TokenBucket:
+    """令牌桶：每秒補 rate 個令牌，最多存 burst 個；acquire() 拿不到就睡到有為止"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """斷路器：連續 threshold 次被擋就打開，cooldown 秒內 allow() 都回 False，之後放一個請求試探"""
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = time.monotonic()  # 半開：只放這一個，失敗就再等一輪
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                print(f"      🔌 [Net] {self.name} 連續被擋 {self.failures} 次，暫停使用 {self.cooldown} 秒")
+            elif self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class Blocked(Exception):
+    """來源主機擋我們 (429 / 403 / 503 / 逾時)"""
+
+
+def session():
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            s.headers.update({"User-Agent": USER_AGENT})
+            _session = s
+        return _session
+
+
+def limiter(host):
+    with _lock:
+        if host not in _limiters:
+            _limiters[host] = TokenBucket(*HOST_LIMITS.get(host, DEFAULT_LIMIT))
+        return _limiters[host]
+
+
+def _semaphore(host):
+    with _lock:
+        if host not in _semaphores:
+            _semaphores[host] = threading.BoundedSemaphore(HOST_CONCURRENCY.get(host, DEFAULT_CONCURRENCY))
+        return _semaphores[host]
+
+
+def breaker(source):
+    with _lock:
+        if source not in _breakers:
+            _breakers[source] = CircuitBreaker(source)
+        return _breakers[source]
+
+
+# ==========================================
+# 磁碟快取 (以 URL 為 key)
+# ==========================================
+def _cache_paths(url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".json"), os.path.join(CACHE_DIR, key + ".body")
+
+
+def _cache_read(url):
+    meta_path, body_path = _cache_paths(url)
+    if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("url") != url:
+            return None
+        with open(body_path, "rb") as f:
+            meta["body"] = f.read()
+        return meta
+    except Exception:
+        return None
+
+
+def _cache_write(url, res=None, entry=None):
+    """存新的 200 回應 (res)，或只更新舊快取的檢查時間 (304 時傳 entry)"""
+    if not os.path.exists(CACHE_DIR): os.makedirs(CACHE_DIR, exist_ok=True)
+    meta_path, body_path = _cache_paths(url)
+    if res is not None:
+        entry = {
+            "url": url,
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "content_type": res.headers.get("Content-Type"),
+            "encoding": res.encoding,
+            "body": res.content,
+        }
+        with open(body_path + ".tmp", "wb") as f:
+            f.write(entry["body"])
+        os.replace(body_path + ".tmp", body_path)
+    entry["fetched_on"] = time.strftime("%Y-%m-%d")
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({k: v for k, v in entry.items() if k != "body"}, f, ensure_ascii=False)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _cached_response(url, entry):
+    res = requests.models.Response()
+    res.url = url
+    res.status_code = 200
+    res._content = entry["body"]
+    res.encoding = entry.get("encoding")
+    res.headers = CaseInsensitiveDict({"Content-Type": entry.get("content_type") or ""})
+    res.from_cache = True
+    return res
+
+
+# ==========================================
+# GET
+# ==========================================
+def get(url, headers=None, timeout=TIMEOUT, retries=MAX_RETRIES, cache=False):
+    """
+    經過速率 / 連線數限制的 GET (共用連線池)。
+    - 逾時 / 連線錯誤 / RETRY_STATUS：重試 retries 次 (抖動退避)，仍失敗丟 Blocked
+    - 403 等 BLOCKED_STATUS：直接丟 Blocked (重試只會被擋得更久)
+    - 其他狀態碼照常回傳給呼叫端判斷
+    - cache=True：今天抓過就直接回傳快取；否則帶 ETag / Last-Modified 條件請求
+    - 離線模式：只重播磁碟快取
+    """
+    provider = providers.current()
+    if not provider.remote:
+        metrics.count_request(provider.name)
+        res = provider.http_get(url, headers=headers, timeout=timeout)
+        res.from_cache = False
+        return res
+
+    if runtime.OFFLINE:
+        entry = _cache_read(url)
+        if entry is None:
+            raise Blocked(f"離線模式：{url} 沒有快取")
+        return _cached_response(url, entry)
+
+    entry = _cache_read(url) if cache else None
+    if entry is not None and entry.get("fetched_on") == time.strftime("%Y-%m-%d"):
+        return _cached_response(url, entry)
+
+    headers = dict(headers or {})
+    if entry is not None:
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+
+    host = urlparse(url).hostname
+    for attempt in range(retries + 1):
+        limiter(host).acquire()
+        metrics.count_request(host)
+        wait = None
+        try:
+            with _semaphore(host):
+                res = session().get(url, headers=headers, timeout=timeout)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            error = f"{host}: {e}"
+        else:
+            if res.status_code == 304 and entry is not None:
+                _cache_write(url, entry=entry)
+                return _cached_response(url, entry)
+            if res.status_code not in RETRY_STATUS and res.status_code not in BLOCKED_STATUS:
+                if cache and res.status_code == 200:
+                    _cache_write(url, res=res)
+                res.from_cache = False
+                return res
+            error = f"{host}: HTTP {res.status_code}"
+            if res.status_code not in RETRY_STATUS:
+                break
+            retry_after = res.headers.get("Retry-After", "")
+            wait = min(float(retry_after), 60) if retry_after.isdigit() else None
+        if attempt < retries:
+            time.sleep(wait if wait is not None else BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+    raise Blocked(error)
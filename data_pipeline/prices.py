@@ -0,0 +1,495 @@
+"""
+data_pipeline/prices.py
+共用股價倉庫 (Price Warehouse)：所有流水線模組都從這裡拿日線 OHLCV，不再各自呼叫 yf.download
+- 每檔股票一個欄式二進位檔 data/.cache/prices/<ticker>.npz (dates + open/high/low/close/factor/volume，float32)
+- 存原始 (未還原股息) 價格 + 還原因子 factor (= Adj Close / Close)；還原價 = close × factor
+- 除權息 / 分割出現時，用重疊區間的新舊報價比值一次向量化乘回整段歷史，永遠只需要下載新的 K 棒
+  (尾段下載往回重疊 RECONCILE_OVERLAP_DAYS 天；最後一根重疊 K 棒可能被 Yahoo 修正過，不拿來判斷，
+   其餘至少 RECONCILE_MIN_BARS 根的比值一致才算公司行動)
+- 還沒收盤的交易日 (美東 SETTLE_TIME 之前的當天 K 棒) 不寫進倉庫，避免盤中價被當成收盤價
+- manifest.json 記錄每檔股票已涵蓋的區間 (start / end) 與最後一次檢查日 (checked)
+- ensure() 只下載缺少的區間 (前段缺口 + 最後一天之後)，而且同一天每檔只會去 Yahoo 問一次
+- 下載依 SHARD_SIZE 分片，每片完成就寫入倉庫，中途被擋的話下次會從沒完成的股票接著抓
+- 整批下載後檢查每檔的結果：有回資料的分片裡空的、或最後一根 K 棒比同批其他股票舊 (short) 的，才單獨退避重試
+  (整片都失敗的多半是被擋，不逐檔重試，記成 empty 留給下一次執行；整次執行的單獨重試最多花 RETRY_BUDGET_SECONDS 秒)
+- 每次執行把各檔的下載結果寫成 data/reports/coverage.json (ok / retried / short / empty / cached)
+- 離線模式 (runtime.OFFLINE)：ensure() 不下載，只用倉庫裡已有的資料
+- 可以被排程器的多個執行緒同時呼叫：manifest / 倉庫檔的讀改寫用 _LOCK 保護，下載用 _YF_LOCK 一次只跑一個
+"""
+import pandas as pd
+import numpy as np
+import os
+import json
+import time
+import threading
+from urllib.parse import quote
+from data_pipeline import metrics
+from data_pipeline import runtime
+from data_pipeline import providers
+
+DATA_DIR = "data"
+WAREHOUSE_DIR = os.path.join(DATA_DIR, ".cache", "prices")
+MANIFEST_PATH = os.path.join(WAREHOUSE_DIR, "manifest.json")
+
+FIELDS = {"Open": "open", "High": "high", "Low": "low", "Close": "close", "Adj Close": "adj_close", "Volume": "volume"}
+COLUMNS = ["open", "high", "low", "close", "factor", "volume"]   # 倉庫實際存的欄位
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+ADJUST_TOLERANCE = 1e-4  # 重疊日的新舊比值偏離 1 超過這個值，才視為有公司行動
+RECONCILE_OVERLAP_DAYS = 10  # 尾段下載往回重疊的日曆天數 (約 6~7 根 K 棒)
+RECONCILE_MIN_BARS = 3       # 扣掉最後一根後，至少要這麼多根重疊 K 棒的比值一致
+MARKET_TZ = "America/New_York"
+SETTLE_TIME = "17:00"        # 美東這個時間之後，當天的 K 棒才視為已收盤
+
+SHARD_SIZE = 50     # 每個下載分片的股票數
+MAX_RETRIES = 3     # 分片 / 單一股票的重試次數
+BACKOFF_SECONDS = 2 # 重試等待：2s, 4s, 8s ...
+RETRY_BUDGET_SECONDS = 60  # 整次執行單獨重試股票的總時間上限 (含退避等待)，用完剩下的留給下一次執行
+
+REPORT_DIR = os.path.join(DATA_DIR, "reports")
+COVERAGE_PATH = os.path.join(REPORT_DIR, "coverage.json")
+
+_LOCK = threading.RLock()   # manifest 與倉庫檔的讀改寫
+_YF_LOCK = threading.Lock() # yf.download 內部用全域 dict 收結果，同時呼叫會互相覆蓋
+_MANIFEST = None            # 整個行程共用一份 manifest，多個模組同時 ensure 才不會互相蓋掉紀錄
+_RUN = {}                   # 本次執行每檔股票的下載結果 {ticker: status}
+_RETRY_SPENT = 0.0          # 本次執行單獨重試已經花掉的秒數 (多個模組共用同一個預算)
+
+
+# ==========================================
+# 倉庫檔案讀寫
+# ==========================================
+def _path(ticker):
+    return os.path.join(WAREHOUSE_DIR, quote(ticker, safe="") + ".npz")
+
+
+def _load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"      ⚠️ [Prices] manifest 損毀，視為空倉庫: {e}")
+        return {}
+
+
+def _manifest():
+    global _MANIFEST
+    with _LOCK:
+        if _MANIFEST is None:
+            _MANIFEST = _load_manifest()
+        return _MANIFEST
+
+
+def _save_manifest(manifest):
+    if not os.path.exists(WAREHOUSE_DIR): os.makedirs(WAREHOUSE_DIR)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def _read(ticker):
+    """讀取單一股票的倉庫檔，回傳以日期為 index 的 DataFrame (欄位 = COLUMNS)"""
+    path = _path(ticker)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([]), dtype='float32')
+    with np.load(path) as f:
+        cols = {c: f[c] for c in f.files if c != "dates"}
+        index = pd.DatetimeIndex(f["dates"])
+    if "factor" not in cols:
+        # 舊版倉庫檔存的是 adj_close，轉成還原因子
+        cols["factor"] = (cols.pop("adj_close") / cols["close"]).astype('float32')
+    return pd.DataFrame({c: cols[c] for c in COLUMNS}, index=index)
+
+
+def _write(ticker, df):
+    if not os.path.exists(WAREHOUSE_DIR): os.makedirs(WAREHOUSE_DIR)
+    tmp_path = _path(ticker) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, dates=df.index.values.astype("datetime64[D]"),
+                 **{c: df[c].to_numpy(dtype='float32') for c in COLUMNS})
+    os.replace(tmp_path, _path(ticker))
+
+
+def agreed_ratio(old, new):
+    """
+    重疊區間 (K 棒 × 股票) 的新舊報價 -> 每檔股票的公司行動比值 (沒有公司行動就是 1.0)。
+    最後一列 (最新的重疊 K 棒) 可能是盤中價或被修正過的收盤價，不列入判斷；
+    其餘有效比值至少 RECONCILE_MIN_BARS 個、彼此一致 (都在中位數的容忍範圍內) 而且偏離 1，才算公司行動
+    """
+    old = np.asarray(old, dtype='float64').reshape(len(old), -1)[:-1]
+    new = np.asarray(new, dtype='float64').reshape(len(new), -1)[:-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratios = new / old
+    ratios[~np.isfinite(ratios)] = np.nan
+    result = np.ones(ratios.shape[1])
+    enough = np.sum(~np.isnan(ratios), axis=0) >= RECONCILE_MIN_BARS
+    if not enough.any():
+        return result
+    median = np.nanmedian(ratios[:, enough], axis=0)
+    spread = np.nanmax(np.abs(ratios[:, enough] / median - 1), axis=0)
+    agreed = (spread <= ADJUST_TOLERANCE) & (np.abs(median - 1) > ADJUST_TOLERANCE)
+    result[np.flatnonzero(enough)[agreed]] = median[agreed]
+    return result
+
+
+def _reconcile(stored, fresh):
+    """
+    用新舊資料的重疊區間偵測公司行動，直接把舊歷史乘上比值 (就地、向量化)：
+    - 分割：Yahoo 的 Close 已做分割調整，重疊區間的 close 全部等比例變動 -> OHLC × 比值、成交量 ÷ 比值
+    - 除息：Close 不變但 Adj Close 變 -> factor × 比值
+    只有最後一根重疊 K 棒不同 (盤中價 / 事後修正) 不算公司行動，合併時直接以新資料覆蓋那一天
+    """
+    overlap = stored.index.intersection(fresh.index)
+    if overlap.empty:
+        return stored
+    old, new = stored.loc[overlap], fresh.loc[overlap]
+
+    split_ratio = agreed_ratio(old["close"], new["close"])[0]
+    if split_ratio != 1:
+        print(f"      🔧 [Prices] 偵測到分割 (比值 {split_ratio:.4f})，重新縮放歷史")
+        stored[PRICE_COLUMNS] = stored[PRICE_COLUMNS] * np.float32(split_ratio)
+        stored["volume"] = stored["volume"] / np.float32(split_ratio)
+
+    factor_ratio = agreed_ratio(old["factor"], new["factor"])[0]
+    if factor_ratio != 1:
+        stored["factor"] = stored["factor"] * np.float32(factor_ratio)
+    return stored
+
+
+def _settled(fresh, now=None):
+    """去掉還沒收盤的交易日 (美東當天、SETTLE_TIME 之前) 與之後的 K 棒"""
+    now = pd.Timestamp.now(tz=MARKET_TZ) if now is None else now
+    session = now.tz_localize(None).normalize()
+    if now.strftime("%H:%M") < SETTLE_TIME:
+        return fresh[fresh.index < session]
+    return fresh[fresh.index <= session]
+
+
+def _merge(ticker, fresh):
+    """把新下載的資料併入倉庫檔 (重疊的日期以新資料為準，舊歷史先依公司行動重新縮放)，回傳最後一筆日期"""
+    with _LOCK:
+        stored = _read(ticker)
+        fresh = _settled(fresh.dropna(subset=["close"]))
+        if fresh.empty:
+            return stored.index.max() if not stored.empty else None
+        stored = _reconcile(stored, fresh)
+        merged = pd.concat([stored[~stored.index.isin(fresh.index)], fresh]).sort_index()
+        _write(ticker, merged)
+        return merged.index.max()
+
+
+# ==========================================
+# 下載 (分片 + 退避重試)
+# ==========================================
+def _split_fields(raw, tickers):
+    """yf.download (auto_adjust=False) 的結果 -> {ticker: DataFrame(open/high/.../volume)}"""
+    out = {}
+    if raw is None or raw.empty:
+        return out
+    if not isinstance(raw.columns, pd.MultiIndex):
+        raw = pd.concat({tickers[0]: raw}, axis=1).swaplevel(0, 1, axis=1)
+    index = pd.DatetimeIndex(raw.index).tz_localize(None).normalize()
+    for t in tickers:
+        cols = {}
+        for field, name in FIELDS.items():
+            if (field, t) in raw.columns:
+                cols[name] = raw[(field, t)].to_numpy(dtype='float32')
+            else:
+                cols[name] = np.full(len(raw), np.nan, dtype='float32')
+        df = pd.DataFrame(cols, index=index)
+        df["factor"] = (df.pop("adj_close") / df["close"]).astype('float32')
+        if df["close"].notna().any():
+            out[t] = df
+    return out
+
+
+def _download(tickers, start, end=None):
+    """下載一批股票；整批都是空的 (通常是被 Yahoo 擋) 就退避重試，最後仍失敗回傳空 dict"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            metrics.count_request("yfinance")
+            with _YF_LOCK:
+                raw = providers.current().download(tickers, start=start, end=end, auto_adjust=False, threads=True)
+            frames = _split_fields(raw, tickers)
+            if frames:
+                return frames
+            error = "整批沒有資料"
+        except Exception as e:
+            error = e
+        if attempt < MAX_RETRIES:
+            wait = BACKOFF_SECONDS * 2 ** attempt
+            print(f"      ⏳ [Prices] 下載失敗 ({error})，{wait} 秒後重試...")
+            time.sleep(wait)
+    print(f"      ⚠️ [Prices] {tickers[0]}..{tickers[-1]} 下載失敗: {error}")
+    return {}
+
+
+def _last_bar(df):
+    closes = df["close"].dropna()
+    return closes.index.max() if not closes.empty else None
+
+
+def _retry_budget_left():
+    with _LOCK:
+        return RETRY_BUDGET_SECONDS - _RETRY_SPENT
+
+
+def _spend_retry(seconds):
+    global _RETRY_SPENT
+    with _LOCK:
+        _RETRY_SPENT += seconds
+
+
+def _retry_tickers(tickers, start, end=None, latest=None):
+    """
+    批次裡空掉 / 太短的股票單獨重試 (第一次不等，之後退避)。latest = 同批最新的 K 棒日期，最後一根比它舊就算 short。
+    回傳 (抓到的 {ticker: DataFrame}, 仍然 short 的清單, 仍失敗的清單, 重試預算用完沒試的清單)；
+    short 的也會放進抓到的結果 (有總比沒有好)
+    """
+    recovered, short, failed, skipped = {}, [], [], []
+    for t in tickers:
+        best, tried = None, False
+        for attempt in range(MAX_RETRIES):
+            wait = BACKOFF_SECONDS * 2 ** (attempt - 1) if attempt else 0
+            if _retry_budget_left() <= wait:
+                break
+            started = time.monotonic()
+            time.sleep(wait)
+            tried = True
+            try:
+                metrics.count_request("yfinance")
+                with _YF_LOCK:
+                    raw = providers.current().download(t, start=start, end=end, auto_adjust=False)
+                frames = _split_fields(raw, [t])
+            except Exception:
+                continue
+            finally:
+                _spend_retry(time.monotonic() - started)
+            if t not in frames:
+                continue
+            best = frames[t]
+            if latest is None or _last_bar(best) >= latest:
+                break
+        if best is None:
+            (failed if tried else skipped).append(t)
+            continue
+        recovered[t] = best
+        if latest is not None and _last_bar(best) < latest:
+            short.append(t)
+    return recovered, short, failed, skipped
+
+
+def _fetch_range(tickers, start, end, manifest, today):
+    """
+    下載同一個缺口區間的一群股票，每片完成就寫入倉庫與 manifest (倉庫本身就是 checkpoint)。
+    回傳仍然抓不到的股票清單。
+    """
+    tickers = sorted(tickers)
+    shards = [tickers[i:i + SHARD_SIZE] for i in range(0, len(tickers), SHARD_SIZE)]
+    missing, short, blocked, any_ok, latest = [], [], [], False, None
+    for shard in shards:
+        frames = _download(shard, start, end)
+        if not frames:
+            # 整片 (含分片自己的退避重試) 都沒資料，多半是被擋：逐檔重試只會更慢，留給下一次執行
+            blocked += shard
+            continue
+        missing += [t for t in shard if t not in frames]
+        if end is None and frames:
+            # 尾段下載：同批最新的 K 棒就是「今天應該有的日期」，比它舊的是只回了一半的股票
+            shard_latest = max(_last_bar(df) for df in frames.values())
+            latest = shard_latest if latest is None else max(latest, shard_latest)
+            short += [t for t, df in frames.items() if _last_bar(df) < shard_latest]
+        with _LOCK:
+            for t, df in frames.items():
+                _record(manifest, t, start, _merge(t, df), today)
+                _RUN[t] = "ok"
+                any_ok = True
+            _save_manifest(manifest)
+
+    failed, skipped = [], []
+    if blocked:
+        with _LOCK:
+            for t in blocked:
+                if end is None: _RUN[t] = "empty"
+                else: _RUN.setdefault(t, "empty")
+        print(f"      ⚠️ [Prices] {len(blocked)} 檔所在的分片整片下載失敗，不單獨重試，下次執行再抓")
+    retry = sorted(set(missing) | set(short))
+    if retry:
+        print(f"      🔁 [Prices] {len(missing)} 檔沒有資料、{len(short)} 檔資料不完整，單獨重試: {retry}")
+        recovered, still_short, failed, skipped = _retry_tickers(retry, start, end, latest)
+        with _LOCK:
+            for t, df in recovered.items():
+                _record(manifest, t, start, _merge(t, df), today)
+                _RUN[t] = "short" if t in still_short else "retried"
+                any_ok = True
+            for t in failed:
+                # 批次裡是 short (有部分資料) 的，已經寫進倉庫了，仍算 short；
+                # 前段缺口抓不到 (多半是還沒上市) 不蓋掉尾段的結果
+                if t in short: _RUN[t] = "short"
+                elif end is None: _RUN[t] = "empty"
+                else: _RUN.setdefault(t, "empty")
+            for t in skipped:
+                if t in short: _RUN[t] = "short"
+                elif end is None: _RUN[t] = "empty"
+                else: _RUN.setdefault(t, "empty")
+            if skipped:
+                print(f"      ⚠️ [Prices] 本次重試預算 ({RETRY_BUDGET_SECONDS}s) 已用完，{len(skipped)} 檔留給下次執行: {skipped}")
+            if still_short:
+                print(f"      ⚠️ [Prices] 重試後最後一根 K 棒仍落後 {latest:%Y-%m-%d}: {still_short}")
+            failed = [t for t in failed if t not in short]
+            if failed:
+                print(f"      ⚠️ [Prices] 重試後仍失敗，本次略過: {failed}")
+                if any_ok:
+                    # Yahoo 有正常回應，代表這些股票是真的沒資料 (下市 / 還沒上市)，記錄今天已檢查，避免反覆打 Yahoo；
+                    # 整個區間都失敗 (多半是被擋) 就不記錄，下一次執行會重新嘗試
+                    for t in failed:
+                        _record(manifest, t, start, None, today)
+            _save_manifest(manifest)
+    return failed + [t for t in skipped + blocked if t not in short]
+
+
+def _record(manifest, ticker, start, last_bar, today):
+    entry = manifest.get(ticker, {})
+    entry["start"] = min(start, entry.get("start", start))
+    if last_bar is not None:
+        entry["end"] = max(f"{last_bar:%Y-%m-%d}", entry.get("end", ""))
+    entry["checked"] = today
+    manifest[ticker] = entry
+
+
+# ==========================================
+# 公開介面
+# ==========================================
+def ensure(requests):
+    """
+    確保倉庫涵蓋每檔股票要求的區間，只下載缺少的部分。
+    requests: {ticker: start ("YYYY-MM-DD")}，同一檔股票多個需求時取最早的 start
+    回傳仍然抓不到的股票清單。
+    """
+    manifest = _manifest()
+    today = f"{pd.Timestamp.today():%Y-%m-%d}"
+
+    # 依缺口區間分組，同一區間的股票一起下載
+    gaps = {}
+    with _LOCK:
+        for t, start in requests.items():
+            entry = manifest.get(t)
+            if entry is None:
+                gaps.setdefault((start, None), []).append(t)
+                continue
+            if start < entry["start"]:
+                gaps.setdefault((start, entry["start"]), []).append(t)
+            if entry.get("checked", "") < today:
+                # 從最後一根 K 棒往回重疊幾天開始抓 (用來偵測公司行動)，沒有任何資料的就從要求的 start 開始
+                if "end" in entry:
+                    tail = pd.Timestamp(entry["end"]) - pd.Timedelta(days=RECONCILE_OVERLAP_DAYS)
+                    tail_start = max(f"{tail:%Y-%m-%d}", entry["start"])
+                else:
+                    tail_start = start
+                gaps.setdefault((tail_start, None), []).append(t)
+
+    if runtime.OFFLINE:
+        with _LOCK:
+            failed = [t for t in requests if t not in manifest]
+            for t in requests:
+                _RUN.setdefault(t, "empty" if t in failed else "cached")
+            _write_coverage(manifest)
+        if gaps:
+            print(f"      📴 [Prices] 離線模式：略過 {sum(len(v) for v in gaps.values())} 個缺口下載，只用倉庫現有資料")
+        return sorted(failed)
+
+    # 先補最新的尾段 (會把舊歷史縮放到今天的還原基準)，再補前段缺口，兩段才會在同一個基準上
+    failed = []
+    for (start, end), tickers in sorted(gaps.items(), key=lambda kv: (kv[0][1] is not None, kv[0][0])):
+        span = f"{start} ~ {end or '最新'}"
+        print(f"      📥 [Prices] 下載 {len(tickers)} 檔 ({span})")
+        failed += _fetch_range(tickers, start, end, manifest, today)
+
+    with _LOCK:
+        for t in requests:
+            _RUN.setdefault(t, "cached")
+        _write_coverage(manifest)
+    return sorted(set(failed))
+
+
+def _write_coverage(manifest):
+    """本次執行碰過的每檔股票：下載結果 + 倉庫裡最後一根 K 棒 + 落後最新日期幾天"""
+    ends = [manifest.get(t, {}).get("end") for t in _RUN]
+    newest = max([e for e in ends if e], default=None)
+    tickers = {}
+    for t, status in sorted(_RUN.items()):
+        end = manifest.get(t, {}).get("end")
+        behind = int(np.busday_count(end, newest)) if end and newest else None
+        tickers[t] = {"status": status, "last_bar": end, "behind": behind}
+    summary = {}
+    for status in _RUN.values():
+        summary[status] = summary.get(status, 0) + 1
+    report = {"generated_at": f"{pd.Timestamp.now():%Y-%m-%d %H:%M:%S}", "newest_bar": newest,
+              "summary": summary, "tickers": tickers}
+    if not os.path.exists(REPORT_DIR): os.makedirs(REPORT_DIR, exist_ok=True)
+    tmp_path = COVERAGE_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, COVERAGE_PATH)
+
+
+def problem_tickers(tickers, max_behind=0):
+    """本次執行中沒抓到 (empty) 或最後一根 K 棒落後超過 max_behind 個交易日的股票"""
+    manifest = _manifest()
+    with _LOCK:
+        ends = {t: manifest.get(t, {}).get("end") for t in tickers}
+        newest = max([e for e in ends.values() if e], default=None)
+        bad = []
+        for t in tickers:
+            if _RUN.get(t) == "empty" or ends[t] is None:
+                bad.append(t)
+            elif newest and np.busday_count(ends[t], newest) > max_behind:
+                bad.append(t)
+    return bad
+
+
+def load(tickers, start=None, field="Close"):
+    """
+    從倉庫讀出 (dates × tickers) 的單一欄位，field 用 yfinance 的名稱 (Close / Adj Close / High ...)
+    Adj Close = close × factor (等同 yfinance auto_adjust=True 的收盤價)
+    """
+    name = FIELDS[field]
+    series = {}
+    for t in tickers:
+        with _LOCK:
+            df = _read(t)
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        series[t] = df["close"] * df["factor"] if name == "adj_close" else df[name]
+    if not series:
+        frame = pd.DataFrame()
+        frame.index.name = "Date"
+        return frame
+    # 一次填進同一個 (日期 × 股票) 矩陣：逐欄 concat 會變成每檔一個 block，之後 reset_index 等操作會很慢
+    index = pd.DatetimeIndex(sorted(set().union(*(s.index for s in series.values()))), name="Date")
+    values = np.full((len(index), len(series)), np.nan, dtype="float32")
+    for i, s in enumerate(series.values()):
+        values[index.get_indexer(s.index), i] = s.to_numpy(dtype="float32")
+    return pd.DataFrame(values, index=index, columns=list(series))
+
+
+def get(tickers, start, field="Close"):
+    """ensure + load：流水線模組最常用的入口"""
+    tickers = list(dict.fromkeys(tickers))
+    ensure({t: start for t in tickers})
+    return load(tickers, start, field)
+
+
+def prefetch(universes):
+    """
+    一次補齊多個模組的股價需求 (每檔取最早的 start)，重疊的股票只會下載一次。
+    universes: [{ticker: start}, ...]
+    """
+    merged = {}
+    for universe in universes:
+        for t, start in universe.items():
+            merged[t] = min(start, merged.get(t, start))
+    print(f"   ↳ 🏦 [Prices] 股價倉庫預先補齊 {len(merged)} 檔...")
+    return ensure(merged)
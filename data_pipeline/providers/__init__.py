@@ -0,0 +1,52 @@
+"""
+data_pipeline/providers/__init__.py
+外部資料來源介面 (provider)：流水線與前端引擎都透過 current() 拿外部資料，不直接呼叫 yfinance / FRED / 網頁
+- live (預設)：真正的 Yahoo / FRED / NAAIM / AAII / Wikipedia
+- synthetic：本機產生、可重現的模擬資料 (每檔股票以 crc32(代碼) 當亂數種子)，給壓力測試 / 基準測試用
+- 切換：環境變數 BAMHI_PROVIDER=synthetic，或 update_data.py --provider synthetic
+  模擬資料規模：BAMHI_SYNTH_TICKERS (S&P 成分股檔數，預設 500)、BAMHI_SYNTH_YEARS (歷史年數，預設 30)、
+  BAMHI_SYNTH_END (最後一天，預設今天；固定下來每次跑出來都一樣)
+
+每個 provider 都提供：
+- download(tickers, start=None, end=None, period=None, auto_adjust=False)：同 yf.download，欄位是 (欄位, 代碼) 雙層
+- history(ticker, start=None, end=None)：單檔還原日線 (同 yf.Ticker(t).history(auto_adjust=True))
+- top_holdings(ticker)：ETF 前幾大持股 (index = 代碼，同 yf.Ticker(t).funds_data.top_holdings)
+- fred(series, start, end)：FRED 序列 (同 web.DataReader(series, "fred", start, end))
+- http_get(url, headers=None, timeout=None)：網頁請求，回傳 requests.Response
+- remote：是否真的連網 (net.get 只有 remote=False 時才把請求交給 http_get，live 走自己的連線池 / 限速 / 快取)
+"""
+import os
+import threading
+
+PROVIDER_ENV = "BAMHI_PROVIDER"
+NAMES = ("live", "synthetic")
+
+_lock = threading.Lock()
+_current = None
+
+
+def _create(name):
+    if name == "live":
+        from .live import LiveProvider
+        return LiveProvider()
+    if name == "synthetic":
+        from .synthetic import SyntheticProvider
+        return SyntheticProvider.from_env()
+    raise ValueError(f"未知的資料來源 {name!r}，可用: {', '.join(NAMES)}")
+
+
+def current():
+    """目前使用中的 provider (第一次呼叫時依 BAMHI_PROVIDER 建立)"""
+    global _current
+    with _lock:
+        if _current is None:
+            _current = _create(os.environ.get(PROVIDER_ENV, "live"))
+        return _current
+
+
+def use(provider):
+    """切換 provider：傳名稱 ("live" / "synthetic") 或 provider 物件"""
+    global _current
+    with _lock:
+        _current = _create(provider) if isinstance(provider, str) else provider
+        return _current
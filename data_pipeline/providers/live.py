@@ -0,0 +1,32 @@
+"""
+data_pipeline/providers/live.py
+真正的外部來源：Yahoo (yfinance)、FRED (pandas_datareader)、網頁 (requests)
+套件在第一次用到時才 import，前端只用到其中一兩個方法也不用全部裝
+"""
+
+
+class LiveProvider:
+    name = "live"
+    remote = True
+
+    def download(self, tickers, start=None, end=None, period=None, auto_adjust=False, **kwargs):
+        import yfinance as yf
+        if period is not None:
+            kwargs["period"] = period
+        return yf.download(tickers, start=start, end=end, auto_adjust=auto_adjust, progress=False, **kwargs)
+
+    def history(self, ticker, start=None, end=None):
+        import yfinance as yf
+        return yf.Ticker(ticker).history(start=start, end=end, auto_adjust=True)
+
+    def top_holdings(self, ticker):
+        import yfinance as yf
+        return yf.Ticker(ticker).funds_data.top_holdings
+
+    def fred(self, series, start, end):
+        import pandas_datareader.data as web
+        return web.DataReader(series, "fred", start, end)
+
+    def http_get(self, url, headers=None, timeout=None):
+        from data_pipeline import net
+        return net.session().get(url, headers=headers, timeout=timeout or net.TIMEOUT)
@@ -0,0 +1,245 @@
+"""
+data_pipeline/providers/synthetic.py
+本機模擬資料來源：不連網、每次產生的數字都一樣，給壓力測試 / 基準測試 / 沙盒環境用
+- 股價：共同市場因子 + 個股 beta + 個股雜訊的幾何隨機漫步，亂數種子 = crc32(代碼)
+  隨機漫步從固定的 ORIGIN 起算，同一檔股票同一天的價格不受 end / years 設定影響 (增量更新可以接得起來)
+  每季一次除息 (還原因子在除息日跳一階)，約四分之一的股票上市日較晚 (模擬 IPO)
+- 殖利率曲線：Nelson-Siegel 三因子 (水準 / 斜率 / 曲度) 各自均值回歸，FRED 代碼 DGS3MO / DGS10 ... 換算成天期
+- NAAIM / AAII：每週一筆的均值回歸序列，包成和官網一樣的網頁 / Excel，讓原本的爬蟲解析流程照跑
+- S&P 500 成分股：n_tickers 個四碼代碼 (AAAA、AAAB ...)，包成 Wikipedia 表格
+"""
+import zlib
+import os
+import re
+from io import BytesIO
+import numpy as np
+import pandas as pd
+import requests
+from requests.structures import CaseInsensitiveDict
+
+ORIGIN = pd.Timestamp("1980-01-01")   # 所有序列的固定起點 (FRED 從 1980 年開始抓)
+MARKET = "^GSPC"                      # 市場因子本身就是 S&P 500
+LATEST_IPO = pd.Timestamp("2020-01-01") # 模擬 IPO 的上市日落在 ORIGIN ~ 這一天之間
+NAAIM_START = pd.Timestamp("2006-07-05")
+AAII_START = pd.Timestamp("1987-07-24")
+AAII_RECENT_WEEKS = 20                # AAII 網頁只列最近幾週
+
+NAAIM_PAGE = "https://naaim.org/programs/naaim-exposure-index/"
+NAAIM_XLSX = "https://naaim.org/wp-content/uploads/naaim-exposure-index.xlsx"
+AAII_PAGE = "https://www.aaii.com/sentimentsurvey/sent_results"
+WIKI_SP500 = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+
+_FRED_CODE = re.compile(r"^DGS(\d+)(MO)?$")
+_PERIOD = re.compile(r"^(\d+)(d|wk|mo|y)$")
+_PERIOD_UNITS = {"d": "days", "wk": "weeks", "mo": "months", "y": "years"}
+
+
+def _rng(*parts):
+    """同一組 parts 永遠拿到同一串亂數"""
+    return np.random.default_rng([zlib.crc32(str(p).encode("utf-8")) for p in parts])
+
+
+def _ar1(rng, n, mean, phi, sigma, start=None):
+    """均值回歸 AR(1)：x[t] = mean + phi × (x[t-1] - mean) + sigma × ε"""
+    shocks = rng.standard_normal(n) * sigma
+    x = np.empty(n)
+    x[0] = mean if start is None else start
+    for i in range(1, n):
+        x[i] = mean + phi * (x[i - 1] - mean) + shocks[i]
+    return x
+
+
+def _symbol(i):
+    """第 i 檔模擬成分股的四碼代碼 (AAAA, AAAB, ...)"""
+    letters = []
+    for _ in range(4):
+        i, r = divmod(i, 26)
+        letters.append(chr(ord("A") + r))
+    return "".join(reversed(letters))
+
+
+def _response(url, body, status=200, content_type="text/html; charset=utf-8"):
+    res = requests.models.Response()
+    res.url = url
+    res.status_code = status
+    res._content = body if isinstance(body, bytes) else body.encode("utf-8")
+    res.encoding = "utf-8"
+    res.headers = CaseInsensitiveDict({"Content-Type": content_type})
+    return res
+
+
+class SyntheticProvider:
+    name = "synthetic"
+    remote = False
+
+    def __init__(self, n_tickers=500, years=30, end=None):
+        self.n_tickers = int(n_tickers)
+        self.end = pd.Timestamp(end if end else pd.Timestamp.today()).normalize()
+        self.start = max(ORIGIN, self.end - pd.DateOffset(years=int(years)))
+        self.calendar = pd.bdate_range(ORIGIN, self.end)
+        self._market = None
+        self._curve = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(n_tickers=os.environ.get("BAMHI_SYNTH_TICKERS", 500),
+                   years=os.environ.get("BAMHI_SYNTH_YEARS", 30),
+                   end=os.environ.get("BAMHI_SYNTH_END"))
+
+    def universe(self):
+        return [_symbol(i) for i in range(self.n_tickers)]
+
+    # ==========================================
+    # 股價
+    # ==========================================
+    def _market_returns(self):
+        if self._market is None:
+            rng = _rng(MARKET)
+            n = len(self.calendar)
+            vol = 0.16 / np.sqrt(252)
+            self._market = 0.07 / 252 - vol ** 2 / 2 + rng.standard_normal(n) * vol
+        return self._market
+
+    def _bars(self, ticker):
+        """整段日曆 (ORIGIN ~ end) 的 OHLCV + 還原因子，上市前是 NaN"""
+        # 純量參數一個亂數串，每條序列各一個亂數串：日曆變長時，前面的值不會變
+        params = _rng(ticker)
+        n = len(self.calendar)
+        market = self._market_returns()
+        if ticker == MARKET:
+            ret, listed, p0 = market, 0, 100.0
+        else:
+            beta, vol, drift = params.uniform(0.5, 1.5), params.uniform(0.1, 0.4) / np.sqrt(252), params.uniform(-0.02, 0.04) / 252
+            ret = beta * market + drift - vol ** 2 / 2 + _rng(ticker, "ret").standard_normal(n) * vol
+            ipo = ORIGIN + (LATEST_IPO - ORIGIN) * params.uniform(0, 1) if params.uniform(0, 1) < 0.25 else None
+            listed = int(self.calendar.searchsorted(ipo)) if ipo is not None else 0
+            p0 = params.uniform(10, 200)
+
+        close = p0 * np.exp(np.cumsum(ret))
+        prev = np.concatenate(([close[0]], close[:-1]))
+        open_ = prev * np.exp(_rng(ticker, "open").standard_normal(n) * 0.003)
+        high = np.maximum(open_, close) * (1 + np.abs(_rng(ticker, "high").standard_normal(n)) * 0.006)
+        low = np.minimum(open_, close) * (1 - np.abs(_rng(ticker, "low").standard_normal(n)) * 0.006)
+        volume = np.round(_rng(ticker, "volume").lognormal(13, 0.5, n))
+
+        # 每季除息一次：除息日之前的還原因子乘上 (1 - 季配息率)，最後一天的因子 = 1
+        yield_q = (0.0 if ticker.startswith("^") else params.uniform(0, 0.03)) / 4
+        ex_count = (np.arange(n) + int(params.uniform(0, 63))) // 63
+        factor = (1 - yield_q) ** (ex_count[-1] - ex_count)
+
+        bars = {"Open": open_, "High": high, "Low": low, "Close": close, "Adj Close": close * factor, "Volume": volume}
+        if listed:
+            for values in bars.values():
+                values[:listed] = np.nan
+        return bars
+
+    def _window(self, start, end, period):
+        """把 start / end (不含) / period 換成日曆上的 [lo, hi)"""
+        if period is not None and period != "max":
+            m = _PERIOD.match(period)
+            if not m:
+                raise ValueError(f"不支援的 period {period!r}")
+            start = self.end - pd.DateOffset(**{_PERIOD_UNITS[m.group(2)]: int(m.group(1))})
+        first = pd.Timestamp(start) if start is not None and period != "max" else self.start
+        lo = self.calendar.searchsorted(max(first, self.start))
+        hi = self.calendar.searchsorted(pd.Timestamp(end)) if end is not None else len(self.calendar)
+        return lo, max(hi, lo)
+
+    def download(self, tickers, start=None, end=None, period=None, auto_adjust=False, **kwargs):
+        tickers = tickers.split() if isinstance(tickers, str) else list(tickers)
+        lo, hi = self._window(start, end, period)
+        fields = ["Close", "High", "Low", "Open", "Volume"] if auto_adjust else ["Adj Close", "Close", "High", "Low", "Open", "Volume"]
+        data = {}
+        for t in tickers:
+            bars = self._bars(t)
+            if auto_adjust:
+                factor = bars["Adj Close"] / bars["Close"]
+                for f in ("Open", "High", "Low", "Close"):
+                    bars[f] = bars[f] * factor
+            for f in fields:
+                data[(f, t)] = bars[f][lo:hi]
+        df = pd.DataFrame(data, index=pd.DatetimeIndex(self.calendar[lo:hi], name="Date"))
+        df.columns = pd.MultiIndex.from_tuples(df.columns, names=["Price", "Ticker"])
+        return df[fields].dropna(how="all")
+
+    def history(self, ticker, start=None, end=None):
+        df = self.download(ticker, start=start, end=end, auto_adjust=True)
+        return df.droplevel("Ticker", axis=1).dropna()
+
+    def top_holdings(self, ticker):
+        rng = _rng(ticker, "holdings")
+        symbols = [_symbol(i) for i in rng.choice(self.n_tickers, size=min(15, self.n_tickers), replace=False)]
+        weights = np.sort(rng.dirichlet(np.ones(len(symbols))))[::-1] * 0.6
+        return pd.DataFrame({"Name": [f"{s} Corp" for s in symbols], "Holding Percent": weights},
+                            index=pd.Index(symbols, name="Symbol"))
+
+    # ==========================================
+    # FRED 殖利率曲線
+    # ==========================================
+    def _curve_factors(self):
+        if self._curve is None:
+            n = len(self.calendar)
+            self._curve = (_ar1(_rng("FRED", "level"), n, 4.5, 0.9995, 0.05, start=10.0),  # 水準 (1980 年代的高利率慢慢回落)
+                           _ar1(_rng("FRED", "slope"), n, -1.5, 0.998, 0.04),              # 斜率 (短端 - 長端)
+                           _ar1(_rng("FRED", "curvature"), n, 0.0, 0.995, 0.06))           # 曲度
+        return self._curve
+
+    def fred(self, series, start, end):
+        series = [series] if isinstance(series, str) else list(series)
+        level, slope, curvature = self._curve_factors()
+        lo, hi = self._window(start, pd.Timestamp(end) + pd.Timedelta(days=1), None)
+        data = {}
+        for code in series:
+            m = _FRED_CODE.match(code)
+            if not m:
+                raise ValueError(f"模擬資料不支援 FRED 代碼 {code}")
+            tau = int(m.group(1)) / (12 if m.group(2) else 1)
+            x = tau / 1.8
+            loading = (1 - np.exp(-x)) / x
+            values = np.round(np.maximum(level + slope * loading + curvature * (loading - np.exp(-x)), 0.01), 2)
+            if code == "DGS1MO":
+                values = np.where(self.calendar < pd.Timestamp("2001-07-31"), np.nan, values)  # 1M 從 2001 年才有
+            data[code] = values[lo:hi]
+        return pd.DataFrame(data, index=pd.DatetimeIndex(self.calendar[lo:hi], name="DATE"))
+
+    # ==========================================
+    # 每週情緒調查
+    # ==========================================
+    def _weekly(self, start, weekday):
+        return pd.date_range(start, self.end, freq=f"W-{weekday}")
+
+    def naaim(self):
+        dates = self._weekly(NAAIM_START, "WED")
+        values = np.clip(_ar1(_rng("NAAIM"), len(dates), 65, 0.9, 12), -25, 150)
+        return pd.DataFrame({"Date": dates, "NAAIM Number": np.round(values, 2)})
+
+    def aaii(self):
+        dates = self._weekly(AAII_START, "THU")
+        bull = _ar1(_rng("AAII", "bull"), len(dates), 0.4, 0.85, 0.25)
+        bear = _ar1(_rng("AAII", "bear"), len(dates), 0.1, 0.85, 0.25)
+        weights = np.exp(np.column_stack([bull, np.zeros(len(dates)), bear]))
+        shares = np.round(weights / weights.sum(axis=1, keepdims=True) * 100, 1)
+        return pd.DataFrame({"Date": dates, "Bullish": shares[:, 0], "Neutral": shares[:, 1], "Bearish": shares[:, 2]})
+
+    # ==========================================
+    # 網頁
+    # ==========================================
+    def http_get(self, url, headers=None, timeout=None):
+        if url == WIKI_SP500:
+            symbols = self.universe()
+            table = pd.DataFrame({"Symbol": symbols, "Security": [f"{s} Corp" for s in symbols]})
+            return _response(url, table.to_html(index=False))
+        if url == NAAIM_PAGE:
+            return _response(url, f'<html><body><a href="{NAAIM_XLSX}">NAAIM Exposure Index Data</a></body></html>')
+        if url == NAAIM_XLSX:
+            buf = BytesIO()
+            self.naaim().to_excel(buf, index=False)
+            return _response(url, buf.getvalue(), content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        if url == AAII_PAGE:
+            recent = self.aaii().tail(AAII_RECENT_WEEKS).iloc[::-1]
+            table = pd.DataFrame({
+                "Reported Date": recent["Date"].dt.strftime("%B %d, %Y"),
+                **{c: recent[c].map(lambda v: f"{v:.1f}%") for c in ("Bullish", "Neutral", "Bearish")},
+            })
+            return _response(url, table.to_html(index=False))
+        return _response(url, "Not Found", status=404, content_type="text/plain")
@@ -1,5 +1,9 @@
 from . import treasury
+from data_pipeline import scheduler
+
+def tasks():
+    return [scheduler.Task("rates.treasury", treasury.update)]
 
 def update():
     print("🔹 [Rates Dept] 開始更新...")
-    treasury.update()
\ No newline at end of file
+    scheduler.print_summary(scheduler.run(tasks()))
@@ -1,26 +1,170 @@
 """
 data_pipeline/rates/treasury.py
-負責抓取美國公債利率 (FRED) -> 存成 data/rates.csv
+負責抓取美國公債利率 (FRED) -> 存成 data/treasury_curve.npz + data/rates.csv
+- 整條殖利率曲線 (1M ~ 30Y) 存成一個 日期 × 天期 的 float32 矩陣，任何利差 / 蝶式由前端需要時再算
+- 增量模式：向 FRED 要最後日期之後 (往回重疊幾天，補齊晚公布的天期) 的區間，upsert 進矩陣
+- rates.csv (10Y / 2Y / Spread) 保留給舊的圖表：只讀檔尾拿到最後日期，去重後「追加」到 CSV 尾端，Spread 只算新的那幾筆
+- 離線模式：pandas_datareader 的 FRED 請求沒有快取可重播，沿用現有檔案
 """
-import pandas_datareader.data as web
 import datetime as dt
 import pandas as pd
+import numpy as np
 import os
+import shutil
+from data_pipeline import metrics
+from data_pipeline import runtime
+from data_pipeline import providers
+from data_pipeline import columnar
+from data_pipeline import digest
 
-def update():
-    print("   ↳ 📉 [Treasury] 正在下載公債殖利率...")
-    start = dt.datetime(1980, 1, 1)
+DATA_DIR = "data"
+FILE_PATH = os.path.join(DATA_DIR, "rates.csv")
+COLUMNS = ["date", "DGS10", "DGS2", "Spread"]
+START_DATE = dt.datetime(1980, 1, 1)
+
+CURVE_PATH = os.path.join(DATA_DIR, "treasury_curve.npz")
+# 天期 -> FRED 固定到期殖利率代碼 (1M 從 2001 年才有，20Y / 30Y 中間有停發的空窗，矩陣裡是 NaN)
+CURVE_SERIES = {
+    "1M": "DGS1MO", "3M": "DGS3MO", "6M": "DGS6MO", "1Y": "DGS1", "2Y": "DGS2", "3Y": "DGS3",
+    "5Y": "DGS5", "7Y": "DGS7", "10Y": "DGS10", "20Y": "DGS20", "30Y": "DGS30",
+}
+TENORS = list(CURVE_SERIES.keys())
+CURVE_OVERLAP_DAYS = 10  # 每次往回重抓的天數，補上當時還沒公布的天期
+
+
+def _last_date():
+    """只讀 CSV 的第一行 (欄位) 與最後一行拿到最後日期；檔案不存在 / 欄位不對就回傳 None (改為全量)"""
+    if not os.path.exists(FILE_PATH) or os.path.getsize(FILE_PATH) == 0:
+        return None
+    try:
+        with open(FILE_PATH, "rb") as f:
+            header = f.readline().decode("utf-8").strip().split(",")
+            if header != COLUMNS:
+                print(f"      ℹ️ rates.csv 欄位 {header} 與預期不符，改為全量重建")
+                return None
+            f.seek(max(os.path.getsize(FILE_PATH) - 4096, 0))
+            last_line = f.read().decode("utf-8").strip().splitlines()[-1]
+        return pd.Timestamp(last_line.split(",")[0])
+    except Exception as e:
+        print(f"      ⚠️ 無法讀取 rates.csv 的最後日期，改為全量重建: {e}")
+        return None
+
+
+def _fetch_curve(start, end):
+    """一次向 FRED 要整條曲線，回傳 index=日期、欄位=TENORS 的 DataFrame (整列都空的假日去掉)"""
+    metrics.count_request("fred", len(CURVE_SERIES))  # pandas_datareader 每個代碼各打一次
+    df = providers.current().fred(list(CURVE_SERIES.values()), start, end)
+    df = df.rename(columns={v: k for k, v in CURVE_SERIES.items()})[TENORS]
+    df.index = pd.DatetimeIndex(df.index).normalize()
+    return df.dropna(how="all")
+
+
+def _rates_rows(curve_df):
+    """從曲線取出舊版 rates.csv 的格式 (10Y / 2Y 都有值的日期才算)"""
+    df = curve_df[["10Y", "2Y"]].rename(columns={"10Y": "DGS10", "2Y": "DGS2"}).dropna()
+    df["Spread"] = df["DGS10"] - df["DGS2"]
+    df = df.reset_index()
+    df.rename(columns={df.columns[0]: "date"}, inplace=True)
+    return df[COLUMNS]
+
+
+def _load_curve():
+    """讀取曲線矩陣，回傳 DataFrame (沒有檔案 / 天期不符就回傳 None，改為全量)"""
+    if not os.path.exists(CURVE_PATH):
+        return None
+    try:
+        with np.load(CURVE_PATH) as f:
+            tenors = [str(t) for t in f["tenors"]]
+            df = pd.DataFrame(f["values"], index=pd.DatetimeIndex(f["dates"]), columns=tenors)
+    except Exception as e:
+        print(f"      ⚠️ 無法讀取 {CURVE_PATH}，改為全量重建: {e}")
+        return None
+    if tenors != TENORS or df.empty:
+        return None
+    return df
+
+
+def _save_curve(df):
+    tmp_path = CURVE_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, dates=df.index.values.astype("datetime64[D]"),
+                            tenors=np.array(TENORS), values=df[TENORS].to_numpy(dtype="float32"))
+    os.replace(tmp_path, CURVE_PATH)
+
+
+def _append(new_rows):
+    """
+    追加到 CSV 尾端 (原檔沒有換行結尾就先補一個)：複製到暫存檔、在暫存檔上追加再換名，
+    節點逾時被放棄、行程中途結束也不會留下只追加一半的 rates.csv
+    """
+    tmp_path = FILE_PATH + ".tmp"
+    shutil.copyfile(FILE_PATH, tmp_path)
+    with open(tmp_path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        needs_newline = f.read(1) != b"\n"
+    with open(tmp_path, "a", encoding="utf-8", newline="") as f:
+        if needs_newline: f.write("\n")
+        new_rows.to_csv(f, header=False, index=False, date_format="%Y-%m-%d")
+    os.replace(tmp_path, FILE_PATH)
+
+
+def update(full=False):
+    if runtime.OFFLINE:
+        print("   📴 [Treasury] 離線模式：FRED 沒有快取可重播，沿用現有檔案")
+        return
+    print("   ↳ 📉 [Treasury] 正在下載公債殖利率曲線...")
     end = dt.datetime.now()
-    
+    curve = None if full else _load_curve()
+    rates_last = None if full else _last_date()
+
+    # 兩份輸出共用同一次 FRED 請求：任何一份需要全量就從 1980 開始抓
+    if curve is None or rates_last is None:
+        start = runtime.start_date(START_DATE)
+    else:
+        start = min(curve.index[-1] - dt.timedelta(days=CURVE_OVERLAP_DAYS), rates_last + dt.timedelta(days=1))
+
     try:
-        df = web.DataReader(["DGS10", "DGS2"], "fred", start, end)
-        df["Spread"] = df["DGS10"] - df["DGS2"]
-        df = df.dropna().reset_index()
-        df.rename(columns={"DATE": "date"}, inplace=True)
-        
-        if not os.path.exists("data"): os.makedirs("data")
-        
-        df.to_csv("data/rates.csv", index=False)
-        print("   ✅ [Treasury] 儲存成功 data/rates.csv")
+        with metrics.stage("fetch") as s:
+            window = _fetch_curve(start, end)
+            s.rows_out = len(window)
     except Exception as e:
-        print(f"   ❌ [Treasury] 失敗: {e}")
\ No newline at end of file
+        print(f"   ❌ [Treasury] 失敗: {e}")
+        raise
+    if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
+
+    # 1. 曲線矩陣：重疊的日期以新資料為準
+    if curve is not None:
+        window_curve = window[window.index >= pd.Timestamp(start)]
+        curve = pd.concat([curve[~curve.index.isin(window_curve.index)], window_curve]).sort_index()
+    else:
+        curve = window
+    with metrics.stage("write_curve") as s:
+        _save_curve(curve)
+        s.rows_out = len(curve)
+        s.wrote(CURVE_PATH)
+    print(f"   ✅ [Treasury] 殖利率曲線 {curve.shape[0]} 天 × {curve.shape[1]} 個天期 -> {CURVE_PATH}")
+
+    # 2. rates.csv (舊格式，只追加)
+    rates = _rates_rows(window)
+    if rates_last is None:
+        with metrics.stage("write_csv") as s:
+            rates.to_csv(FILE_PATH + ".tmp", index=False, date_format="%Y-%m-%d")
+            os.replace(FILE_PATH + ".tmp", FILE_PATH)
+            s.rows_out = len(rates)
+            s.wrote(FILE_PATH)
+            columnar.write(rates, FILE_PATH)
+        print(f"   ✅ [Treasury] 全量儲存成功 {FILE_PATH} ({len(rates)} 筆)")
+        return
+    # 去重：只留比檔尾更新的日期
+    new_rows = rates[rates["date"] > rates_last]
+    if new_rows.empty:
+        print("   ✅ [Treasury] rates.csv 已是最新，沒有新資料需要追加")
+        return
+    with metrics.stage("write_csv") as s:
+        size_before = os.path.getsize(FILE_PATH)
+        digest_before = digest.sha256(FILE_PATH)
+        _append(new_rows)
+        s.rows_out = len(new_rows)
+        s.bytes_written += os.path.getsize(FILE_PATH) - size_before
+        columnar.append(FILE_PATH, new_rows, digest_before)
+    print(f"   ✅ [Treasury] 追加 {len(new_rows)} 筆新資料到 {FILE_PATH} (最後日期 {rates_last:%Y-%m-%d} -> {new_rows['date'].iloc[-1]:%Y-%m-%d})")
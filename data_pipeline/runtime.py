@@ -0,0 +1,33 @@
+"""
+data_pipeline/runtime.py
+這次執行的全域設定 (由 update_data.py 的命令列參數決定，各模組讀這裡)
+- OFFLINE：離線模式，不連網；網頁走 net 的磁碟快取、股價只讀倉庫，沒有快取的來源直接略過
+- SINCE：抓取起點下限 (除錯用，全量重建時輸出也只會有這段)
+- SELECTED：這次排程的節點名稱 (None = 全部)，讓共用的前置節點只準備被選到的模組需要的東西
+"""
+import pandas as pd
+
+OFFLINE = False
+SINCE = None
+SELECTED = None
+
+
+def configure(offline=False, since=None):
+    global OFFLINE, SINCE
+    OFFLINE = bool(offline)
+    SINCE = f"{pd.Timestamp(since):%Y-%m-%d}" if since else None
+
+
+def select(names):
+    global SELECTED
+    SELECTED = set(names) if names is not None else None
+
+
+def selected(name):
+    return SELECTED is None or name in SELECTED
+
+
+def start_date(default):
+    """模組預設的抓取起點，套用 --since 之後的結果 ("YYYY-MM-DD")"""
+    default = f"{pd.Timestamp(default):%Y-%m-%d}"
+    return max(default, SINCE) if SINCE else default
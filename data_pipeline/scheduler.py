@@ -0,0 +1,175 @@
+"""
+data_pipeline/scheduler.py
+流水線排程器：把每個模組宣告成 DAG 節點 (名稱 + 相依節點)，互不相依的節點同時跑 (同時最多 max_workers 個)。
+- 節點的 update() 丟出例外就算失敗 (模組印完錯誤訊息要 raise，不可以吞掉)；相依節點失敗 / 逾時，下游節點直接略過 (skipped)
+- 每個節點有自己的 timeout，逾時就不再等它。節點跑在 daemon 執行緒上 (執行緒無法強制中止)：
+  有節點逾時的話，update_data.py 寫完報告後用 os._exit 結束行程，卡住的執行緒不會讓行程一直掛著
+- 整晚的總時間 ≈ 最長的那條相依鏈，而不是所有工作的加總
+"""
+import time
+import threading
+import traceback
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from data_pipeline import metrics
+
+MAX_WORKERS = 4
+DEFAULT_TIMEOUT = 600  # 秒
+
+
+class Task:
+    """DAG 節點：name 唯一，func 不帶參數，deps 是上游節點名稱"""
+
+    def __init__(self, name, func, deps=(), timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+
+    def __repr__(self):
+        return f"Task({self.name!r}, deps={self.deps})"
+
+
+def _check_graph(tasks):
+    names = [t.name for t in tasks]
+    dupes = {n for n in names if names.count(n) > 1}
+    if dupes:
+        raise ValueError(f"重複的節點名稱: {sorted(dupes)}")
+    known = set(names)
+    for t in tasks:
+        missing = [d for d in t.deps if d not in known]
+        if missing:
+            raise ValueError(f"{t.name} 相依的節點不存在: {missing}")
+    # 拓撲排序檢查循環相依
+    order, done = [], set()
+    pending = list(tasks)
+    while pending:
+        ready = [t for t in pending if all(d in done for d in t.deps)]
+        if not ready:
+            raise ValueError(f"節點之間有循環相依: {[t.name for t in pending]}")
+        for t in ready:
+            order.append(t)
+            done.add(t.name)
+        pending = [t for t in pending if t.name not in done]
+    return order
+
+
+def _run_task(task):
+    # 每個節點是一個量測階段，模組內的 fetch / compute / write 會巢狀在它底下
+    with metrics.stage(task.name):
+        task.func()
+
+
+def _start(task):
+    """在 daemon 執行緒上跑一個節點，回傳 Future (行程結束時不會等逾時卡住的執行緒)"""
+    future = Future()
+
+    def target():
+        try:
+            _run_task(task)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+
+    threading.Thread(target=target, name=f"pipeline-{task.name}", daemon=True).start()
+    return future
+
+
+def select(tasks, targets):
+    """
+    只留下指定的節點 (完整名稱如 market.breadth，或部門前綴如 market) 以及它們的所有上游節點。
+    targets 是空的就回傳全部。
+    """
+    if not targets:
+        return list(tasks)
+    by_name = {t.name: t for t in tasks}
+    wanted = set()
+    for target in targets:
+        matched = [n for n in by_name if n == target or n.startswith(target + ".")]
+        if not matched:
+            raise ValueError(f"找不到節點 {target!r}，可用的節點: {sorted(by_name)}")
+        wanted.update(matched)
+    pending = list(wanted)
+    while pending:
+        for dep in by_name[pending.pop()].deps:
+            if dep not in wanted:
+                wanted.add(dep)
+                pending.append(dep)
+    return [t for t in tasks if t.name in wanted]
+
+
+def plan(tasks):
+    """回傳拓撲排序後的節點 (dry-run / 除錯用)"""
+    return _check_graph(tasks)
+
+
+def run(tasks, max_workers=MAX_WORKERS):
+    """
+    執行整張 DAG，回傳 {節點名稱: {"status": ok/failed/timeout/skipped, "seconds": float, "error": str}}
+    """
+    _check_graph(tasks)
+    by_name = {t.name: t for t in tasks}
+    results = {}
+    submitted = set()
+    running = {}  # future -> (task, 開始時間)
+
+    while len(results) < len(tasks):
+        # 1. 上游有任何一個沒成功 -> 略過
+        for t in tasks:
+            if t.name in results or t.name in submitted:
+                continue
+            bad = [d for d in t.deps if d in results and results[d]["status"] != "ok"]
+            if bad:
+                results[t.name] = {"status": "skipped", "seconds": 0.0, "error": f"上游失敗: {bad}"}
+                print(f"   ⏭️ [Scheduler] 略過 {t.name} (上游 {bad} 沒有成功)")
+
+        # 2. 上游全部成功 -> 開始執行 (同時最多 max_workers 個；逾時的節點不再佔位置)
+        for t in tasks:
+            if t.name in results or t.name in submitted:
+                continue
+            if len(running) >= max_workers:
+                break
+            if all(d in results and results[d]["status"] == "ok" for d in t.deps):
+                submitted.add(t.name)
+                running[_start(t)] = (t, time.perf_counter())
+
+        if not running:
+            continue
+
+        # 3. 等到第一個完成，或第一個節點逾時
+        now = time.perf_counter()
+        deadlines = [start + t.timeout for t, start in running.values() if t.timeout]
+        wait_for = max(min(deadlines) - now, 0) if deadlines else None
+        done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        now = time.perf_counter()
+        for future in done:
+            t, start = running.pop(future)
+            error = future.exception()
+            if error is None:
+                results[t.name] = {"status": "ok", "seconds": now - start, "error": ""}
+            else:
+                results[t.name] = {"status": "failed", "seconds": now - start, "error": repr(error)}
+                print(f"   ❌ [Scheduler] {t.name} 失敗: {error}")
+                traceback.print_exception(type(error), error, error.__traceback__)
+
+        for future, (t, start) in list(running.items()):
+            if t.timeout and now - start >= t.timeout:
+                running.pop(future)
+                results[t.name] = {"status": "timeout", "seconds": now - start, "error": f"超過 {t.timeout} 秒"}
+                print(f"   ⏱️ [Scheduler] {t.name} 逾時 ({t.timeout} 秒)，不再等待")
+
+    return {name: results[name] for name in by_name}
+
+
+def print_plan(tasks, max_workers=MAX_WORKERS):
+    print(f"   🗺️ 執行計畫 ({len(tasks)} 個節點，最多 {max_workers} 個同時跑):")
+    for t in plan(tasks):
+        deps = ", ".join(t.deps) if t.deps else "-"
+        print(f"      • {t.name:<24} 上游: {deps:<20} timeout: {t.timeout}s")
+
+
+def print_summary(results):
+    icons = {"ok": "✅", "failed": "❌", "timeout": "⏱️", "skipped": "⏭️"}
+    for name, r in results.items():
+        print(f"   {icons.get(r['status'], '•')} {name:<24} {r['status']:<8} {r['seconds']:7.1f}s {r['error']}")
@@ -0,0 +1,96 @@
+"""
+data_pipeline/summary.py
+流水線最後一步：把 config.INDICATORS 每個指標的最新值整理成一份小小的 data/summary.json
+- 第二層清單頁只讀這份索引，不用為了一個「最新值」載入整段歷史 (naaim 還會去下載 ^GSPC)
+- 值由 data_pipeline.latest 計算 (不依賴 streamlit)，前端即時計算時用的是同一套算法
+- 每筆記錄它讀的資料檔 (latest.FILES) 當時的內容雜湊當作版本：檔案之後又被改過 (就算大小一樣)，前端就視為過期、退回即時計算
+- 資料檔還不存在的指標不寫進索引；有指標計算失敗或整份索引是空的，這一步算失敗 (空索引不會蓋掉舊檔)
+"""
+import os
+import json
+import datetime as dt
+import pandas as pd
+from data_pipeline import metrics
+from data_pipeline import latest
+from data_pipeline import digest
+
+DATA_DIR = "data"
+SUMMARY_FILE = os.path.join(DATA_DIR, "summary.json")
+SCHEMA = 3  # 2: versions 改成內容雜湊；3: 利差類指標改記 change_bp
+
+
+def entry_key(category, module_name, ticker):
+    return f"{category}.{module_name}.{ticker}"
+
+
+def file_versions(files, sha256=digest.sha256):
+    """{檔名: 內容雜湊}；任何一個檔案不存在就回傳 None (前端傳入有快取的 sha256，檔案沒變就不重算)"""
+    versions = {}
+    for name in files:
+        path = os.path.join(DATA_DIR, name)
+        if not os.path.exists(path):
+            return None
+        versions[name] = sha256(path)
+    return versions
+
+
+def history_as_of(history):
+    if history is None or len(history) == 0:
+        return None
+    for col in ("date", "Date"):
+        if col in history.columns:
+            return pd.Timestamp(history[col].max()).strftime("%Y-%m-%d")
+    return None
+
+
+def _summarize(category, item):
+    files = latest.FILES.get((category, item["module"]))
+    if not files:
+        return None  # 即時抓網路的引擎沒有檔案可以對版本
+    versions = file_versions(files)
+    if versions is None:
+        return None
+    row = latest.compute(category, item["module"], item["ticker"])
+    if row is None:
+        return None
+    entry = {"value": float(row["value"]), "change_pct": float(row["change_pct"]), "as_of": row.get("as_of"), "versions": versions}
+    if "change_bp" in row:
+        entry["change_bp"] = float(row["change_bp"])
+    return entry
+
+
+def build(indicators):
+    """逐一計算 config.INDICATORS 的最新值，回傳 (索引, 失敗的指標清單)；單一指標失敗不影響其他指標"""
+    entries, failed = {}, []
+    for category, cat in indicators.items():
+        for item in cat.get("items", []):
+            if not item.get("module"): continue
+            key = entry_key(category, item["module"], item["ticker"])
+            try:
+                entry = _summarize(category, item)
+            except Exception as e:
+                print(f"      ⚠️ [Summary] {key} 計算失敗，略過: {e}")
+                failed.append(key)
+                continue
+            if entry is not None:
+                entries[key] = entry
+    return {"schema": SCHEMA, "generated_at": dt.datetime.now().isoformat(timespec="seconds"), "entries": entries}, failed
+
+
+def update():
+    print("   ↳ 🗂️ [Summary] 正在整理指標最新值索引...")
+    import config  # 前端的指標清單 (repo 根目錄，純設定檔)
+    with metrics.stage("summary") as s:
+        summary, failed = build(config.INDICATORS)
+        if not summary["entries"]:
+            raise RuntimeError("沒有任何指標算得出最新值，保留舊的索引")
+        if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
+        tmp_path = SUMMARY_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, SUMMARY_FILE)
+        s.rows_out = len(summary["entries"])
+        s.wrote(SUMMARY_FILE)
+        if failed:
+            raise RuntimeError(f"{len(failed)} 個指標計算失敗 (前端會即時計算): {failed}")
+    print(f"   ✅ [Summary] {len(summary['entries'])} 個指標 -> {SUMMARY_FILE}")
@@ -0,0 +1,39 @@
+"""
+tests/test_latest.py
+殖利率曲線表達式：解析出的天期權重、矩陣相乘、利差類指標用基點表示變動
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from data_pipeline import latest
+
+
+@pytest.mark.parametrize("expr, combo", [
+    ("10Y", {"10Y": 1.0}),
+    ("10y - 3m", {"10Y": 1.0, "3M": -1.0}),
+    ("2s10s", {"2Y": -1.0, "10Y": 1.0}),
+    ("2s10s30s", {"2Y": -1.0, "10Y": 2.0, "30Y": -1.0}),
+])
+def test_parse_expression_weights(expr, combo):
+    assert latest.parse_expression(expr) == combo
+
+
+@pytest.mark.parametrize("expr", ["", "10Y-2Y-3M", "2s5s10s30s", "abc", "10Q"])
+def test_parse_expression_rejects_garbage(expr):
+    assert latest.parse_expression(expr) is None
+
+
+def test_curve_values_and_bp_change():
+    curve = {"dates": pd.DatetimeIndex(["2024-01-02", "2024-01-03", "2024-01-04"]),
+             "tenors": ["3M", "2Y", "10Y", "30Y"],
+             "values": np.array([[5.0, 4.0, 4.01, 4.2],
+                                 [5.0, 4.1, np.nan, 4.3],
+                                 [4.0, 4.2, 4.50, 4.4]], dtype="float32")}
+    values = latest.curve_values(curve, latest.parse_expression("10Y-2Y"))
+    np.testing.assert_allclose(values, [0.01, np.nan, 0.30], atol=1e-5)
+    assert latest.curve_values(curve, {"5Y": 1.0}) is None
+
+    row = latest.curve_latest(curve["dates"], values)
+    assert row["as_of"] == "2024-01-04"
+    assert row["change_pct"] == 0.0  # 穿越 0 的序列不算百分比
+    assert row["change_bp"] == pytest.approx(29.0, abs=1e-2)
@@ -0,0 +1,53 @@
+"""
+tests/test_prices.py
+股價倉庫的公司行動偵測：最後一根重疊 K 棒被修正 / 是盤中價時，不可以重新縮放歷史
+"""
+import numpy as np
+import pandas as pd
+from data_pipeline import prices
+
+
+def _frame(closes, start="2024-01-01", factor=1.0):
+    index = pd.bdate_range(start, periods=len(closes))
+    closes = np.asarray(closes, dtype="float32")
+    return pd.DataFrame({"open": closes, "high": closes, "low": closes, "close": closes,
+                         "factor": np.full(len(closes), factor, dtype="float32"),
+                         "volume": np.full(len(closes), 1000, dtype="float32")}, index=index)
+
+
+def test_revised_last_bar_is_not_a_corporate_action():
+    stored = _frame([100, 101, 102, 103, 104])
+    fresh = _frame([100, 101, 102, 103, 105, 106])  # 最後一根重疊 K 棒 104 -> 105 (盤中價 / 事後修正)
+    out = prices._reconcile(stored.copy(), fresh)
+    pd.testing.assert_frame_equal(out, stored)
+
+
+def test_split_rescales_history_when_overlap_agrees():
+    stored = _frame([100, 101, 102, 103, 104])
+    fresh = _frame([50, 50.5, 51, 51.5, 52, 53])  # 2:1 分割，整段重疊都是一半
+    out = prices._reconcile(stored.copy(), fresh)
+    np.testing.assert_allclose(out["close"], stored["close"] * 0.5, rtol=1e-6)
+    np.testing.assert_allclose(out["volume"], stored["volume"] * 2, rtol=1e-6)
+
+
+def test_dividend_rescales_factor_only():
+    stored = _frame([100, 101, 102, 103, 104], factor=1.0)
+    fresh = _frame([100, 101, 102, 103, 104, 105], factor=0.99)
+    out = prices._reconcile(stored.copy(), fresh)
+    np.testing.assert_allclose(out["factor"], 0.99, rtol=1e-6)
+    pd.testing.assert_series_equal(out["close"], stored["close"])
+
+
+def test_too_few_overlap_bars_keep_history():
+    stored = _frame([100, 101])
+    fresh = _frame([50, 50.5, 51])
+    out = prices._reconcile(stored.copy(), fresh)
+    pd.testing.assert_frame_equal(out, stored)
+
+
+def test_unsettled_session_is_dropped():
+    fresh = _frame([100, 101, 102], start="2024-01-03")  # 1/3 ~ 1/5
+    intraday = pd.Timestamp("2024-01-05 11:00", tz=prices.MARKET_TZ)
+    assert prices._settled(fresh, now=intraday).index.max() == pd.Timestamp("2024-01-04")
+    after_close = pd.Timestamp("2024-01-05 18:00", tz=prices.MARKET_TZ)
+    assert prices._settled(fresh, now=after_close).index.max() == pd.Timestamp("2024-01-05")
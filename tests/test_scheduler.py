@@ -0,0 +1,88 @@
+"""
+tests/test_scheduler.py
+DAG 排程器：相依順序、上游失敗時下游略過、逾時狀態、select 自動帶上游節點
+"""
+import threading
+import time
+import pytest
+from data_pipeline import scheduler
+from data_pipeline.scheduler import Task
+
+
+def _recorder():
+    order, lock = [], threading.Lock()
+
+    def step(name, seconds=0.0):
+        def func():
+            time.sleep(seconds)
+            with lock:
+                order.append(name)
+        return func
+    return order, step
+
+
+def test_dependencies_run_before_downstream():
+    order, step = _recorder()
+    tasks = [
+        Task("c", step("c"), deps=("a", "b")),
+        Task("a", step("a", 0.05)),
+        Task("b", step("b"), deps=("a",)),
+    ]
+    results = scheduler.run(tasks, max_workers=3)
+    assert order == ["a", "b", "c"]
+    assert {n: r["status"] for n, r in results.items()} == {"a": "ok", "b": "ok", "c": "ok"}
+
+
+def test_failure_skips_downstream_only():
+    order, step = _recorder()
+
+    def boom():
+        raise RuntimeError("壞掉了")
+
+    tasks = [
+        Task("a", boom),
+        Task("b", step("b"), deps=("a",)),
+        Task("c", step("c"), deps=("b",)),
+        Task("d", step("d")),
+    ]
+    results = scheduler.run(tasks, max_workers=2)
+    assert results["a"]["status"] == "failed" and "壞掉了" in results["a"]["error"]
+    assert results["b"]["status"] == "skipped"
+    assert results["c"]["status"] == "skipped"
+    assert results["d"]["status"] == "ok"
+    assert order == ["d"]
+
+
+def test_timeout_is_reported_and_skips_downstream():
+    order, step = _recorder()
+    tasks = [
+        Task("slow", step("slow", 2.0), timeout=0.2),
+        Task("after", step("after"), deps=("slow",)),
+        Task("other", step("other")),
+    ]
+    started = time.perf_counter()
+    results = scheduler.run(tasks, max_workers=2)
+    assert time.perf_counter() - started < 1.5  # 不等卡住的節點跑完
+    assert results["slow"]["status"] == "timeout"
+    assert results["after"]["status"] == "skipped"
+    assert results["other"]["status"] == "ok"
+
+
+def test_select_pulls_in_upstream_nodes():
+    noop = lambda: None
+    tasks = [
+        Task("market.prices", noop),
+        Task("market.breadth", noop, deps=("market.prices",)),
+        Task("market.naaim", noop, deps=("market.prices",)),
+        Task("rates.treasury", noop),
+    ]
+    assert [t.name for t in scheduler.select(tasks, ["market.breadth"])] == ["market.prices", "market.breadth"]
+    assert [t.name for t in scheduler.select(tasks, ["rates"])] == ["rates.treasury"]
+    with pytest.raises(ValueError):
+        scheduler.select(tasks, ["nope"])
+
+
+def test_cycles_are_rejected():
+    noop = lambda: None
+    with pytest.raises(ValueError):
+        scheduler.run([Task("a", noop, deps=("b",)), Task("b", noop, deps=("a",))])
@@ -0,0 +1,40 @@
+"""
+tests/test_surveys.py
+每週調查的增量合併：upsert 只認新增 / 被修正的日期，均線只從第一個變動日往後重算
+"""
+import numpy as np
+import pandas as pd
+from data_pipeline.market import surveys
+
+
+def _weekly(values, start="2024-01-04"):
+    return pd.DataFrame({"Date": pd.date_range(start, periods=len(values), freq="7D"),
+                         "NAAIM": np.asarray(values, dtype=float)})
+
+
+def test_upsert_overlap_reports_first_changed_date():
+    stored = _weekly([50, 55, 60, 65])
+    fresh = _weekly([60, 66, 70], start="2024-01-18")  # 1/18 一樣、1/25 被修正、2/1 新增
+    merged, since = surveys.upsert(stored, fresh, ["NAAIM"])
+    assert since == pd.Timestamp("2024-01-25")
+    assert merged["Date"].is_monotonic_increasing and merged["Date"].is_unique
+    assert merged["NAAIM"].tolist() == [50, 55, 60, 66, 70]
+
+
+def test_upsert_identical_overlap_is_a_no_op():
+    stored = _weekly([50, 55, 60])
+    merged, since = surveys.upsert(stored, stored.iloc[1:].copy(), ["NAAIM"])
+    assert since is None
+    assert merged is stored
+
+
+def test_ma_tail_matches_full_rolling():
+    df = _weekly(np.arange(30) * 1.5 + 40)
+    df["NAAIM_MA20"] = df["NAAIM"].rolling(20).mean()
+    fresh = _weekly([99.0, 101.0], start=str(df["Date"].iloc[-1] + pd.Timedelta(days=7))[:10])
+    fresh = pd.concat([_weekly([12.0], start=str(df["Date"].iloc[25])[:10]), fresh], ignore_index=True)
+
+    merged, since = surveys.upsert(df, fresh, ["NAAIM"])
+    out = surveys.update_ma_tail(merged, "NAAIM", "NAAIM_MA20", since)
+    expected = out["NAAIM"].rolling(20).mean()
+    np.testing.assert_allclose(out["NAAIM_MA20"], expected, equal_nan=True)
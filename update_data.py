@@ -1,30 +1,99 @@
 """
 update_data.py - 數據更新總指揮
+各部門把自己的模組宣告成 DAG 節點，排程器把互不相依的節點同時跑。
+
+用法：
+    python update_data.py                         # 全部更新
+    python update_data.py market.naaim            # 只跑 NAAIM (自動帶上游的 market.prices)
+    python update_data.py rates market.breadth    # 多個部門 / 模組
+    python update_data.py --dry-run               # 只印執行計畫
+    python update_data.py --offline market        # 不連網：重播 net 快取 + 股價倉庫
+    python update_data.py --since 2024-01-01 ...  # 抓取起點下限 (除錯用)
+    python update_data.py --provider synthetic    # 本機模擬資料 (壓力測試用，要在 repo 以外的暫存目錄執行)
 """
+import argparse
+import os
+import time
+import sys
 import data_pipeline.rates as rates_dept
 import data_pipeline.market as market_dept
+from data_pipeline import scheduler
+from data_pipeline import metrics
+from data_pipeline import runtime
+from data_pipeline import providers
+from data_pipeline import summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="BamHI 數據流水線")
+    parser.add_argument("targets", nargs="*", help="要跑的部門或模組 (例如 rates、market.breadth)，不給就全部跑")
+    parser.add_argument("--since", help="抓取起點下限 YYYY-MM-DD (全量重建時輸出也只會有這段，除錯用)")
+    parser.add_argument("--dry-run", action="store_true", help="只印出執行計畫，不實際執行")
+    parser.add_argument("--offline", action="store_true", help="離線模式：只用已快取的網頁回應與股價倉庫")
+    parser.add_argument("--provider", choices=providers.NAMES,
+                        help=f"外部資料來源 (預設讀環境變數 {providers.PROVIDER_ENV}，沒設就是 live)")
+    parser.add_argument("--workers", type=int, default=scheduler.MAX_WORKERS, help="同時執行的節點數上限")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    runtime.configure(offline=args.offline, since=args.since)
+    provider = providers.use(args.provider) if args.provider else providers.current()
+    if provider.remote is False and not args.dry_run and os.path.samefile(os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+        # 模擬資料會寫進 ./data，不能蓋掉 repo 裡真正的資料
+        print("❌ 模擬資料模式請在 repo 以外的暫存目錄執行 (輸出寫到目前目錄的 data/)")
+        raise SystemExit(2)
 
-def main():
     print("==========================================")
     print("🚀 BamHI 數據流水線 (Data Pipeline) 啟動")
+    if runtime.OFFLINE: print("   📴 離線模式：不連網，重播快取")
+    if provider.remote is False: print(f"   🧪 資料來源：{provider.name} (本機模擬資料)")
+    if runtime.SINCE: print(f"   ⏱️ 抓取起點下限：{runtime.SINCE}")
     print("==========================================")
 
-    # 1. 叫利率部門做事
+    # 利率部門 + 市場部門一起排程，單一節點出錯不會拖垮其他節點
     try:
-        rates_dept.update()
-    except Exception as e:
-        print(f"❌ 利率部門回報錯誤: {e}")
+        tasks = scheduler.select(rates_dept.tasks() + market_dept.tasks(), args.targets)
+    except ValueError as e:
+        print(f"❌ {e}")
+        raise SystemExit(2)
 
-    print("-" * 30)
+    runtime.select([t.name for t in tasks] if args.targets else None)
 
-    # 2. 叫市場部門做事
+    if args.dry_run:
+        scheduler.print_plan(tasks, args.workers)
+        return
+
+    results = scheduler.run(tasks, max_workers=args.workers)
+
+    # 清單頁用的最新值索引 (只讀剛寫好的檔案，很快；某個節點失敗也照樣重建其餘指標)
+    started = time.perf_counter()
     try:
-        market_dept.update()
+        summary.update()
+        results["summary"] = {"status": "ok", "seconds": time.perf_counter() - started, "error": ""}
     except Exception as e:
-        print(f"❌ 市場部門回報錯誤: {e}")
+        print(f"   ⚠️ [Summary] 索引沒有完整更新，前端會退回即時計算: {e}")
+        results["summary"] = {"status": "failed", "seconds": time.perf_counter() - started, "error": str(e)}
 
     print("==========================================")
-    print("✅ 所有任務執行完畢！")
+    scheduler.print_summary(results)
+    report = metrics.write_reports(results)
+    print(f"📏 執行報告: {metrics.RUN_REPORT_PATH} (總耗時 {report['wall_s']:.1f}s，對外請求 {sum(report['requests'].values())} 次)")
+    bad = [name for name, r in results.items() if r["status"] != "ok"]
+    if bad:
+        # 結束碼 1：GitHub Action 標成失敗，不會把不完整的輸出 commit 回去
+        print(f"❌ {len(bad)} 個任務沒有成功: {bad}")
+    else:
+        print("✅ 所有任務執行完畢！")
+
+    if any(r["status"] == "timeout" for r in results.values()):
+        # 逾時的節點還卡在 daemon 執行緒裡 (套件內部也可能開了非 daemon 執行緒)，報告已寫完，直接結束行程
+        # (寫檔都是暫存檔 + os.replace，被放棄的執行緒不會留下寫一半的檔案)
+        print("⏱️ 有節點逾時，不等待卡住的執行緒，直接結束")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(1)
+    if bad:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()